@@ -11,16 +11,29 @@ https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
 import os
+from importlib.util import find_spec
 from pathlib import Path
 from decouple import config
-from dotenv import load_dotenv
-load_dotenv() 
-
-BASIC_API_KEY = os.getenv("BASIC_API_KEY")
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
+# Only pay for python-dotenv when there is actually a .env file to load
+if (BASE_DIR / '.env').is_file():
+    from dotenv import load_dotenv
+    load_dotenv(BASE_DIR / '.env')
+
+BASIC_API_KEY = os.getenv("BASIC_API_KEY")
+
+# Per-client API keys (common.APIKey): seconds a verified key stays cached in a
+# worker, how often workers check for revoked keys, and the default limits
+API_KEY_CACHE_TTL = config('API_KEY_CACHE_TTL', default=300, cast=int)
+API_KEY_REVOCATION_POLL = config('API_KEY_REVOCATION_POLL', default=2, cast=float)
+API_KEY_DEFAULT_RATE = config('API_KEY_DEFAULT_RATE', default='1000/hour')
+API_KEY_DEFAULT_DAILY_QUOTA = config('API_KEY_DEFAULT_DAILY_QUOTA', default=0, cast=int)  # 0 = unlimited
+# Rate for the shared BASIC_API_KEY, counted across all its callers; empty = unthrottled
+API_KEY_LEGACY_RATE = config('API_KEY_LEGACY_RATE', default='')
+
 
 # Quick-start development settings - unsuitable for production
 # See https://docs.djangoproject.com/en/5.2/howto/deployment/checklist/
@@ -63,6 +76,8 @@ CORS_ALLOW_HEADERS = [
     'origin',
     'user-agent',
     'x-requested-with',
+    'idempotency-key',
+    'last-event-id',
 ]
 CORS_ALLOW_METHODS = [
     'GET',
@@ -87,12 +102,18 @@ INSTALLED_APPS = [
     'django.contrib.messages',
     'django.contrib.staticfiles',
     'rest_framework',
-    'drf_spectacular',
     'common',
 ]
 
+# OpenAPI schema and Swagger/Redoc pages (drf-spectacular)
+API_DOCS_ENABLED = config('API_DOCS_ENABLED', default=True, cast=bool)
+if API_DOCS_ENABLED:
+    INSTALLED_APPS += ['drf_spectacular']
+
 MIDDLEWARE = [
     'corsheaders.middleware.CorsMiddleware',
+    'common.admission.AdmissionControlMiddleware',  # Before anything costly, after CORS headers
+    'common.instrumentation.QueryBudgetMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',  # Static file serving
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -103,8 +124,8 @@ MIDDLEWARE = [
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
-# Django Debug Toolbar (development only)
-if DEBUG:
+# Django Debug Toolbar (development only, when installed)
+if DEBUG and find_spec('debug_toolbar') is not None:
     INSTALLED_APPS += ['debug_toolbar']
     MIDDLEWARE += ['debug_toolbar.middleware.DebugToolbarMiddleware']
     INTERNAL_IPS = ['127.0.0.1', 'localhost']
@@ -136,6 +157,8 @@ REST_FRAMEWORK = {
     ],
     'DEFAULT_THROTTLE_CLASSES': [
         'rest_framework.throttling.AnonRateThrottle',
+        'common.throttling.APIKeyRateThrottle',
+        'common.throttling.APIKeyQuotaThrottle',
     ],
     'DEFAULT_THROTTLE_RATES': {
         'anon': '100/hour',
@@ -146,8 +169,15 @@ REST_FRAMEWORK = {
     'DEFAULT_VERSIONING_CLASS': 'rest_framework.versioning.URLPathVersioning',
     'DEFAULT_VERSION': 'v1',
     'ALLOWED_VERSIONS': ['v1'],
-    'DEFAULT_SCHEMA_CLASS': 'drf_spectacular.openapi.AutoSchema',
 }
+if API_DOCS_ENABLED:
+    REST_FRAMEWORK['DEFAULT_SCHEMA_CLASS'] = 'drf_spectacular.openapi.AutoSchema'
+
+# Precomputed schema: serve the files written by `manage.py build_schema`
+# instead of generating the schema on each request
+API_SCHEMA_STATIC = config('API_SCHEMA_STATIC', default=not DEBUG, cast=bool)
+API_SCHEMA_ROOT = BASE_DIR / 'schema'
+API_SCHEMA_CACHE_MAX_AGE = config('API_SCHEMA_CACHE_MAX_AGE', default=86400, cast=int)
 
 # API Documentation Settings (drf-spectacular)
 SPECTACULAR_SETTINGS = {
@@ -186,6 +216,54 @@ DATABASES = {
         }
     }
 }
+
+# Query budgets (common/instrumentation.py): share of requests whose queries are
+# counted, whether exceeding a budget raises (set in tests/CI) or only logs, and
+# how often one SQL fingerprint may repeat in a request before it is logged as N+1
+QUERY_INSTRUMENTATION_SAMPLE_RATE = config('QUERY_INSTRUMENTATION_SAMPLE_RATE', default=1.0 if DEBUG else 0.0, cast=float)
+QUERY_BUDGET_RAISE = config('QUERY_BUDGET_RAISE', default=False, cast=bool)
+QUERY_N_PLUS_ONE_THRESHOLD = config('QUERY_N_PLUS_ONE_THRESHOLD', default=5, cast=int)
+# Budgets for views that cannot declare a query_budget attribute, by URL name
+QUERY_BUDGETS = {
+    'admin:common_lead_changelist': 8,
+    'admin:common_client_changelist': 8,
+    'admin:common_newsletter_changelist': 8,
+    'admin:common_campaign_changelist': 8,
+    'admin:common_apikey_changelist': 8,
+}
+
+# Slow query log (common/instrumentation.py): queries slower than SLOW_QUERY_MS
+# (0 disables) are aggregated per fingerprint, with at most
+# SLOW_QUERY_MAX_FINGERPRINTS fingerprints and SLOW_QUERY_SAMPLES durations each
+# per worker; workers publish to the cache every SLOW_QUERY_PUBLISH_INTERVAL seconds
+SLOW_QUERY_MS = config('SLOW_QUERY_MS', default=200, cast=float)
+SLOW_QUERY_MAX_FINGERPRINTS = config('SLOW_QUERY_MAX_FINGERPRINTS', default=500, cast=int)
+SLOW_QUERY_SAMPLES = config('SLOW_QUERY_SAMPLES', default=200, cast=int)
+SLOW_QUERY_EXPLAIN = config('SLOW_QUERY_EXPLAIN', default=True, cast=bool)
+SLOW_QUERY_PUBLISH_INTERVAL = config('SLOW_QUERY_PUBLISH_INTERVAL', default=30, cast=int)
+
+# Shared cache for throttle counters and idempotency records; without Redis
+# each worker process gets its own in-memory cache
+REDIS_URL = config('REDIS_URL', default='')
+if REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+            'KEY_PREFIX': 'exit3',
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
+# Idempotency-Key on POST /leads/ and /newsletter/: how long responses are
+# replayed and how long a key stays locked by its first request
+IDEMPOTENCY_TTL = config('IDEMPOTENCY_TTL', default=86400, cast=int)
+IDEMPOTENCY_LOCK_TIMEOUT = config('IDEMPOTENCY_LOCK_TIMEOUT', default=30, cast=int)
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
@@ -230,6 +308,23 @@ STATICFILES_STORAGE = 'whitenoise.storage.CompressedManifestStaticFilesStorage'
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# Email (SMTP), also used by mail_admins and newsletter campaigns
+EMAIL_BACKEND = config('EMAIL_BACKEND', default='django.core.mail.backends.smtp.EmailBackend')
+EMAIL_HOST = config('EMAIL_HOST', default='localhost')
+EMAIL_PORT = config('EMAIL_PORT', default=25, cast=int)
+EMAIL_USE_TLS = config('EMAIL_USE_TLS', default=False, cast=bool)
+EMAIL_USE_SSL = config('EMAIL_USE_SSL', default=False, cast=bool)
+EMAIL_HOST_USER = config('EMAIL_HOST_USER', default='')
+EMAIL_HOST_PASSWORD = config('EMAIL_HOST_PASSWORD', default='')
+EMAIL_TIMEOUT = config('EMAIL_TIMEOUT', default=30, cast=int)
+DEFAULT_FROM_EMAIL = config('DEFAULT_FROM_EMAIL', default='noreply@exit3.agency')
+SERVER_EMAIL = config('SERVER_EMAIL', default='admin@exit3.agency')
+
+# Newsletter campaigns (manage.py send_campaign)
+NEWSLETTER_SEND_CONCURRENCY = config('NEWSLETTER_SEND_CONCURRENCY', default=4, cast=int)  # SMTP connections
+NEWSLETTER_SEND_RATE = config('NEWSLETTER_SEND_RATE', default=10.0, cast=float)  # messages/second, 0 = unlimited
+NEWSLETTER_MAX_ATTEMPTS = config('NEWSLETTER_MAX_ATTEMPTS', default=3, cast=int)
+
 # Security Headers
 SECURE_BROWSER_XSS_FILTER = True
 SECURE_CONTENT_TYPE_NOSNIFF = True
@@ -245,7 +340,18 @@ if not DEBUG:
     SECURE_HSTS_PRELOAD = True
 
 # Logging Configuration
-os.makedirs(BASE_DIR / 'logs', exist_ok=True)
+LOG_DIR = BASE_DIR / 'logs'
+if not LOG_DIR.is_dir():
+    LOG_DIR.mkdir(parents=True, exist_ok=True)
+
+# Queued logging: request threads only enqueue records, a listener thread per
+# worker writes them and sends admin mails (see common/log.py)
+LOGGING_CONFIG = 'common.log.configure'
+LOG_QUEUE = config('LOG_QUEUE', default=not DEBUG, cast=bool)
+LOG_QUEUE_SIZE = config('LOG_QUEUE_SIZE', default=10000, cast=int)
+LOG_FORMAT = config('LOG_FORMAT', default='verbose')  # 'verbose' or 'json'
+LOG_RATE_LIMIT_BURST = config('LOG_RATE_LIMIT_BURST', default=10, cast=int)
+ADMIN_EMAIL_INTERVAL = config('ADMIN_EMAIL_INTERVAL', default=600, cast=int)  # seconds between mails for one error
 
 LOGGING = {
     'version': 1,
@@ -259,6 +365,9 @@ LOGGING = {
             'format': '[{levelname}] {message}',
             'style': '{',
         },
+        'json': {
+            '()': 'common.log.JSONFormatter',
+        },
     },
     'filters': {
         'require_debug_false': {
@@ -267,24 +376,39 @@ LOGGING = {
         'require_debug_true': {
             '()': 'django.utils.log.RequireDebugTrue',
         },
+        # Identical warnings/errors: a burst per minute, then 1 in 100
+        'rate_limit': {
+            '()': 'common.log.RateLimitFilter',
+            'burst': LOG_RATE_LIMIT_BURST,
+            'period': 60,
+            'sample': 100,
+        },
+        # The 503s admission control answers while shedding; it logs a summary
+        'not_shed': {
+            '()': 'common.admission.ShedRequestFilter',
+        },
     },
     'handlers': {
         'console': {
             'level': 'INFO',
             'class': 'logging.StreamHandler',
-            'formatter': 'verbose',
+            'formatter': LOG_FORMAT,
+            'filters': ['rate_limit'],
         },
         'file': {
             'level': 'WARNING',
             'class': 'logging.handlers.RotatingFileHandler',
-            'filename': BASE_DIR / 'logs' / 'django.log',
+            'filename': LOG_DIR / 'django.log',
             'maxBytes': 1024 * 1024 * 10,  # 10 MB
             'backupCount': 5,
-            'formatter': 'verbose',
+            'delay': True,  # open the file on the first record, not at startup
+            'formatter': LOG_FORMAT,
+            'filters': ['rate_limit'],
         },
         'mail_admins': {
             'level': 'ERROR',
-            'class': 'django.utils.log.AdminEmailHandler',
+            '()': 'common.log.DeduplicatedAdminEmailHandler',
+            'interval': ADMIN_EMAIL_INTERVAL,
             'filters': ['require_debug_false'],
         },
     },
@@ -296,6 +420,7 @@ LOGGING = {
         },
         'django.request': {
             'handlers': ['console', 'file', 'mail_admins'],
+            'filters': ['not_shed'],
             'level': 'ERROR',
             'propagate': False,
         },
@@ -312,11 +437,12 @@ LOGGING = {
 }
 
 # Error Monitoring (Sentry)
-import sentry_sdk
-from sentry_sdk.integrations.django import DjangoIntegration
-
+# sentry_sdk is only imported when a DSN is configured
 SENTRY_DSN = config('SENTRY_DSN', default='')
 if SENTRY_DSN and not DEBUG:
+    import sentry_sdk
+    from sentry_sdk.integrations.django import DjangoIntegration
+
     sentry_sdk.init(
         dsn=SENTRY_DSN,
         integrations=[DjangoIntegration()],
@@ -325,6 +451,87 @@ if SENTRY_DSN and not DEBUG:
         environment=config('DJANGO_ENV', default='production'),
     )
 
+# Disposable-email blocklist for lead and newsletter emails (common/validation.py):
+# a file with one domain per line (plain or .gz) added to the built-in list,
+# subdomains included, and how often (seconds) each worker checks it for changes
+DISPOSABLE_DOMAINS_FILE = config('DISPOSABLE_DOMAINS_FILE', default='')
+VALIDATION_RELOAD_INTERVAL = config('VALIDATION_RELOAD_INTERVAL', default=30, cast=float)
+
+# Lead deduplication on create: 'off', 'flag' (set duplicate_of) or 'merge'
+LEAD_DEDUP_MODE = config('LEAD_DEDUP_MODE', default='flag')
+# Country calling code for phone numbers written with a national 0 prefix
+LEAD_DEDUP_COUNTRY_CODE = config('LEAD_DEDUP_COUNTRY_CODE', default='385')
+
+# Bulk lead updates (API and admin action): leads per UPDATE/transaction, and
+# the most ids one API request may list
+LEAD_BULK_UPDATE_BATCH_SIZE = config('LEAD_BULK_UPDATE_BATCH_SIZE', default=1000, cast=int)
+LEAD_BULK_UPDATE_MAX_IDS = config('LEAD_BULK_UPDATE_MAX_IDS', default=10000, cast=int)
+
+# Lead event stream (common/events.py): concurrent clients per process, events
+# buffered per client before it is dropped (it resumes with Last-Event-ID),
+# most events replayed on resume, heartbeat seconds, client reconnect delay and
+# the poll interval used instead of LISTEN/NOTIFY on databases other than PostgreSQL
+LEAD_STREAM_MAX_CLIENTS = config('LEAD_STREAM_MAX_CLIENTS', default=10000, cast=int)
+LEAD_STREAM_CLIENT_BUFFER = config('LEAD_STREAM_CLIENT_BUFFER', default=1000, cast=int)
+LEAD_STREAM_REPLAY_LIMIT = config('LEAD_STREAM_REPLAY_LIMIT', default=1000, cast=int)
+LEAD_STREAM_HEARTBEAT = config('LEAD_STREAM_HEARTBEAT', default=15, cast=float)
+LEAD_STREAM_RETRY_MS = config('LEAD_STREAM_RETRY_MS', default=3000, cast=int)
+LEAD_STREAM_POLL_INTERVAL = config('LEAD_STREAM_POLL_INTERVAL', default=2.0, cast=float)
+# How far (in event ids) below the newest one an event may still commit late
+LEAD_STREAM_REORDER_WINDOW = config('LEAD_STREAM_REORDER_WINDOW', default=1000, cast=int)
+# Lifetime of ?token= stream credentials for browsers' EventSource (seconds)
+LEAD_STREAM_TOKEN_MAX_AGE = config('LEAD_STREAM_TOKEN_MAX_AGE', default=3600, cast=int)
+
+# Data retention (manage.py purge_retention): days after which leads in
+# RETENTION_LEAD_STATUSES (by updated_at) and unsubscribed newsletter rows are
+# deleted, 0 disables a policy. Rows per batch/transaction, pause between
+# batches, and the replica lag (seconds) and load average per CPU above which
+# the purge waits (0 disables the check)
+RETENTION_LEAD_DAYS = config('RETENTION_LEAD_DAYS', default=0, cast=int)
+RETENTION_LEAD_STATUSES = config(
+    'RETENTION_LEAD_STATUSES',
+    default='closed,not_interested',
+    cast=lambda v: [s.strip() for s in v.split(',') if s.strip()]
+)
+RETENTION_NEWSLETTER_DAYS = config('RETENTION_NEWSLETTER_DAYS', default=0, cast=int)
+RETENTION_BATCH_SIZE = config('RETENTION_BATCH_SIZE', default=500, cast=int)
+RETENTION_BATCH_PAUSE = config('RETENTION_BATCH_PAUSE', default=0.1, cast=float)
+RETENTION_MAX_REPLICATION_LAG = config('RETENTION_MAX_REPLICATION_LAG', default=10, cast=float)
+RETENTION_MAX_LOAD = config('RETENTION_MAX_LOAD', default=0, cast=float)
+
+# Admission control (common/admission.py): queue time is measured from nginx's
+# X-Request-Start header. Requests under ADMISSION_LOW_PRIORITY_PATHS are shed
+# (503 + Retry-After seconds) once the queue time exceeds the budget (ms) or a
+# worker has ADMISSION_MAX_IN_FLIGHT requests (0 = no limit); other paths only
+# after ADMISSION_MAX_QUEUE_MS; ADMISSION_EXEMPT_PATHS never. POSTs to
+# ADMISSION_PRIORITY_WRITES (exact paths) are shed after the higher
+# ADMISSION_WRITE_QUEUE_BUDGET_MS
+ADMISSION_CONTROL = config('ADMISSION_CONTROL', default=True, cast=bool)
+ADMISSION_QUEUE_BUDGET_MS = config('ADMISSION_QUEUE_BUDGET_MS', default=500, cast=int)
+ADMISSION_MAX_QUEUE_MS = config('ADMISSION_MAX_QUEUE_MS', default=10000, cast=int)
+ADMISSION_WRITE_QUEUE_BUDGET_MS = config('ADMISSION_WRITE_QUEUE_BUDGET_MS', default=2000, cast=int)
+ADMISSION_MAX_IN_FLIGHT = config('ADMISSION_MAX_IN_FLIGHT', default=16, cast=int)
+ADMISSION_RETRY_AFTER = config('ADMISSION_RETRY_AFTER', default=2, cast=int)
+ADMISSION_LOW_PRIORITY_PATHS = config(
+    'ADMISSION_LOW_PRIORITY_PATHS',
+    default='/backend/api/',
+    cast=lambda v: [s.strip() for s in v.split(',') if s.strip()]
+)
+ADMISSION_EXEMPT_PATHS = config(
+    'ADMISSION_EXEMPT_PATHS',
+    default='/backend/health/,/backend/admin/',
+    cast=lambda v: [s.strip() for s in v.split(',') if s.strip()]
+)
+ADMISSION_PRIORITY_WRITES = config(
+    'ADMISSION_PRIORITY_WRITES',
+    default='/backend/api/v1/leads/,/backend/api/leads/,/backend/api/v1/newsletter/,/backend/api/newsletter/',
+    cast=lambda v: [s.strip() for s in v.split(',') if s.strip()]
+)
+
+# Startup budget
+# Cumulative import time (ms) of a Django boot, checked by: manage.py startup_profile
+STARTUP_IMPORT_BUDGET_MS = config('STARTUP_IMPORT_BUDGET_MS', default=800, cast=int)
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
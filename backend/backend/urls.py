@@ -1,14 +1,38 @@
 
 from django.contrib import admin
 from django.urls import path, include
-from common.views import LeadListCreateAPIView, NewsletterSubscriberListCreateView
+from common.views import (
+    LeadBulkUpdateAPIView,
+    LeadConvertAPIView,
+    LeadListCreateAPIView,
+    LeadStageDurationAPIView,
+    LeadStatusEventListAPIView,
+    LeadStreamTokenAPIView,
+    LeadTimelineAPIView,
+    NewsletterSubscriberListCreateView,
+    SlowQueryReportAPIView,
+    lead_event_stream,
+)
 from django.http import JsonResponse
 from django.db import connection
 from django.conf import settings
-from drf_spectacular.views import SpectacularAPIView, SpectacularSwaggerView, SpectacularRedocView
+from django.utils.module_loading import import_string
 import sys
 import django
 
+def lazy_view(dotted_path, **initkwargs):
+    """Import a class-based view on its first request instead of at URLconf load"""
+    view = None
+
+    def wrapper(request, *args, **kwargs):
+        nonlocal view
+        if view is None:
+            view = import_string(dotted_path).as_view(**initkwargs)
+        return view(request, *args, **kwargs)
+
+    wrapper.csrf_exempt = True
+    return wrapper
+
 def debug_view(request):
     return JsonResponse({'path': request.path})
 
@@ -33,24 +57,38 @@ urlpatterns = [
 
     # API v1 (versioned endpoints)
     path('backend/api/v1/leads/', LeadListCreateAPIView.as_view(), name='v1-leads-list-create'),
+    path('backend/api/v1/leads/bulk-update/', LeadBulkUpdateAPIView.as_view(), name='v1-leads-bulk-update'),
+    path('backend/api/v1/leads/convert/', LeadConvertAPIView.as_view(), name='v1-leads-convert'),
+    path('backend/api/v1/leads/stream/', lead_event_stream, name='v1-lead-stream'),
+    path('backend/api/v1/leads/stream-token/', LeadStreamTokenAPIView.as_view(), name='v1-lead-stream-token'),
+    path('backend/api/v1/leads/<int:pk>/timeline/', LeadTimelineAPIView.as_view(), name='v1-lead-timeline'),
+    path('backend/api/v1/leads/status-events/', LeadStatusEventListAPIView.as_view(), name='v1-lead-status-events'),
+    path('backend/api/v1/leads/stage-durations/', LeadStageDurationAPIView.as_view(), name='v1-lead-stage-durations'),
     path('backend/api/v1/newsletter/', NewsletterSubscriberListCreateView.as_view(), name='v1-newsletter-subscribers'),
+    path('backend/api/v1/slow-queries/', SlowQueryReportAPIView.as_view(), name='v1-slow-queries'),
 
     # Backward compatibility (unversioned endpoints - will be deprecated)
     path('backend/api/leads/', LeadListCreateAPIView.as_view(), name='leads-list-create'),
     path('backend/api/newsletter/', NewsletterSubscriberListCreateView.as_view(), name='newsletter-subscribers'),
 
-    # API Documentation (OpenAPI/Swagger)
-    path('backend/api/schema/', SpectacularAPIView.as_view(), name='schema'),
-    path('backend/api/docs/', SpectacularSwaggerView.as_view(url_name='schema'), name='swagger-ui'),
-    path('backend/api/redoc/', SpectacularRedocView.as_view(url_name='schema'), name='redoc'),
-
     # Health & Debug endpoints
     path('backend/health/', health_check, name='health-check'),
     path('backend/debug/', debug_view, name='debug-view')
 ]
 
+# API Documentation (OpenAPI/Swagger), drf_spectacular is imported on first use
+if settings.API_DOCS_ENABLED:
+    urlpatterns += [
+        path('backend/api/schema/', lazy_view(
+            'common.schema.StaticSchemaView' if settings.API_SCHEMA_STATIC
+            else 'drf_spectacular.views.SpectacularAPIView'
+        ), name='schema'),
+        path('backend/api/docs/', lazy_view('drf_spectacular.views.SpectacularSwaggerView', url_name='schema'), name='swagger-ui'),
+        path('backend/api/redoc/', lazy_view('drf_spectacular.views.SpectacularRedocView', url_name='schema'), name='redoc'),
+    ]
+
 # Django Debug Toolbar (development only)
-if settings.DEBUG:
+if 'debug_toolbar' in settings.INSTALLED_APPS:
     import debug_toolbar
     urlpatterns = [
         path('__debug__/', include(debug_toolbar.urls)),
@@ -0,0 +1,103 @@
+"""
+Application warm-up for preloaded Gunicorn masters.
+
+When ``preload_app`` is enabled Gunicorn imports the WSGI application in the
+master process before forking workers. ``warm_up()`` goes one step further and
+builds the read-only structures that every worker would otherwise build on its
+first requests (URL resolver, model meta caches, serializer field mappings,
+the disposable-email blocklist, translation catalogs and the OpenAPI schema),
+so forked workers share those pages copy-on-write instead of each holding a
+private copy.
+"""
+
+import time
+from typing import Callable, Dict
+
+
+def _warm_urls() -> None:
+    from django.urls import get_resolver
+
+    resolver = get_resolver()
+    # Accessing reverse_dict populates the resolver's lookup tables
+    resolver.reverse_dict
+    resolver.app_dict
+    resolver.namespace_dict
+
+
+def _warm_models() -> None:
+    from django.apps import apps
+
+    for model in apps.get_models():
+        model._meta.get_fields()
+
+
+def _warm_serializers() -> None:
+    from common.serializers import LeadSerializer, NewsletterSerializer
+
+    for serializer_class in (LeadSerializer, NewsletterSerializer):
+        serializer_class().fields
+
+
+def _warm_validation() -> None:
+    from common.validation import disposable_domains
+
+    disposable_domains()
+
+
+def _warm_translations() -> None:
+    from django.conf import settings
+    from django.utils import translation
+
+    translation.activate(settings.LANGUAGE_CODE)
+    translation.gettext('Enter a valid international phone number.')
+    translation.deactivate()
+
+
+def _warm_schema() -> None:
+    from django.conf import settings
+
+    if 'drf_spectacular' not in settings.INSTALLED_APPS:
+        return
+    # The docs views are imported lazily by the URLconf, load them here
+    import drf_spectacular.views  # noqa: F401
+
+    if settings.API_SCHEMA_STATIC:
+        from pathlib import Path
+        from common.schema import SCHEMA_FORMATS, load_document
+
+        for filename, _ in SCHEMA_FORMATS.values():
+            load_document(Path(settings.API_SCHEMA_ROOT) / filename)
+    else:
+        from drf_spectacular.generators import SchemaGenerator
+
+        SchemaGenerator().get_schema(request=None, public=True)
+
+
+WARMUP_STEPS: Dict[str, Callable[[], None]] = {
+    'urls': _warm_urls,
+    'models': _warm_models,
+    'serializers': _warm_serializers,
+    'validation': _warm_validation,
+    'translations': _warm_translations,
+    'schema': _warm_schema,
+}
+
+
+def warm_up() -> Dict[str, float]:
+    """
+    Run every warm-up step and return the time each one took, in milliseconds.
+
+    Database connections opened along the way are closed so that no socket is
+    shared between the master and its forked workers.
+    """
+    from django.db import connections
+
+    timings: Dict[str, float] = {}
+    try:
+        for name, step in WARMUP_STEPS.items():
+            started = time.perf_counter()
+            step()
+            timings[name] = (time.perf_counter() - started) * 1000
+    finally:
+        connections.close_all()
+    return timings
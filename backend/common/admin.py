@@ -1,6 +1,12 @@
+from django import forms
+from django.conf import settings
 from django.contrib import admin, messages
+from django.contrib.admin.helpers import ActionForm
 from django.utils.html import format_html
-from .models import Client, Lead, Newsletter
+from django.db.models import Count, Q
+from django.utils import timezone
+
+from .models import CATEGORY_CHOICES, APIKey, Campaign, CampaignDelivery, Client, Lead, LeadStatusEvent, Newsletter
 
 
 @admin.register(Client)
@@ -13,12 +19,39 @@ class ClientAdmin(admin.ModelAdmin):
         'category',
     )
     search_fields = (
-        'client_info',
+        'client_info__full_name',
+        'client_info__company_name',
         'team_id',
     )
     list_filter = ('category',)
     ordering = ('client_info',)
+    # client_info is rendered through Lead.__str__ on every row
+    list_select_related = ('client_info',)
+
+
 
+class LeadStatusEventInline(admin.TabularInline):
+    model = LeadStatusEvent
+    fields = ('at', 'from_status', 'to_status')
+    readonly_fields = fields
+    ordering = ('at',)
+    extra = 0
+    can_delete = False
+
+    def has_add_permission(self, request, obj=None) -> bool:
+        return False
+
+
+class LeadBulkUpdateForm(ActionForm):
+    """Extra fields next to the action dropdown, used by LeadAdmin.bulk_update and convert_to_clients"""
+    status = forms.ChoiceField(
+        choices=[('', 'Status: keep')] + Lead._meta.get_field('status').choices, required=False,
+    )
+    category = forms.ChoiceField(choices=[('', 'Category: keep')] + CATEGORY_CHOICES, required=False)
+    team_id = forms.CharField(
+        max_length=Client._meta.get_field('team_id').max_length, required=False,
+        widget=forms.TextInput(attrs={'placeholder': 'Team ID (convert)'}),
+    )
 
 
 @admin.register(Lead)
@@ -32,6 +65,7 @@ class LeadAdmin(admin.ModelAdmin):
         'source',
         'status',
         'category',
+        'score',
         'created_at',
     )
     search_fields = (
@@ -42,9 +76,110 @@ class LeadAdmin(admin.ModelAdmin):
     )
     list_filter = ('source', 'status', 'category')
     ordering = ('-created_at',)
+    raw_id_fields = ('duplicate_of',)
+    inlines = [LeadStatusEventInline]
+    action_form = LeadBulkUpdateForm
+    actions = ['bulk_update', 'convert_to_clients']
+
+    @admin.action(description="Set status/category of selected leads")
+    def bulk_update(self, request, queryset) -> None:
+        changes = {}
+        for field in ('status', 'category'):
+            value = request.POST.get(field)
+            if value:
+                try:
+                    changes[field] = LeadBulkUpdateForm.base_fields[field].clean(value)
+                except forms.ValidationError:
+                    self.message_user(request, f"Invalid {field}: {value}", messages.ERROR)
+                    return
+        if not changes:
+            self.message_user(request, "Choose a status or category to set", messages.WARNING)
+            return
+        matched, updated = queryset.update_in_batches(settings.LEAD_BULK_UPDATE_BATCH_SIZE, **changes)
+        self.message_user(
+            request, f"Updated {updated} of {matched} selected leads ({matched - updated} already set)",
+            messages.SUCCESS,
+        )
+
+    @admin.action(description="Convert selected leads to clients")
+    def convert_to_clients(self, request, queryset) -> None:
+        team_id = request.POST.get('team_id', '').strip()
+        if not team_id:
+            self.message_user(request, "Enter the team ID the new clients belong to", messages.WARNING)
+            return
+        result = queryset.convert_to_clients(team_id, settings.LEAD_BULK_UPDATE_BATCH_SIZE)
+        self.message_user(request, f"Converted {len(result.pop('converted'))} leads to clients", messages.SUCCESS)
+        conflicts = ', '.join(f"{len(ids)} {reason.replace('_', ' ')}" for reason, ids in result.items() if ids)
+        if conflicts:
+            self.message_user(request, f"Not converted: {conflicts}", messages.WARNING)
 
 @admin.register(Newsletter)
 class NewsletterSubscriberAdmin(admin.ModelAdmin):
-    list_display = ('email', 'is_subscribed')
+    list_display = ('email', 'is_subscribed', 'unsubscribed_at')
     search_fields = ('email',)
-    list_filter = ('is_subscribed',)
\ No newline at end of file
+    list_filter = ('is_subscribed',)
+
+
+class CampaignDeliveryInline(admin.TabularInline):
+    model = CampaignDelivery
+    fields = ('email', 'state', 'attempts', 'sent_at', 'error')
+    readonly_fields = fields
+    ordering = ('id',)
+    extra = 0
+    max_num = 0
+    can_delete = False
+    show_change_link = False
+
+    def get_queryset(self, request):
+        # Only show problems; a campaign can have thousands of sent rows
+        return super().get_queryset(request).exclude(state='sent')
+
+
+@admin.register(Campaign)
+class CampaignAdmin(admin.ModelAdmin):
+    list_display = ('subject', 'status', 'sent_count', 'failed_count', 'pending_count', 'created_at', 'finished_at')
+    list_filter = ('status',)
+    search_fields = ('subject',)
+    ordering = ('-created_at',)
+    readonly_fields = ('status', 'created_at', 'started_at', 'finished_at')
+    inlines = [CampaignDeliveryInline]
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).annotate(
+            sent_count=Count('deliveries', filter=Q(deliveries__state='sent')),
+            failed_count=Count('deliveries', filter=Q(deliveries__state='failed')),
+            pending_count=Count('deliveries', filter=Q(deliveries__state='pending')),
+        )
+
+    @admin.display(ordering='sent_count')
+    def sent_count(self, obj) -> int:
+        return obj.sent_count
+
+    @admin.display(ordering='failed_count')
+    def failed_count(self, obj) -> int:
+        return obj.failed_count
+
+    @admin.display(ordering='pending_count')
+    def pending_count(self, obj) -> int:
+        return obj.pending_count
+
+
+@admin.register(APIKey)
+class APIKeyAdmin(admin.ModelAdmin):
+    """Keys are created with `manage.py api_keys create`, which prints the key once"""
+    list_display = ('name', 'prefix', 'rate', 'daily_quota', 'created_at', 'revoked_at')
+    list_filter = (('revoked_at', admin.EmptyFieldListFilter),)
+    search_fields = ('name', 'prefix')
+    ordering = ('-created_at',)
+    readonly_fields = ('prefix', 'created_at', 'updated_at', 'revoked_at')
+    actions = ['revoke']
+
+    def has_add_permission(self, request) -> bool:
+        return False
+
+    @admin.action(description="Revoke selected API keys")
+    def revoke(self, request, queryset) -> None:
+        now = timezone.now()
+        # updated_at is what workers poll to drop cached keys
+        count = queryset.filter(revoked_at__isnull=True).update(revoked_at=now, updated_at=now)
+        self.message_user(request, f"Revoked {count} API keys", messages.SUCCESS)
@@ -0,0 +1,184 @@
+"""
+Admission control: shedding requests a worker cannot serve in time.
+
+nginx stamps every request it proxies with ``X-Request-Start: t=<epoch
+seconds>`` (see nginx/conf.d/exit3.conf and nginx.conf). By the time the
+middleware runs, the difference to now is how long the request queued, mostly
+in the listen backlog of a Gunicorn whose sync workers take one request at a
+time. Each worker also counts the requests it has in flight (more than one
+with gthread or ASGI workers).
+
+Requests fall in four classes by path:
+
+- exempt (ADMISSION_EXEMPT_PATHS, health checks and the admin): always admitted;
+- priority writes (POSTs to ADMISSION_PRIORITY_WRITES, the lead form and the
+  newsletter signup): shed only once they, or recent requests on average,
+  queued longer than ADMISSION_WRITE_QUEUE_BUDGET_MS, a higher budget, so a
+  spike of them cannot queue health checks indefinitely either;
+- low priority (ADMISSION_LOW_PRIORITY_PATHS): shed while the worker is
+  overloaded, i.e. the request or the smoothed queue time of recent requests
+  waited longer than ADMISSION_QUEUE_BUDGET_MS, or ADMISSION_MAX_IN_FLIGHT
+  requests are in flight;
+- everything else: shed only after waiting ADMISSION_MAX_QUEUE_MS, when the
+  client has most likely given up.
+
+A shed request costs a worker well under a millisecond instead of a full
+view, so a backlog drains quickly and admitted requests keep queueing for
+about the budget rather than until Gunicorn's timeout. Shed requests get a
+503 with ``Retry-After``. Without the header (no nginx in front) only the
+in-flight limit applies.
+"""
+
+import logging
+import random
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+from django.conf import settings
+from django.http import JsonResponse
+
+logger = logging.getLogger(__name__)
+
+# Weight of the newest request in the smoothed queue time
+SMOOTHING = 0.2
+# Stamps further off than this come from a broken clock or header, not a queue
+MAX_PLAUSIBLE_QUEUE = 3600.0
+# At most one shedding warning per worker this often (seconds)
+LOG_INTERVAL = 10.0
+
+
+def queue_time(header: str, now: Optional[float] = None) -> Optional[float]:
+    """
+    Seconds since ``X-Request-Start`` (``t=1697712345.123``, or epoch seconds,
+    milliseconds or microseconds); None when missing or implausible.
+    """
+    value = header.strip()
+    if value.startswith('t='):
+        value = value[2:]
+    try:
+        started = float(value)
+    except ValueError:
+        return None
+    if started > 1e14:
+        started /= 1e6
+    elif started > 1e11:
+        started /= 1e3
+    waited = (time.time() if now is None else now) - started
+    if waited > MAX_PLAUSIBLE_QUEUE or waited < -MAX_PLAUSIBLE_QUEUE:
+        return None
+    # nginx and the workers can disagree by a few milliseconds
+    return max(waited, 0.0)
+
+
+class AdmissionController:
+    """One worker's queue time and in-flight requests, and what they admit."""
+
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+        self.in_flight = 0
+        self.smoothed = 0.0
+        self.logged_at = -LOG_INTERVAL
+        self.shed_logged = 0
+        self.counts: Dict[str, int] = {'admitted': 0, 'shed': 0}
+
+    def priority(self, method: str, path: str) -> str:
+        if path.startswith(tuple(settings.ADMISSION_EXEMPT_PATHS)):
+            return 'exempt'
+        if method == 'POST' and path in settings.ADMISSION_PRIORITY_WRITES:
+            return 'write'
+        if path.startswith(tuple(settings.ADMISSION_LOW_PRIORITY_PATHS)):
+            return 'low'
+        return 'normal'
+
+    def admit(self, priority: str, waited: Optional[float]) -> Tuple[bool, str]:
+        """Whether to serve a request of ``priority`` that queued ``waited`` seconds, and why not."""
+        budget = settings.ADMISSION_QUEUE_BUDGET_MS / 1000
+        with self.lock:
+            if waited is not None:
+                self.smoothed += SMOOTHING * (waited - self.smoothed)
+            if priority == 'exempt':
+                reason = ''
+            elif waited is not None and waited > settings.ADMISSION_MAX_QUEUE_MS / 1000:
+                reason = f'queued {waited * 1000:.0f}ms'
+            elif priority == 'write':
+                write_budget = settings.ADMISSION_WRITE_QUEUE_BUDGET_MS / 1000
+                if waited is not None and waited > write_budget:
+                    reason = f'queued {waited * 1000:.0f}ms'
+                elif self.smoothed > write_budget:
+                    reason = f'queue time {self.smoothed * 1000:.0f}ms'
+                else:
+                    reason = ''
+            elif priority != 'low':
+                reason = ''
+            elif waited is not None and waited > budget:
+                reason = f'queued {waited * 1000:.0f}ms'
+            elif self.smoothed > budget:
+                reason = f'queue time {self.smoothed * 1000:.0f}ms'
+            elif settings.ADMISSION_MAX_IN_FLIGHT and self.in_flight >= settings.ADMISSION_MAX_IN_FLIGHT:
+                reason = f'{self.in_flight} requests in flight'
+            else:
+                reason = ''
+            if reason:
+                self.counts['shed'] += 1
+            else:
+                self.counts['admitted'] += 1
+                self.in_flight += 1
+            now = time.monotonic()
+            log = bool(reason) and now - self.logged_at >= LOG_INTERVAL
+            if log:
+                shed, self.shed_logged = self.counts['shed'] - self.shed_logged, self.counts['shed']
+                self.logged_at = now
+        if log:
+            logger.warning("Shedding load: %s (%d requests shed since the last warning)", reason, shed)
+        return not reason, reason
+
+    def done(self) -> None:
+        with self.lock:
+            self.in_flight -= 1
+
+
+admission = AdmissionController()
+
+
+class AdmissionControlMiddleware:
+    """
+    Answer 503 + Retry-After to requests this worker should not take on
+    (see the module docstring); placed early so shedding costs next to nothing.
+    """
+
+    def __init__(self, get_response) -> None:
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not settings.ADMISSION_CONTROL:
+            return self.get_response(request)
+        header = request.META.get('HTTP_X_REQUEST_START')
+        waited = queue_time(header) if header else None
+        admitted, reason = admission.admit(admission.priority(request.method, request.path_info), waited)
+        if not admitted:
+            # Read by ShedRequestFilter: not an error worth a log line (or an
+            # admin mail) each; admit() logs a summary
+            request.admission_shed = reason
+            return self.busy(reason)
+        try:
+            return self.get_response(request)
+        finally:
+            admission.done()
+
+    @staticmethod
+    def busy(reason: str) -> JsonResponse:
+        retry_after = settings.ADMISSION_RETRY_AFTER
+        response = JsonResponse({'detail': "Server is busy, please retry shortly."}, status=503)
+        # Jittered, so shed clients do not all come back in the same second
+        response['Retry-After'] = str(retry_after + random.randint(0, retry_after))
+        response['Cache-Control'] = 'no-store'
+        response['X-Shed-Reason'] = reason
+        return response
+
+
+class ShedRequestFilter(logging.Filter):
+    """Drop django.request's 503 records for requests the middleware shed."""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        return not getattr(getattr(record, 'request', None), 'admission_shed', None)
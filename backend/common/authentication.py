@@ -1,9 +1,96 @@
+import threading
+import time
+from typing import Dict, NamedTuple, Optional, Tuple
+
 from rest_framework.authentication import BaseAuthentication
 from django.conf import settings
+from django.core import signing
+from django.db.models import Count, Max
 from rest_framework.exceptions import AuthenticationFailed
 from django.utils.crypto import constant_time_compare
 
+from .models import APIKey
+
+
+class KeyInfo(NamedTuple):
+    """What a request needs to know about its API key; set as ``request.auth``"""
+    id: Optional[int]  # None for the legacy BASIC_API_KEY
+    name: str
+    rate: Optional[str]
+    daily_quota: Optional[int]
+
+
+LEGACY_KEY = KeyInfo(id=None, name='legacy', rate=None, daily_quota=None)
+
+
+class KeyCache:
+    """
+    Per-process cache of key hash -> KeyInfo (None for unknown or revoked keys).
+
+    Entries live for API_KEY_CACHE_TTL seconds, so verifying a known key costs
+    no query. Every API_KEY_REVOCATION_POLL seconds one request checks the
+    APIKey table's MAX(updated_at) and row count instead; when they moved
+    (a key was revoked, changed or deleted) the whole cache is dropped, which
+    bounds how long a revoked key keeps working on any worker.
+    """
+
+    max_entries = 10000
+
+    def __init__(self) -> None:
+        self.entries: Dict[str, Tuple[Optional[KeyInfo], float]] = {}
+        self.version: Optional[Tuple] = None
+        self.polled_at = 0.0
+        self.lock = threading.Lock()
+
+    def clear(self) -> None:
+        with self.lock:
+            self.entries.clear()
+            self.version = None
+            self.polled_at = 0.0
+
+    def poll(self, now: float) -> None:
+        if now - self.polled_at < settings.API_KEY_REVOCATION_POLL:
+            return
+        with self.lock:
+            if now - self.polled_at < settings.API_KEY_REVOCATION_POLL:
+                return
+            self.polled_at = now
+        state = APIKey.objects.aggregate(changed=Max('updated_at'), count=Count('id'))
+        version = (state['changed'], state['count'])
+        if version != self.version:
+            with self.lock:
+                self.entries.clear()
+                self.version = version
+
+    def get(self, key_hash: str) -> Optional[KeyInfo]:
+        now = time.monotonic()
+        self.poll(now)
+        cached = self.entries.get(key_hash)
+        if cached is not None and cached[1] > now:
+            return cached[0]
+
+        api_key = APIKey.objects.filter(key_hash=key_hash, revoked_at__isnull=True).first()
+        info = None if api_key is None else KeyInfo(
+            id=api_key.id, name=api_key.name, rate=api_key.rate, daily_quota=api_key.daily_quota,
+        )
+        with self.lock:
+            if len(self.entries) >= self.max_entries:
+                # Mostly bogus keys; dropping everything is cheaper than LRU bookkeeping
+                self.entries.clear()
+            self.entries[key_hash] = (info, now + settings.API_KEY_CACHE_TTL)
+        return info
+
+
+key_cache = KeyCache()
+
+
 class BasicAPIKeyAuthentication(BaseAuthentication):
+    """
+    ``Authorization: Basic <key>`` with a key from the APIKey table, or the
+    legacy BASIC_API_KEY. ``request.auth`` is the key's KeyInfo; the user stays
+    anonymous so the existing per-IP throttles keep applying.
+    """
+
     def authenticate(self, request):
         auth_header = request.headers.get('Authorization', '')
 
@@ -14,7 +101,44 @@ class BasicAPIKeyAuthentication(BaseAuthentication):
         expected_key = settings.BASIC_API_KEY or ''
 
         # Use constant_time_compare to prevent timing attacks
-        if not expected_key or not constant_time_compare(provided_key, expected_key):
+        if expected_key and constant_time_compare(provided_key, expected_key):
+            return (None, LEGACY_KEY)
+
+        # The lookup is by hash, so its timing reveals nothing about valid keys
+        info = key_cache.get(APIKey.hash_key(provided_key)) if provided_key else None
+        if info is None:
             raise AuthenticationFailed("Invalid or missing API Key")
 
-        return (None, None)
+        return (None, info)
+
+
+STREAM_TOKEN_SALT = 'common.authentication.stream-token'
+
+
+def sign_stream_token(key: str) -> str:
+    """A ``?token=`` standing in for ``key`` on the event stream, which EventSource cannot send headers to"""
+    return signing.dumps(APIKey.hash_key(key), salt=STREAM_TOKEN_SALT)
+
+
+class StreamTokenAuthentication(BaseAuthentication):
+    """
+    ``?token=`` from sign_stream_token(); valid for LEAD_STREAM_TOKEN_MAX_AGE
+    seconds and only while the key it was issued for is.
+    """
+
+    def authenticate(self, request):
+        token = request.GET.get('token')
+        if not token:
+            return None
+        try:
+            key_hash = signing.loads(token, salt=STREAM_TOKEN_SALT, max_age=settings.LEAD_STREAM_TOKEN_MAX_AGE)
+        except signing.BadSignature:
+            raise AuthenticationFailed("Invalid or expired stream token")
+
+        legacy_key = settings.BASIC_API_KEY or ''
+        if legacy_key and constant_time_compare(key_hash, APIKey.hash_key(legacy_key)):
+            return (None, LEGACY_KEY)
+        info = key_cache.get(key_hash)
+        if info is None:
+            raise AuthenticationFailed("Invalid or expired stream token")
+        return (None, info)
@@ -0,0 +1,437 @@
+"""
+Parallel logical backup and restore of the CRM tables (PostgreSQL only).
+
+Export splits each table into chunks of about ``chunk_rows`` rows by primary
+key and has ``jobs`` connections COPY them out at once, each chunk to its own
+gzip file (level 1 by default: most of the size win for little CPU). All
+connections read one exported snapshot, like ``pg_dump --jobs``, so the
+tables are consistent with each other. ``manifest.json`` records the chunk
+plan and every finished chunk; an interrupted export started again on the
+same directory only does the missing chunks (from a new snapshot, which the
+manifest notes).
+
+Restore with ``truncate`` empties exactly the exported tables, plus tables
+referencing them only if those are empty already: rows the export does not
+contain are never deleted, the restore fails instead. It drops the foreign
+keys, unique constraints and secondary indexes of the target tables, and
+disables their user triggers, in one transaction. It then COPYs the chunks in
+parallel, rebuilds the indexes in parallel and the constraints, resets the
+sequences and runs ANALYZE. Each chunk replaces its key range in one
+transaction and is checkpointed in ``restore-state.json``, with the dropped
+definitions, so an interrupted restore resumes too.
+"""
+
+import gzip
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from django.apps import apps
+from django.core.management.color import no_style
+from django.db import connections
+
+MANIFEST = 'manifest.json'
+RESTORE_STATE = 'restore-state.json'
+# Model names in dependency order; restore recreates constraints in this order too.
+# Status history and campaign deliveries reference the CRM tables, so they are
+# exported with them; a restore could not replace those tables otherwise
+DEFAULT_MODELS = ('lead', 'client', 'newsletter', 'leadstatusevent', 'campaign', 'campaigndelivery')
+OPTIONAL_MODELS: Tuple[str, ...] = ()
+
+
+class BackupError(Exception):
+    pass
+
+
+class Checkpoint:
+    """A JSON document on disk, replaced atomically on every save."""
+
+    def __init__(self, path: str, data: Optional[Dict[str, Any]] = None) -> None:
+        self.path = path
+        self.data = data if data is not None else {}
+        self.lock = threading.Lock()
+
+    @classmethod
+    def load(cls, path: str) -> Optional['Checkpoint']:
+        if not os.path.exists(path):
+            return None
+        with open(path) as file:
+            return cls(path, json.load(file))
+
+    def save(self) -> None:
+        with self.lock:
+            tmp = f'{self.path}.tmp'
+            with open(tmp, 'w') as file:
+                json.dump(self.data, file, indent=1)
+                file.flush()
+                os.fsync(file.fileno())
+            os.replace(tmp, self.path)
+
+    def update(self, change: Callable[[Dict[str, Any]], None]) -> None:
+        with self.lock:
+            change(self.data)
+        self.save()
+
+
+def get_model(name: str):
+    if name not in DEFAULT_MODELS + OPTIONAL_MODELS:
+        raise BackupError(f"Unknown table {name}, choose from {', '.join(DEFAULT_MODELS + OPTIONAL_MODELS)}")
+    return apps.get_model('common', name)
+
+
+def raw_connection(alias: str = 'default'):
+    """A new psycopg2 connection outside Django's per-thread connection handling."""
+    connection = connections[alias]
+    if connection.vendor != 'postgresql':
+        raise BackupError("Backups use COPY and need PostgreSQL")
+    return connection.get_new_connection(connection.get_connection_params())
+
+
+def quote(name: str) -> str:
+    return connections['default'].ops.quote_name(name)
+
+
+def range_condition(pk: str, low: Optional[int], high: Optional[int]) -> str:
+    parts = []
+    if low is not None:
+        parts.append(f'{quote(pk)} >= {int(low)}')
+    if high is not None:
+        parts.append(f'{quote(pk)} < {int(high)}')
+    return ' AND '.join(parts) or 'TRUE'
+
+
+def plan_chunks(cursor, table: str, pk: str, chunk_rows: int) -> List[Tuple[Optional[int], Optional[int]]]:
+    """Key ranges of about chunk_rows rows each; the first and last are open-ended."""
+    cursor.execute(
+        f'SELECT {quote(pk)} FROM (SELECT {quote(pk)}, row_number() OVER (ORDER BY {quote(pk)}) AS n '
+        f'FROM {quote(table)}) numbered WHERE n %% %s = 1 ORDER BY 1',
+        [chunk_rows],
+    )
+    starts: List[Optional[int]] = [row[0] for row in cursor.fetchall()][1:]
+    bounds = [None, *starts, None]
+    return list(zip(bounds[:-1], bounds[1:]))
+
+
+def export(directory: str, model_names: List[str], jobs: int, chunk_rows: int, compress_level: int,
+           log: Callable[[str], None]) -> Dict[str, Any]:
+    coordinator = raw_connection()
+    os.makedirs(directory, exist_ok=True)
+    manifest = Checkpoint.load(os.path.join(directory, MANIFEST))
+    try:
+        coordinator.set_session(isolation_level='REPEATABLE READ', readonly=True)
+        with coordinator.cursor() as cursor:
+            cursor.execute('SELECT pg_export_snapshot()')
+            snapshot = cursor.fetchone()[0]
+            if manifest is None:
+                manifest = Checkpoint(os.path.join(directory, MANIFEST), {
+                    'format': 1, 'created_at': time.time(), 'compress_level': compress_level,
+                    'snapshots': [], 'complete': False, 'tables': [],
+                })
+                for name in model_names:
+                    model = get_model(name)
+                    table, pk = model._meta.db_table, model._meta.pk.column
+                    manifest.data['tables'].append({
+                        'model': name, 'table': table, 'pk': pk,
+                        'columns': [field.column for field in model._meta.concrete_fields],
+                        'chunks': [
+                            {'file': f'{table}/{index:05d}.copy.gz', 'low': low, 'high': high, 'rows': None}
+                            for index, (low, high) in enumerate(plan_chunks(cursor, table, pk, chunk_rows))
+                        ],
+                    })
+            elif manifest.data['complete']:
+                log(f"Export in {directory} is already complete")
+                return manifest.data
+            elif [table['model'] for table in manifest.data['tables']] != model_names:
+                raise BackupError(f"{directory} holds an unfinished export of other tables")
+            manifest.data['snapshots'].append(snapshot)
+            manifest.save()
+
+            pending = [
+                (table, chunk) for table in manifest.data['tables']
+                for chunk in table['chunks'] if chunk['rows'] is None
+            ]
+            for table in manifest.data['tables']:
+                os.makedirs(os.path.join(directory, table['table']), exist_ok=True)
+            log(f"Exporting {len(pending)} chunks with {jobs} jobs from snapshot {snapshot}")
+
+            def export_chunk(job: Tuple[Dict[str, Any], Dict[str, Any]]) -> None:
+                table, chunk = job
+                path = os.path.join(directory, chunk['file'])
+                started = time.perf_counter()
+                worker = raw_connection()
+                try:
+                    worker.set_session(isolation_level='REPEATABLE READ', readonly=True)
+                    with worker.cursor() as copy, open(f'{path}.part', 'wb') as raw:
+                        copy.execute('SET TRANSACTION SNAPSHOT %s', [snapshot])
+                        columns = ', '.join(quote(column) for column in table['columns'])
+                        with gzip.GzipFile(fileobj=raw, mode='wb', compresslevel=compress_level) as out:
+                            copy.copy_expert(
+                                f"COPY (SELECT {columns} FROM {quote(table['table'])} "
+                                f"WHERE {range_condition(table['pk'], chunk['low'], chunk['high'])} "
+                                f"ORDER BY {quote(table['pk'])}) TO STDOUT",
+                                out,
+                            )
+                        rows = copy.rowcount
+                        raw.flush()
+                        os.fsync(raw.fileno())
+                    worker.rollback()
+                finally:
+                    worker.close()
+                os.replace(f'{path}.part', path)
+                manifest.update(lambda data: chunk.update(rows=rows, bytes=os.path.getsize(path)))
+                log(f"  {chunk['file']}: {rows} rows in {time.perf_counter() - started:.1f}s")
+
+            run_parallel(export_chunk, pending, jobs)
+        coordinator.rollback()
+    finally:
+        coordinator.close()
+
+    manifest.update(lambda data: data.update(complete=True, finished_at=time.time()))
+    if len(manifest.data['snapshots']) > 1:
+        log("Note: the export was resumed, so its chunks come from more than one snapshot")
+    return manifest.data
+
+
+def run_parallel(function: Callable[[Any], None], items: List[Any], jobs: int) -> None:
+    """Run function over items on ``jobs`` threads; the first failure is raised after the rest stop."""
+    if not items:
+        return
+    failed = threading.Event()
+
+    def guarded(item: Any) -> None:
+        if not failed.is_set():
+            try:
+                function(item)
+            except BaseException:
+                failed.set()
+                raise
+
+    with ThreadPoolExecutor(max_workers=jobs) as pool:
+        futures = [pool.submit(guarded, item) for item in items]
+    for future in futures:
+        future.result()
+
+
+def table_objects(cursor, table: str) -> Tuple[List[Dict[str, str]], List[Dict[str, str]]]:
+    """(secondary indexes, constraints other than the primary key) of a table, with their DDL."""
+    cursor.execute(
+        """
+        SELECT index_class.relname, pg_get_indexdef(idx.indexrelid)
+        FROM pg_index idx JOIN pg_class index_class ON index_class.oid = idx.indexrelid
+        WHERE idx.indrelid = %s::regclass AND NOT idx.indisprimary
+          AND NOT EXISTS (SELECT 1 FROM pg_constraint con WHERE con.conindid = idx.indexrelid
+                          AND con.conrelid = idx.indrelid AND con.contype IN ('p', 'u', 'x'))
+        ORDER BY 1
+        """,
+        [table],
+    )
+    indexes = [{'name': name, 'sql': sql} for name, sql in cursor.fetchall()]
+    cursor.execute(
+        """
+        SELECT conname, contype, pg_get_constraintdef(oid)
+        FROM pg_constraint
+        WHERE conrelid = %s::regclass AND contype IN ('f', 'u', 'x')
+        ORDER BY contype DESC, conname
+        """,
+        [table],
+    )
+    constraints = [
+        {'name': name, 'type': kind, 'sql': f'ALTER TABLE {quote(table)} ADD CONSTRAINT {quote(name)} {definition}'}
+        for name, kind, definition in cursor.fetchall()
+    ]
+    return indexes, constraints
+
+
+def restore(directory: str, jobs: int, truncate: bool, maintenance_work_mem: str,
+            log: Callable[[str], None]) -> Dict[str, Any]:
+    manifest = Checkpoint.load(os.path.join(directory, MANIFEST))
+    if manifest is None or not manifest.data.get('complete'):
+        raise BackupError(f"No complete export in {directory}")
+    tables = manifest.data['tables']
+    state = Checkpoint.load(os.path.join(directory, RESTORE_STATE))
+    admin = raw_connection()
+    admin.autocommit = True
+    try:
+        with admin.cursor() as cursor:
+            if state is None or state.data.get('phase') == 'done':
+                state = Checkpoint(os.path.join(directory, RESTORE_STATE), {'phase': 'prepare', 'dropped': None, 'loaded': []})
+            if state.data['phase'] == 'prepare':
+                prepare_tables(cursor, tables, truncate, state, log)
+            loaded = set(state.data['loaded'])
+            pending = [(table, chunk) for table in tables for chunk in table['chunks'] if chunk['file'] not in loaded]
+            log(f"Loading {len(pending)} chunks with {jobs} jobs")
+
+            def load_chunk(job: Tuple[Dict[str, Any], Dict[str, Any]]) -> None:
+                table, chunk = job
+                started = time.perf_counter()
+                worker = raw_connection()
+                try:
+                    with worker.cursor() as copy, gzip.open(os.path.join(directory, chunk['file']), 'rb') as data:
+                        copy.execute('SET synchronous_commit = off')
+                        # Replacing the whole key range makes a retried chunk idempotent
+                        copy.execute(
+                            f"DELETE FROM {quote(table['table'])} "
+                            f"WHERE {range_condition(table['pk'], chunk['low'], chunk['high'])}"
+                        )
+                        columns = ', '.join(quote(column) for column in table['columns'])
+                        copy.copy_expert(f"COPY {quote(table['table'])} ({columns}) FROM STDIN", data)
+                        rows = copy.rowcount
+                    worker.commit()
+                finally:
+                    worker.close()
+                state.update(lambda data: data['loaded'].append(chunk['file']))
+                log(f"  {chunk['file']}: {rows} rows in {time.perf_counter() - started:.1f}s")
+
+            run_parallel(load_chunk, pending, jobs)
+            state.update(lambda data: data.update(phase='indexes'))
+            rebuild(cursor, tables, state, jobs, maintenance_work_mem, log)
+    finally:
+        admin.close()
+    state.update(lambda data: data.update(phase='done', finished_at=time.time()))
+    return state.data
+
+
+def truncation_plan(cursor, names: List[str]) -> List[str]:
+    """
+    The tables a truncating restore of ``names`` empties: those, and every
+    table referencing them (directly or not), which must hold no rows.
+    """
+    cursor.execute(
+        """
+        WITH RECURSIVE referencing(oid) AS (
+            SELECT conrelid FROM pg_constraint WHERE contype = 'f' AND confrelid = ANY(%s::regclass[])
+            UNION
+            SELECT con.conrelid FROM pg_constraint con JOIN referencing ref ON con.confrelid = ref.oid
+            WHERE con.contype = 'f'
+        )
+        SELECT relname FROM pg_class WHERE oid IN (SELECT oid FROM referencing) ORDER BY 1
+        """,
+        [names],
+    )
+    dependents = [name for (name,) in cursor.fetchall() if name not in names]
+    with_rows = []
+    for name in dependents:
+        cursor.execute(f'SELECT EXISTS (SELECT 1 FROM {quote(name)})')
+        if cursor.fetchone()[0]:
+            with_rows.append(name)
+    if with_rows:
+        raise BackupError(
+            f"{', '.join(with_rows)} reference the restored tables and have rows this export does not "
+            f"contain; export them too or empty them first"
+        )
+    return names + dependents
+
+
+def plan_truncate(directory: str) -> List[str]:
+    """The tables ``restore(directory, truncate=True)`` would empty; BackupError if it would refuse."""
+    manifest = Checkpoint.load(os.path.join(directory, MANIFEST))
+    if manifest is None or not manifest.data.get('complete'):
+        raise BackupError(f"No complete export in {directory}")
+    connection = raw_connection()
+    try:
+        with connection.cursor() as cursor:
+            return truncation_plan(cursor, [table['table'] for table in manifest.data['tables']])
+    finally:
+        connection.close()
+
+
+def prepare_tables(cursor, tables: List[Dict[str, Any]], truncate: bool, state: Checkpoint,
+                   log: Callable[[str], None]) -> None:
+    """
+    Empty (or check) the tables, then drop their indexes and constraints and
+    disable their user triggers, all in one transaction. What is dropped is
+    checkpointed before anything is, so a run that dies here rolls back and
+    the next run repeats the preparation from the same list; the phase moves
+    on to 'load' only after the commit.
+    """
+    cursor.execute('BEGIN')
+    try:
+        _prepare_tables(cursor, tables, truncate, state, log)
+    except BaseException:
+        cursor.execute('ROLLBACK')
+        raise
+    cursor.execute('COMMIT')
+    state.update(lambda data: data.update(phase='load'))
+
+
+def _prepare_tables(cursor, tables: List[Dict[str, Any]], truncate: bool, state: Checkpoint,
+                    log: Callable[[str], None]) -> None:
+    names = [table['table'] for table in tables]
+    if truncate:
+        emptied = truncation_plan(cursor, names)
+        # No CASCADE: everything emptied is listed, and the dependents hold no rows
+        cursor.execute(f"TRUNCATE {', '.join(quote(name) for name in emptied)}")
+        log(f"Emptied {', '.join(emptied)}")
+    else:
+        for name in names:
+            cursor.execute(f'SELECT EXISTS (SELECT 1 FROM {quote(name)})')
+            if cursor.fetchone()[0]:
+                raise BackupError(f"{name} is not empty; restore into a freshly migrated database or use --truncate")
+
+    dropped: Optional[Dict[str, Dict[str, Any]]] = state.data.get('dropped')
+    if dropped is None:
+        dropped = {}
+        for name in names:
+            indexes, constraints = table_objects(cursor, name)
+            dropped[name] = {'indexes': indexes, 'constraints': constraints}
+        state.update(lambda data: data.update(dropped=dropped))
+    # Foreign keys first: they may depend on the unique indexes dropped after them
+    for name in names:
+        for constraint in dropped[name]['constraints']:
+            if constraint['type'] == 'f':
+                cursor.execute(f"ALTER TABLE {quote(name)} DROP CONSTRAINT IF EXISTS {quote(constraint['name'])}")
+    for name in names:
+        for constraint in dropped[name]['constraints']:
+            if constraint['type'] != 'f':
+                cursor.execute(f"ALTER TABLE {quote(name)} DROP CONSTRAINT IF EXISTS {quote(constraint['name'])}")
+        for index in dropped[name]['indexes']:
+            cursor.execute(f"DROP INDEX IF EXISTS {quote(index['name'])}")
+        cursor.execute(f'ALTER TABLE {quote(name)} DISABLE TRIGGER USER')
+        log(f"{name}: dropped {len(dropped[name]['indexes'])} indexes and "
+            f"{len(dropped[name]['constraints'])} constraints until the data is loaded")
+
+
+def rebuild(cursor, tables: List[Dict[str, Any]], state: Checkpoint, jobs: int, maintenance_work_mem: str,
+            log: Callable[[str], None]) -> None:
+    dropped = state.data['dropped']
+    names = [table['table'] for table in tables]
+    cursor.execute('SELECT relname FROM pg_class WHERE relkind = %s', ['i'])
+    existing_indexes = {row[0] for row in cursor.fetchall()}
+    indexes = [index for name in names for index in dropped[name]['indexes'] if index['name'] not in existing_indexes]
+
+    def create_index(index: Dict[str, str]) -> None:
+        started = time.perf_counter()
+        worker = raw_connection()
+        worker.autocommit = True
+        try:
+            with worker.cursor() as build:
+                build.execute('SET maintenance_work_mem = %s', [maintenance_work_mem])
+                build.execute(index['sql'])
+        finally:
+            worker.close()
+        log(f"  index {index['name']} in {time.perf_counter() - started:.1f}s")
+
+    log(f"Building {len(indexes)} indexes with {jobs} jobs")
+    run_parallel(create_index, indexes, jobs)
+
+    cursor.execute('SET maintenance_work_mem = %s', [maintenance_work_mem])
+    cursor.execute('SELECT conname FROM pg_constraint')
+    existing_constraints = {row[0] for row in cursor.fetchall()}
+    # Unique constraints before the foreign keys that may reference them
+    for kind in ('unique', 'foreign'):
+        for name in names:
+            for constraint in dropped[name]['constraints']:
+                if (constraint['type'] == 'f') == (kind == 'foreign') and constraint['name'] not in existing_constraints:
+                    started = time.perf_counter()
+                    cursor.execute(constraint['sql'])
+                    log(f"  constraint {constraint['name']} in {time.perf_counter() - started:.1f}s")
+
+    models = [get_model(table['model']) for table in tables]
+    for sql in connections['default'].ops.sequence_reset_sql(no_style(), models):
+        cursor.execute(sql)
+    for name in names:
+        cursor.execute(f'ALTER TABLE {quote(name)} ENABLE TRIGGER USER')
+        cursor.execute(f'ANALYZE {quote(name)}')
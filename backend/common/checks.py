@@ -0,0 +1,51 @@
+from pathlib import Path
+from typing import Any, List
+
+from django.conf import settings
+from django.core.checks import CheckMessage, Error, Tags, register
+
+
+@register(Tags.urls, deploy=True)
+def check_stored_schema(app_configs: Any = None, **kwargs: Any) -> List[CheckMessage]:
+    """Fail `check --deploy` when the precomputed OpenAPI schema drifted from the code"""
+    if not (settings.API_DOCS_ENABLED and settings.API_SCHEMA_STATIC):
+        return []
+    from .schema import generate_schema, read_stored_schema
+
+    root = Path(settings.API_SCHEMA_ROOT)
+    stored = read_stored_schema(root)
+    drifted = [fmt for fmt, content in generate_schema().items() if stored.get(fmt) != content]
+    if not drifted:
+        return []
+    return [Error(
+        f"Stored OpenAPI schema ({', '.join(drifted)}) in {root} is missing or out of date.",
+        hint="Run: python manage.py build_schema",
+        id='common.E001',
+    )]
+
+
+@register()
+def check_dedup_mode(app_configs: Any = None, **kwargs: Any) -> List[CheckMessage]:
+    from .dedup import DEDUP_MODES
+
+    if settings.LEAD_DEDUP_MODE in DEDUP_MODES:
+        return []
+    return [Error(
+        f"LEAD_DEDUP_MODE must be one of {', '.join(DEDUP_MODES)}, got {settings.LEAD_DEDUP_MODE!r}.",
+        id='common.E002',
+    )]
+
+
+@register(Tags.caches, deploy=True)
+def check_idempotency_cache(app_configs: Any = None, **kwargs: Any) -> List[CheckMessage]:
+    """Fail `check --deploy` when Idempotency-Key locks and records would live in one worker only"""
+    from .idempotency import PROCESS_LOCAL_CACHES
+
+    backend = settings.CACHES['default']['BACKEND']
+    if backend not in PROCESS_LOCAL_CACHES:
+        return []
+    return [Error(
+        f"Idempotency-Key handling needs a cache shared by all workers, the default cache is {backend}.",
+        hint="Set REDIS_URL.",
+        id='common.E003',
+    )]
@@ -0,0 +1,231 @@
+"""
+Lead deduplication.
+
+Every lead carries up to three blocking keys, each stored in an indexed column:
+
+- ``email_key``: lower-cased address without ``+tag`` (and without dots for Gmail)
+- ``phone_key``: the number's digits with its country code, so ``+385 91 123 4567``,
+  ``00385911234567`` and ``091 123 4567`` all block together as ``385911234567``
+  (a national ``0`` prefix stands for LEAD_DEDUP_COUNTRY_CODE)
+- ``name_key``: accent-folded, sorted name tokens plus the company name without
+  legal-form suffixes; only set when the lead has a company
+
+Two leads sharing any key are considered the same person. New leads are
+checked with a single indexed lookup on create, under transaction-level
+advisory locks on their keys so that concurrent submissions of the same person
+are serialized; existing leads are clustered in one streaming pass by
+``manage.py dedup_leads``.
+"""
+
+import hashlib
+import re
+import unicodedata
+from typing import TYPE_CHECKING, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from django.conf import settings
+from django.db import connections, transaction
+from django.db.models import Q
+
+if TYPE_CHECKING:
+    from .models import Lead
+
+DEDUP_MODES = ('off', 'flag', 'merge')
+KEY_FIELDS = ('email_key', 'phone_key', 'name_key')
+
+GMAIL_DOMAINS = {'gmail.com', 'googlemail.com'}
+COMPANY_SUFFIXES = {
+    'inc', 'incorporated', 'ltd', 'limited', 'llc', 'llp', 'plc', 'corp', 'corporation',
+    'co', 'company', 'gmbh', 'ag', 'sa', 'srl', 'spa', 'bv', 'nv', 'oy', 'ab',
+    'doo', 'dd', 'jdoo', 'obrt', 'd', 'o',
+}
+_TOKEN_RE = re.compile(r'\w+')
+
+
+def _tokens(value: str) -> List[str]:
+    folded = unicodedata.normalize('NFKD', value)
+    folded = ''.join(ch for ch in folded if not unicodedata.combining(ch)).casefold()
+    return _TOKEN_RE.findall(folded)
+
+
+def normalize_email(email: Optional[str]) -> Optional[str]:
+    if not email or '@' not in email:
+        return None
+    local, _, domain = email.strip().lower().rpartition('@')
+    local = local.split('+', 1)[0]
+    if domain in GMAIL_DOMAINS:
+        local, domain = local.replace('.', ''), 'gmail.com'
+    return f'{local}@{domain}' if local and domain else None
+
+
+def normalize_phone(phone: Optional[str], country_code: Optional[str] = None) -> Optional[str]:
+    """International digits of ``phone``: ``+``/``00`` prefixes dropped, a trunk ``0`` replaced by ``country_code``."""
+    if not phone:
+        return None
+    phone = phone.strip()
+    digits = re.sub(r'\D', '', phone)
+    if len(digits) < 7:
+        return None
+    if phone.startswith('+'):
+        return digits
+    if digits.startswith('00'):
+        return digits[2:]
+    country_code = settings.LEAD_DEDUP_COUNTRY_CODE if country_code is None else country_code
+    if digits.startswith('0') and country_code:
+        return country_code + digits[1:]
+    return digits
+
+
+def normalize_name(full_name: Optional[str], company_name: Optional[str]) -> Optional[str]:
+    name = sorted(_tokens(full_name or ''))
+    company = [token for token in _tokens(company_name or '') if token not in COMPANY_SUFFIXES]
+    if not name or not company:
+        return None
+    return f"{' '.join(name)}|{' '.join(company)}"[:255]
+
+
+def blocking_keys(
+    email: Optional[str], phone_number: Optional[str],
+    full_name: Optional[str], company_name: Optional[str],
+) -> Tuple[Optional[str], Optional[str], Optional[str]]:
+    """Return ``(email_key, phone_key, name_key)`` for the given lead fields."""
+    return (
+        normalize_email(email),
+        normalize_phone(phone_number),
+        normalize_name(full_name, company_name),
+    )
+
+
+def lock_keys(lead: 'Lead', using: str = 'default') -> None:
+    """
+    Take a transaction-level advisory lock per blocking key (PostgreSQL), so a
+    concurrent save_new_lead() with any of the same keys waits until this
+    transaction committed and then sees its lead.
+    """
+    connection = connections[using]
+    if connection.vendor != 'postgresql':
+        return
+    locks = sorted({
+        int.from_bytes(hashlib.blake2b(f'lead-dedup:{field}:{value}'.encode(), digest_size=8).digest(), 'big', signed=True)
+        for field in KEY_FIELDS
+        if (value := getattr(lead, field))
+    })
+    with connection.cursor() as cursor:
+        # Always in the same order, so two submissions cannot deadlock
+        for lock in locks:
+            cursor.execute('SELECT pg_advisory_xact_lock(%s)', [lock])
+
+
+def find_original(lead: 'Lead') -> Optional['Lead']:
+    """
+    Return the original lead ``lead`` duplicates, if any.
+
+    One query: an OR of equality lookups on the three indexed key columns.
+    """
+    from .models import Lead
+
+    condition = Q()
+    for field in KEY_FIELDS:
+        value = getattr(lead, field)
+        if value:
+            condition |= Q(**{field: value})
+    if not condition:
+        return None
+    candidates = Lead.objects.filter(condition)
+    if lead.pk:
+        candidates = candidates.exclude(pk=lead.pk)
+    match = candidates.select_related('duplicate_of').order_by('id').first()
+    if match is None:
+        return None
+    return match.duplicate_of or match
+
+
+MERGE_FIELDS = ('position', 'company_name', 'phone_number', 'email')
+
+
+def merge_into(original: 'Lead', lead: 'Lead') -> 'Lead':
+    """Fill the original's empty fields from ``lead`` and append its notes."""
+    for field in MERGE_FIELDS:
+        if not getattr(original, field) and getattr(lead, field):
+            setattr(original, field, getattr(lead, field))
+    if lead.notes and lead.notes not in (original.notes or ''):
+        original.notes = f'{original.notes}\n\n{lead.notes}' if original.notes else lead.notes
+    original.save()
+    return original
+
+
+def save_new_lead(lead: 'Lead', mode: Optional[str] = None) -> Tuple['Lead', bool]:
+    """
+    Insert ``lead`` after checking it against existing leads.
+
+    ``mode`` (default ``LEAD_DEDUP_MODE``) is ``off``, ``flag`` (insert and point
+    ``duplicate_of`` at the original) or ``merge`` (update the original instead
+    of inserting). Returns the saved lead and whether it was merged.
+    """
+    mode = mode or settings.LEAD_DEDUP_MODE
+    if mode == 'off':
+        lead.save()
+        return lead, False
+
+    lead.refresh_dedup_keys()
+    with transaction.atomic():
+        lock_keys(lead)
+        original = find_original(lead)
+        if original is not None and mode == 'merge':
+            return merge_into(original, lead), True
+        lead.duplicate_of = original
+        lead.save()
+    return lead, False
+
+
+class DisjointSet:
+    """Union-find over lead ids with path halving and union by lowest id."""
+
+    def __init__(self) -> None:
+        self.parent: Dict[int, int] = {}
+
+    def find(self, item: int) -> int:
+        parent = self.parent
+        root = parent.setdefault(item, item)
+        while root != parent[root]:
+            parent[root] = parent[parent[root]]
+            root = parent[root]
+        return root
+
+    def union(self, a: int, b: int) -> None:
+        root_a, root_b = self.find(a), self.find(b)
+        if root_a != root_b:
+            # The lowest id (the oldest lead) always stays the root
+            low, high = sorted((root_a, root_b))
+            self.parent[high] = low
+
+
+def cluster_leads(rows: Iterable[Tuple[int, Optional[str], Optional[str], Optional[str]]]) -> DisjointSet:
+    """
+    Cluster ``(id, email_key, phone_key, name_key)`` rows in a single pass.
+
+    Each key value remembers the first lead that used it; later leads with the
+    same value are unioned with that lead. Runs in O(n α(n)) time and keeps one
+    dict entry per distinct key instead of comparing every pair of leads.
+    """
+    clusters = DisjointSet()
+    first_seen: Tuple[Dict[str, int], ...] = ({}, {}, {})
+    for lead_id, *keys in rows:
+        clusters.find(lead_id)
+        for seen, key in zip(first_seen, keys):
+            if not key:
+                continue
+            other = seen.setdefault(key, lead_id)
+            if other != lead_id:
+                clusters.union(other, lead_id)
+    return clusters
+
+
+def iter_duplicate_groups(clusters: DisjointSet) -> Iterator[Tuple[int, List[int]]]:
+    """Yield ``(original_id, [duplicate ids])`` for clusters with more than one lead."""
+    groups: Dict[int, List[int]] = {}
+    for lead_id in clusters.parent:
+        root = clusters.find(lead_id)
+        if root != lead_id:
+            groups.setdefault(root, []).append(lead_id)
+    for root, members in groups.items():
+        yield root, sorted(members)
@@ -0,0 +1,323 @@
+"""
+Push feed of lead events (creations and status changes) over server-sent events.
+
+Every LeadStatusEvent row is an event. Row ids come from a sequence when the
+row is inserted, not when it commits, so an event can become visible after
+one with a higher id. Each connection therefore keeps a ``Cursor`` of the ids
+it has sent: the highest one plus the ids missing below it, up to
+LEAD_STREAM_REORDER_WINDOW back. The cursor is sent as the SSE event id, so a
+client that reconnects with ``Last-Event-ID`` gets exactly the events it is
+missing replayed from the table, late commits included, and none twice. On PostgreSQL an insert trigger (migration 0008) sends the
+event with ``NOTIFY lead_events``; one listener thread per process receives
+it and fans it out to every connected client of that process, so idle
+clients cost no queries. Other databases are polled by the same thread
+every LEAD_STREAM_POLL_INTERVAL seconds instead.
+
+Clients that fall LEAD_STREAM_CLIENT_BUFFER events behind are disconnected
+and catch up through the replay when they reconnect.
+"""
+
+import asyncio
+import json
+import logging
+import select
+import threading
+import time
+from collections import deque
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+from django.conf import settings
+from django.db import close_old_connections, connections
+from django.db.models import Q
+
+logger = logging.getLogger(__name__)
+
+CHANNEL = 'lead_events'
+STREAM_FIELDS = ('full_name', 'company_name', 'source', 'category', 'score')
+
+
+def format_event(data: str, event: str = 'lead') -> bytes:
+    """An event without its id line, which depends on the connection's cursor."""
+    return f'event: {event}\ndata: {data}\n\n'.encode()
+
+
+class Cursor:
+    """
+    The events a client has: every id up to ``high`` except the ``gaps``,
+    inclusive ranges of ids at most ``window`` below ``high`` that it has not
+    received. Ids further back are assumed to be rolled back, never to commit.
+    Serialized as ``high`` or ``high~a-b,c`` (the SSE event id).
+    """
+    __slots__ = ('high', 'gaps', 'window', '_token')
+
+    def __init__(self, high: int, gaps: Iterable[Tuple[int, int]] = (), window: Optional[int] = None) -> None:
+        self.window = settings.LEAD_STREAM_REORDER_WINDOW if window is None else window
+        self.high = high
+        self.gaps: List[List[int]] = []
+        self._token: Optional[str] = None
+        for start, end in sorted(gaps):
+            self.add_gap(start, end)
+
+    @classmethod
+    def parse(cls, value: str) -> 'Cursor':
+        high, _, gaps = value.strip().partition('~')
+        parts = gaps.split(',') if gaps else []
+        if len(parts) > settings.LEAD_STREAM_REORDER_WINDOW:
+            raise ValueError("too many gaps")
+        ranges = []
+        for part in parts:
+            start, _, end = part.partition('-')
+            ranges.append((int(start), int(end or start)))
+        return cls(int(high), ranges)
+
+    def add_gap(self, start: int, end: int) -> None:
+        start, end = max(start, self.high - self.window + 1), min(end, self.high - 1)
+        if start > end:
+            return
+        if self.gaps and start <= self.gaps[-1][1] + 1:
+            self.gaps[-1][1] = max(self.gaps[-1][1], end)
+        else:
+            self.gaps.append([start, end])
+        self._token = None
+
+    def accept(self, event_id: int) -> bool:
+        """Record ``event_id`` as sent; False when the client already has it."""
+        if event_id > self.high:
+            previous, self.high = self.high, event_id
+            self._token = None
+            floor = event_id - self.window
+            while self.gaps and self.gaps[0][1] <= floor:
+                self.gaps.pop(0)
+            if self.gaps and self.gaps[0][0] <= floor:
+                self.gaps[0][0] = floor + 1
+            self.add_gap(previous + 1, event_id - 1)
+            return True
+        # Late events are usually the most recent gaps
+        for index in range(len(self.gaps) - 1, -1, -1):
+            start, end = self.gaps[index]
+            if end < event_id:
+                break
+            if start <= event_id:
+                self.gaps[index:index + 1] = [
+                    [low, high] for low, high in ((start, event_id - 1), (event_id + 1, end)) if low <= high
+                ]
+                self._token = None
+                return True
+        return False
+
+    def missing(self) -> Q:
+        """Filter for the LeadStatusEvent rows the client does not have."""
+        condition = Q(id__gt=self.high)
+        for start, end in self.gaps:
+            condition |= Q(id__range=(start, end))
+        return condition
+
+    def token(self) -> str:
+        if self._token is None:
+            self._token = str(self.high)
+            if self.gaps:
+                self._token += '~' + ','.join(str(start) if start == end else f'{start}-{end}' for start, end in self.gaps)
+        return self._token
+
+    def tag(self, payload: bytes) -> bytes:
+        """``payload`` with the cursor as its SSE id, for a client that now has it."""
+        return b'id: ' + self.token().encode() + b'\n' + payload
+
+
+def event_data(values: Dict[str, Any]) -> str:
+    """The JSON sent for one LeadStatusEvent; the NOTIFY trigger builds the same object."""
+    return json.dumps({
+        'id': values['id'],
+        'lead': values['lead_id'],
+        'from_status': values['from_status'],
+        'to_status': values['to_status'],
+        'at': values['at'].isoformat() if hasattr(values['at'], 'isoformat') else values['at'],
+        **{field: values[f'lead__{field}'] for field in STREAM_FIELDS},
+    }, separators=(',', ':'))
+
+
+def fetch_events(cursor: Cursor, limit: int) -> List[Tuple[int, str]]:
+    """(id, data) of the stored events ``cursor`` is missing, in id order."""
+    from .models import LeadStatusEvent
+
+    rows = (
+        LeadStatusEvent.objects.filter(cursor.missing()).order_by('id')
+        .values('id', 'lead_id', 'from_status', 'to_status', 'at', *(f'lead__{field}' for field in STREAM_FIELDS))
+    )[:limit]
+    return [(row['id'], event_data(row)) for row in rows]
+
+
+def current_cursor() -> Cursor:
+    """A cursor at the newest stored event; ids below it that are not stored (yet) are gaps."""
+    from .models import LeadStatusEvent
+
+    newest = LeadStatusEvent.objects.order_by('-id').values_list('id', flat=True).first() or 0
+    cursor = Cursor(newest)
+    stored = set(
+        LeadStatusEvent.objects.filter(id__gt=newest - cursor.window, id__lt=newest).values_list('id', flat=True)
+    )
+    for event_id in range(max(newest - cursor.window + 1, 1), newest):
+        if event_id not in stored:
+            cursor.add_gap(event_id, event_id)
+    return cursor
+
+
+def replay(cursor: Cursor, limit: int) -> Tuple[List[bytes], Cursor]:
+    """
+    Encoded events a client reconnecting with ``cursor`` missed, and the
+    cursor to continue from. More than ``limit`` missed events are not
+    replayed; the client gets one ``reset`` event instead and should reload its list.
+    """
+    events = fetch_events(cursor, limit + 1)
+    if len(events) <= limit:
+        return [cursor.tag(format_event(data)) for event_id, data in events if cursor.accept(event_id)], cursor
+    cursor = current_cursor()
+    return [cursor.tag(format_event(json.dumps({'missed_more_than': limit}), event='reset'))], cursor
+
+
+class Subscriber:
+    """One connected client: a bounded backlog of encoded events and a wake-up flag"""
+    __slots__ = ('pending', 'wake', 'limit', 'overflowed')
+
+    def __init__(self, limit: int) -> None:
+        self.pending: deque = deque()
+        self.wake = asyncio.Event()
+        self.limit = limit
+        self.overflowed = False
+
+    def push(self, event_id: int, payload: bytes) -> None:
+        if self.overflowed:
+            return
+        if len(self.pending) >= self.limit:
+            self.overflowed = True
+        else:
+            self.pending.append((event_id, payload))
+        self.wake.set()
+
+
+class LeadEventBroker:
+    """Per-process fan-out from one event source to the subscribers of each event loop."""
+
+    def __init__(self) -> None:
+        self.loops: Dict[asyncio.AbstractEventLoop, Set[Subscriber]] = {}
+        self.lock = threading.Lock()
+        self.thread: Optional[threading.Thread] = None
+        self.published = 0
+
+    @property
+    def subscribers(self) -> int:
+        return sum(len(subscribers) for subscribers in self.loops.values())
+
+    def subscribe(self) -> Subscriber:
+        loop = asyncio.get_running_loop()
+        subscriber = Subscriber(settings.LEAD_STREAM_CLIENT_BUFFER)
+        with self.lock:
+            self.loops.setdefault(loop, set()).add(subscriber)
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(target=self.run, name='lead-events', daemon=True)
+                self.thread.start()
+        return subscriber
+
+    def unsubscribe(self, subscriber: Subscriber) -> None:
+        with self.lock:
+            for loop, subscribers in list(self.loops.items()):
+                subscribers.discard(subscriber)
+                if not subscribers:
+                    del self.loops[loop]
+
+    def publish(self, event_id: int, data: str) -> None:
+        """Hand an event to every subscriber; callable from any thread."""
+        payload = format_event(data)
+        self.published += 1
+        with self.lock:
+            loops = list(self.loops)
+        for loop in loops:
+            # One callback per loop, not per subscriber, keeps a busy feed cheap
+            try:
+                loop.call_soon_threadsafe(self.fan_out, loop, event_id, payload)
+            except RuntimeError:  # loop closed
+                with self.lock:
+                    self.loops.pop(loop, None)
+
+    def fan_out(self, loop: asyncio.AbstractEventLoop, event_id: int, payload: bytes) -> None:
+        for subscriber in list(self.loops.get(loop, ())):
+            subscriber.push(event_id, payload)
+
+    def run(self) -> None:
+        while True:
+            try:
+                if connections['default'].vendor == 'postgresql':
+                    self.listen()
+                else:
+                    self.poll()
+            except Exception:
+                logger.exception("Lead event listener failed, restarting")
+                time.sleep(settings.LEAD_STREAM_POLL_INTERVAL)
+            finally:
+                close_old_connections()
+            if not self.loops:
+                with self.lock:
+                    if not self.loops:
+                        self.thread = None
+                        return
+
+    def listen(self) -> None:
+        """LISTEN on a dedicated autocommit connection until no client is left."""
+        connection = connections['default']
+        raw = connection.get_new_connection(connection.get_connection_params())
+        try:
+            raw.autocommit = True
+            with raw.cursor() as cursor:
+                cursor.execute(f'LISTEN {CHANNEL}')
+            while self.loops:
+                if select.select([raw], [], [], 5.0) == ([], [], []):
+                    continue
+                raw.poll()
+                while raw.notifies:
+                    notify = raw.notifies.pop(0)
+                    self.publish(json.loads(notify.payload)['id'], notify.payload)
+        finally:
+            raw.close()
+
+    def poll(self) -> None:
+        cursor = current_cursor()
+        while self.loops:
+            time.sleep(settings.LEAD_STREAM_POLL_INTERVAL)
+            for event_id, data in fetch_events(cursor, 1000):
+                if cursor.accept(event_id):
+                    self.publish(event_id, data)
+            close_old_connections()
+
+
+broker = LeadEventBroker()
+
+
+async def stream(subscriber: Subscriber, backlog: Iterable[bytes], cursor: Cursor):
+    """
+    Async iterator of SSE chunks: the replayed backlog, then live events
+    (NOTIFY delivers them in commit order) the client does not have yet, until overflow.
+    """
+    try:
+        yield f'retry: {settings.LEAD_STREAM_RETRY_MS}\n\n'.encode()
+        for payload in backlog:
+            yield payload
+        heartbeat = settings.LEAD_STREAM_HEARTBEAT
+        while True:
+            try:
+                await asyncio.wait_for(subscriber.wake.wait(), timeout=heartbeat)
+            except asyncio.TimeoutError:
+                yield b': ping\n\n'
+                continue
+            subscriber.wake.clear()
+            chunk: List[bytes] = []
+            while subscriber.pending:
+                event_id, payload = subscriber.pending.popleft()
+                if cursor.accept(event_id):  # else already sent in the replay
+                    chunk.append(cursor.tag(payload))
+            if chunk:
+                yield b''.join(chunk)
+            if subscriber.overflowed:
+                yield b'event: overflow\ndata: {}\n\n'
+                return
+    finally:
+        broker.unsubscribe(subscriber)
@@ -0,0 +1,61 @@
+"""
+Time-in-stage aggregates over LeadStatusEvent.
+
+A lead stays in a stage from the event that moved it there until its next
+event. Spans are computed with a window function over a single range scan of
+the ``at`` BRIN index, so the cost depends on the window, not the table size.
+"""
+
+from datetime import datetime
+from typing import Any, Dict, List
+
+from django.db import connection
+
+from .models import LeadStatusEvent
+
+STAGE_DURATIONS_SQL = """
+    WITH spans AS (
+        SELECT to_status AS stage,
+               at AS entered_at,
+               LEAD(at) OVER (PARTITION BY lead_id ORDER BY at, id) AS left_at
+        FROM {table}
+        WHERE at >= %(since)s AND at < %(until)s
+    ),
+    durations AS (
+        SELECT stage,
+               left_at IS NULL AS is_open,
+               EXTRACT(EPOCH FROM (COALESCE(left_at, %(until)s) - entered_at)) AS seconds
+        FROM spans
+    )
+    SELECT stage,
+           COUNT(*) FILTER (WHERE NOT is_open) AS completed,
+           COUNT(*) FILTER (WHERE is_open) AS still_open,
+           AVG(seconds) AS avg_seconds,
+           PERCENTILE_CONT(0.5) WITHIN GROUP (ORDER BY seconds) AS p50_seconds,
+           PERCENTILE_CONT(0.9) WITHIN GROUP (ORDER BY seconds) AS p90_seconds,
+           MAX(seconds) AS max_seconds
+    FROM durations
+    WHERE %(include_open)s OR NOT is_open
+    GROUP BY stage
+    ORDER BY stage
+"""
+
+
+def stage_durations(since: datetime, until: datetime, include_open: bool = False) -> List[Dict[str, Any]]:
+    """
+    Aggregate how long leads stayed in each stage they entered in [since, until).
+
+    Stages still open at ``until`` are counted up to ``until`` when
+    ``include_open`` is set and skipped otherwise.
+    """
+    sql = STAGE_DURATIONS_SQL.format(table=connection.ops.quote_name(LeadStatusEvent._meta.db_table))
+    with connection.cursor() as cursor:
+        cursor.execute(sql, {'since': since, 'until': until, 'include_open': include_open})
+        columns = [column[0] for column in cursor.description]
+        return [
+            {
+                column: float(value) if column.endswith('seconds') and value is not None else value
+                for column, value in zip(columns, row)
+            }
+            for row in cursor.fetchall()
+        ]
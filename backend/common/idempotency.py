@@ -0,0 +1,160 @@
+"""
+``Idempotency-Key`` support for create endpoints.
+
+The first request with a key takes a lock (an atomic ``cache.add``), runs
+normally and stores its rendered response for IDEMPOTENCY_TTL seconds. Later
+requests with the same key and body get that response back, marked with
+``Idempotent-Replayed: true``, without being throttled, validated or touching
+the database. A duplicate that arrives while the first request is still
+running gets 409 with ``Retry-After`` right away rather than holding a worker
+while it waits. Keys are scoped per API client, and reusing a key for a
+different request body is rejected with 422. Only 2xx responses are stored,
+so a request that failed validation or errored can be corrected and retried.
+
+The cache must be shared by all workers (Redis); `check --deploy` fails with
+a per-process cache, which would let duplicates through on other workers.
+"""
+
+import hashlib
+from typing import Any, Dict, Optional
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse
+from rest_framework import status
+from rest_framework.exceptions import APIException, ValidationError
+
+from .authentication import KeyInfo
+
+IDEMPOTENCY_HEADER = 'Idempotency-Key'
+MAX_KEY_LENGTH = 255
+REPLAYED_HEADERS = ('Location',)
+# Cache backends private to one process, useless for deduplicating across workers
+PROCESS_LOCAL_CACHES = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+
+class IdempotencyConflict(APIException):
+    status_code = status.HTTP_409_CONFLICT
+    default_detail = "A request with this Idempotency-Key is still being processed, retry later."
+    default_code = 'idempotency_conflict'
+    wait = 1  # sent as Retry-After
+
+
+class IdempotencyKeyReused(APIException):
+    status_code = status.HTTP_422_UNPROCESSABLE_ENTITY
+    default_detail = "This Idempotency-Key was already used for a different request."
+    default_code = 'idempotency_key_reused'
+
+
+class IdempotencyState:
+    def __init__(self, cache_key: str, fingerprint: str) -> None:
+        self.cache_key = cache_key
+        self.lock_key = f'{cache_key}:lock'
+        self.fingerprint = fingerprint
+        self.record: Optional[Dict[str, Any]] = None
+        self.owns_lock = False
+
+
+def _client(request) -> str:
+    info = getattr(request, 'auth', None)
+    if isinstance(info, KeyInfo):
+        return f'key-{info.id if info.id is not None else info.name}'
+    return f"ip-{request.META.get('REMOTE_ADDR', '')}"
+
+
+class IdempotentCreateMixin:
+    """Add Idempotency-Key handling to a view's POST; set ``idempotency_scope``."""
+    idempotency_scope: str = ''
+
+    def idempotency_state(self, request) -> Optional[IdempotencyState]:
+        if request.method != 'POST':
+            return None
+        if not hasattr(request, '_idempotency'):
+            request._idempotency = None
+            key = request.headers.get(IDEMPOTENCY_HEADER)
+            if key:
+                if len(key) > MAX_KEY_LENGTH:
+                    raise ValidationError({IDEMPOTENCY_HEADER: f"Must be at most {MAX_KEY_LENGTH} characters."})
+                digest = hashlib.sha256(key.encode()).hexdigest()
+                body = hashlib.sha256(request._request.body).hexdigest()
+                request._idempotency = state = IdempotencyState(
+                    f'idempotency:{self.idempotency_scope}:{_client(request)}:{digest}', body,
+                )
+                self.load_record(state)
+        return request._idempotency
+
+    @staticmethod
+    def load_record(state: IdempotencyState) -> bool:
+        record = cache.get(state.cache_key)
+        if record is None:
+            return False
+        if record['fingerprint'] != state.fingerprint:
+            raise IdempotencyKeyReused()
+        state.record = record
+        return True
+
+    def check_throttles(self, request) -> None:
+        state = self.idempotency_state(request)
+        if state is not None and state.record is not None:
+            return  # replays cost one cache read, don't count them
+        super().check_throttles(request)
+
+    def initial(self, request, *args: Any, **kwargs: Any) -> None:
+        super().initial(request, *args, **kwargs)
+        state = self.idempotency_state(request)
+        if state is None or state.record is not None:
+            return
+        if cache.add(state.lock_key, 1, timeout=settings.IDEMPOTENCY_LOCK_TIMEOUT):
+            state.owns_lock = True
+            # The previous holder may have finished between our read and add()
+            if self.load_record(state):
+                self.release(state)
+            return
+        if not self.load_record(state):
+            raise IdempotencyConflict()
+
+    def post(self, request, *args: Any, **kwargs: Any):
+        state = self.idempotency_state(request)
+        if state is not None and state.record is not None:
+            record = state.record
+            response = HttpResponse(record['content'], status=record['status'], content_type=record['content_type'])
+            for header, value in record['headers'].items():
+                response[header] = value
+            response['Idempotent-Replayed'] = 'true'
+            return response
+        return super().post(request, *args, **kwargs)
+
+    def handle_exception(self, exc: Exception):
+        try:
+            return super().handle_exception(exc)
+        except Exception:
+            # Unhandled errors never reach finalize_response()
+            state = getattr(self.request, '_idempotency', None)
+            if state is not None and state.owns_lock:
+                self.release(state)
+            raise
+
+    def finalize_response(self, request, response, *args: Any, **kwargs: Any):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        state = getattr(request, '_idempotency', None)
+        if state is None or not state.owns_lock:
+            return response
+        if status.is_success(response.status_code):
+            response.render()
+            cache.set(state.cache_key, {
+                'fingerprint': state.fingerprint,
+                'status': response.status_code,
+                'content': response.content,
+                'content_type': response['Content-Type'],
+                'headers': {header: response[header] for header in REPLAYED_HEADERS if response.has_header(header)},
+            }, timeout=settings.IDEMPOTENCY_TTL)
+        self.release(state)
+        return response
+
+    @staticmethod
+    def release(state: IdempotencyState) -> None:
+        cache.delete(state.lock_key)
+        state.owns_lock = False
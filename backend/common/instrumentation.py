@@ -0,0 +1,455 @@
+"""
+SQL instrumentation built on ``connection.execute_wrapper``.
+
+``record_queries()`` wraps every database connection of the current thread
+and collects, per block of code, the number of queries, their total time
+and how often each SQL fingerprint (the statement with literals and IN
+lists collapsed) ran. The same fingerprint running many times in one
+request is the signature of an N+1 pattern.
+
+``QueryBudgetMiddleware`` records sampled requests and compares them with
+the budget declared for the view (a ``query_budget`` attribute, or
+QUERY_BUDGETS by URL name): over budget it raises when QUERY_BUDGET_RAISE
+is set (tests, development) and logs a warning otherwise.
+
+The same middleware feeds ``slow_query_log``: every query slower than
+SLOW_QUERY_MS is aggregated per fingerprint (count, rolling p50/p95, rows,
+the views and query parameters that ran it) in a bounded per-process
+structure, and the first sighting of a SELECT gets an EXPLAIN sample.
+Workers publish snapshots to the cache so a report can merge them.
+"""
+
+import logging
+import os
+import random
+import re
+import socket
+import threading
+import time
+from collections import Counter, OrderedDict, deque
+from contextlib import ExitStack, contextmanager
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple, Union
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections
+from django.urls import URLPattern, URLResolver, get_resolver
+
+logger = logging.getLogger(__name__)
+
+_STRING_RE = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_RE = re.compile(r'\b\d+(?:\.\d+)?\b')
+_IN_LIST_RE = re.compile(r'\bIN\s*\((?:\s*(?:%s|\?|\$\d+)\s*,?)+\)', re.IGNORECASE)
+_SAVEPOINT_RE = re.compile(r'(SAVEPOINT\s+)"?\w+"?', re.IGNORECASE)
+_SPACE_RE = re.compile(r'\s+')
+_READ_RE = re.compile(r'\s*(SELECT|WITH)\b', re.IGNORECASE)  # safe to EXPLAIN
+
+
+def fingerprint(sql: str) -> str:
+    """Normalize SQL so that executions differing only in values compare equal."""
+    sql = _STRING_RE.sub('?', sql)
+    sql = _SAVEPOINT_RE.sub(r'\1?', sql)
+    sql = _IN_LIST_RE.sub('IN (...)', sql)
+    sql = _NUMBER_RE.sub('?', sql)
+    return _SPACE_RE.sub(' ', sql).strip()
+
+
+class QueryRecorder:
+    """``execute_wrapper`` callable accumulating query count, time and fingerprints."""
+
+    def __init__(self, fingerprint_all: bool = True) -> None:
+        self.count = 0
+        self.duration = 0.0
+        # Off when only listeners (the slow query log) need the queries
+        self.fingerprint_all = fingerprint_all
+        self.fingerprints: Counter = Counter()
+        self.listeners: List[Callable[[str, Any, float, Dict[str, Any]], None]] = []
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - started
+            self.count += 1
+            self.duration += elapsed
+            if self.fingerprint_all:
+                self.fingerprints[fingerprint(sql)] += 1
+            for listener in self.listeners:
+                listener(sql, params, elapsed, context)
+
+    def repeated(self, threshold: int) -> List[Tuple[str, int]]:
+        """Fingerprints that ran at least ``threshold`` times, most frequent first."""
+        return [(sql, count) for sql, count in self.fingerprints.most_common() if count >= threshold]
+
+    @property
+    def duplicates(self) -> int:
+        """Queries that repeated an earlier fingerprint"""
+        return self.count - len(self.fingerprints)
+
+
+@contextmanager
+def record_queries(recorder: Optional[QueryRecorder] = None) -> Iterator[QueryRecorder]:
+    """Record the queries run on this thread's connections inside the block."""
+    recorder = recorder or QueryRecorder()
+    with ExitStack() as stack:
+        for alias in connections:
+            stack.enter_context(connections[alias].execute_wrapper(recorder))
+        yield recorder
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+Budget = Union[int, Dict[str, int]]
+
+
+def budget_for(budget: Optional[Budget], method: str) -> Optional[int]:
+    if isinstance(budget, dict):
+        return budget.get(method)
+    return budget
+
+
+@contextmanager
+def assert_max_queries(budget: int, n_plus_one_threshold: Optional[int] = None) -> Iterator[QueryRecorder]:
+    """
+    Fail with the offending fingerprints when the block runs more than
+    ``budget`` queries, or any one fingerprint ``n_plus_one_threshold`` times.
+    """
+    threshold = n_plus_one_threshold or settings.QUERY_N_PLUS_ONE_THRESHOLD
+    with record_queries() as recorder:
+        yield recorder
+    problems = []
+    if recorder.count > budget:
+        problems.append(f"{recorder.count} queries, budget is {budget}")
+    repeated = recorder.repeated(threshold)
+    if repeated:
+        problems.append(f"repeated queries (N+1?): {len(repeated)} patterns")
+    if problems:
+        details = '\n'.join(f"  {count}x {sql[:300]}" for sql, count in recorder.fingerprints.most_common(10))
+        raise QueryBudgetExceeded(f"{'; '.join(problems)}\n{details}")
+
+
+def view_label(request) -> str:
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return request.path
+    return match.view_name or match._func_path
+
+
+def declared_budget(request) -> Optional[int]:
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return None
+    budget = settings.QUERY_BUDGETS.get(match.view_name)
+    if budget is None:
+        view_class = getattr(match.func, 'view_class', None) or getattr(match.func, 'cls', None)
+        budget = getattr(view_class, 'query_budget', None)
+    return budget_for(budget, request.method)
+
+
+def iter_url_names(patterns, namespace: str = '') -> Iterator[Tuple[str, Any]]:
+    """(URL name, view callback) of every named pattern, namespaces included"""
+    for pattern in patterns:
+        if isinstance(pattern, URLResolver):
+            inner = f'{namespace}{pattern.namespace}:' if pattern.namespace else namespace
+            yield from iter_url_names(pattern.url_patterns, inner)
+        elif isinstance(pattern, URLPattern) and pattern.name:
+            yield f'{namespace}{pattern.name}', pattern.callback
+
+
+def budgeted_views(method: str = 'GET') -> List[Tuple[str, int]]:
+    """URL names with a budget for ``method``, from QUERY_BUDGETS or the view's query_budget"""
+    found = {}
+    for name, callback in iter_url_names(get_resolver().url_patterns):
+        budget = settings.QUERY_BUDGETS.get(name)
+        if budget is None:
+            view_class = getattr(callback, 'view_class', None) or getattr(callback, 'cls', None)
+            budget = getattr(view_class, 'query_budget', None)
+        budget = budget_for(budget, method)
+        if budget is not None:
+            found.setdefault(name, budget)
+    return sorted(found.items())
+
+
+class QueryBudgetMiddleware:
+    """
+    Count queries per request (for a QUERY_INSTRUMENTATION_SAMPLE_RATE share of
+    requests), check them against the view's budget and log N+1 patterns.
+    In DEBUG the totals are exposed in a Server-Timing header. Slow queries
+    of every request go to ``slow_query_log``.
+    """
+
+    def __init__(self, get_response) -> None:
+        self.get_response = get_response
+
+    def __call__(self, request):
+        sampled = settings.QUERY_BUDGET_RAISE or random.random() < settings.QUERY_INSTRUMENTATION_SAMPLE_RATE
+        slow_ms = settings.SLOW_QUERY_MS
+        if not (sampled or slow_ms):
+            return self.get_response(request)
+
+        recorder = QueryRecorder(fingerprint_all=sampled)
+        capture = SlowQueryCapture(slow_query_log, request, slow_ms) if slow_ms else None
+        if capture is not None:
+            recorder.listeners.append(capture)
+        with record_queries(recorder):
+            request.query_recorder = recorder
+            response = self.get_response(request)
+        if capture is not None:
+            capture.finish()
+        if not sampled:
+            return response
+
+        label = view_label(request)
+        budget = declared_budget(request)
+        if budget is not None and recorder.count > budget:
+            message = f"{request.method} {label} ran {recorder.count} queries, budget is {budget}"
+            if settings.QUERY_BUDGET_RAISE:
+                raise QueryBudgetExceeded(message)
+            logger.warning(message, extra={'queries': recorder.count, 'budget': budget, 'view': label})
+
+        for sql, count in recorder.repeated(settings.QUERY_N_PLUS_ONE_THRESHOLD):
+            logger.warning(
+                "Possible N+1 in %s %s: %d x %s", request.method, label, count, sql[:300],
+                extra={'view': label, 'repeats': count},
+            )
+
+        if settings.DEBUG:
+            response['Server-Timing'] = (
+                f'db;dur={recorder.duration * 1000:.1f};desc="{recorder.count} queries, {recorder.duplicates} duplicate"'
+            )
+        return response
+
+
+def percentile(samples: List[float], fraction: float) -> float:
+    """Nearest-rank percentile of unsorted samples"""
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, max(0, round(fraction * len(ordered) + 0.5) - 1))]
+
+
+class QueryStats:
+    """Rolling statistics of the slow executions of one fingerprint"""
+    __slots__ = ('fingerprint', 'sql', 'count', 'total', 'max', 'rows', 'samples',
+                 'views', 'explain', 'first_seen', 'last_seen')
+
+    max_views = 20
+
+    def __init__(self, fp: str, sql: str, samples: int) -> None:
+        self.fingerprint = fp
+        self.sql = sql[:2000]
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.rows = 0
+        self.samples: deque = deque(maxlen=samples)  # latest durations, for percentiles
+        self.views: Counter = Counter()
+        self.explain: Optional[str] = None
+        self.first_seen = self.last_seen = time.time()
+
+    def add(self, elapsed: float, rows: int, view: str) -> None:
+        self.count += 1
+        self.total += elapsed
+        self.max = max(self.max, elapsed)
+        self.rows += max(rows, 0)
+        self.samples.append(elapsed)
+        if view in self.views or len(self.views) < self.max_views:
+            self.views[view] += 1
+        else:
+            self.views['(other)'] += 1
+        self.last_seen = time.time()
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            'fingerprint': self.fingerprint,
+            'sql': self.sql,
+            'count': self.count,
+            'total': self.total,
+            'max': self.max,
+            'rows': self.rows,
+            'samples': list(self.samples),
+            'views': dict(self.views),
+            'explain': self.explain,
+            'first_seen': self.first_seen,
+            'last_seen': self.last_seen,
+        }
+
+
+class SlowQueryLog:
+    """
+    Per-process slow query statistics, at most SLOW_QUERY_MAX_FINGERPRINTS
+    of them; the least recently seen fingerprint is evicted first.
+    """
+
+    cache_prefix = 'slow-queries'
+
+    def __init__(self) -> None:
+        self.entries: 'OrderedDict[str, QueryStats]' = OrderedDict()
+        self.lock = threading.Lock()
+        self.published_at = 0.0
+        self.dirty = False
+
+    @property
+    def worker_key(self) -> str:
+        return f'{self.cache_prefix}:{socket.gethostname()}:{os.getpid()}'
+
+    def record(self, fp: str, sql: str, elapsed: float, rows: int, view: str) -> bool:
+        """Add one slow execution; True when the fingerprint was not tracked yet."""
+        with self.lock:
+            stats = self.entries.get(fp)
+            new = stats is None
+            if new:
+                while len(self.entries) >= settings.SLOW_QUERY_MAX_FINGERPRINTS:
+                    self.entries.popitem(last=False)
+                stats = self.entries[fp] = QueryStats(fp, sql, settings.SLOW_QUERY_SAMPLES)
+            else:
+                self.entries.move_to_end(fp)
+            stats.add(elapsed, rows, view)
+            self.dirty = True
+        return new
+
+    def set_explain(self, fp: str, plan: str) -> None:
+        with self.lock:
+            stats = self.entries.get(fp)
+            if stats is not None:
+                stats.explain = plan
+
+    def snapshot(self) -> List[Dict[str, Any]]:
+        with self.lock:
+            return [stats.snapshot() for stats in self.entries.values()]
+
+    def reset(self) -> None:
+        with self.lock:
+            self.entries.clear()
+            self.dirty = False
+
+    def publish(self, force: bool = False) -> None:
+        """Share this worker's snapshot through the cache, at most every SLOW_QUERY_PUBLISH_INTERVAL."""
+        interval = settings.SLOW_QUERY_PUBLISH_INTERVAL
+        now = time.monotonic()
+        if not (force or (self.dirty and now - self.published_at >= interval)):
+            return
+        self.published_at = now
+        self.dirty = False
+        timeout = max(interval * 20, 3600)
+        try:
+            cache.set(self.worker_key, self.snapshot(), timeout=timeout)
+            workers = cache.get(f'{self.cache_prefix}:workers') or []
+            if self.worker_key not in workers:
+                cache.set(f'{self.cache_prefix}:workers', [*workers[-99:], self.worker_key], timeout=timeout)
+        except Exception:
+            logger.warning("Could not publish slow query statistics", exc_info=True)
+
+    def published(self, include_own: bool = True) -> List[List[Dict[str, Any]]]:
+        """Snapshots published by all workers (this one's from memory)."""
+        snapshots = [self.snapshot()] if include_own else []
+        try:
+            workers = [key for key in cache.get(f'{self.cache_prefix}:workers') or [] if key != self.worker_key]
+            snapshots += [snapshot for snapshot in cache.get_many(workers).values() if snapshot]
+        except Exception:
+            logger.warning("Could not read slow query statistics", exc_info=True)
+        return snapshots
+
+    def clear_published(self) -> None:
+        workers = cache.get(f'{self.cache_prefix}:workers') or []
+        cache.delete_many([*workers, f'{self.cache_prefix}:workers'])
+        self.reset()
+
+
+slow_query_log = SlowQueryLog()
+
+
+def request_label(request) -> str:
+    """Method, view and the names (not values) of the query parameters"""
+    label = f'{request.method} {view_label(request)}'
+    params = sorted(request.GET.keys())[:10]
+    return f"{label} ?{'&'.join(params)}" if params else label
+
+
+class SlowQueryCapture:
+    """QueryRecorder listener sending one request's slow queries to a SlowQueryLog"""
+
+    def __init__(self, log: SlowQueryLog, request, threshold_ms: float) -> None:
+        self.log = log
+        self.request = request
+        self.threshold = threshold_ms / 1000
+        self.to_explain: List[Tuple[str, str, str, Any]] = []
+
+    def __call__(self, sql: str, params: Any, elapsed: float, context: Dict[str, Any]) -> None:
+        if elapsed < self.threshold:
+            return
+        fp = fingerprint(sql)
+        rows = getattr(context.get('cursor'), 'rowcount', -1)
+        # resolver_match is only set once URL resolution ran
+        if self.log.record(fp, sql, elapsed, rows if isinstance(rows, int) else -1, request_label(self.request)):
+            if settings.SLOW_QUERY_EXPLAIN and _READ_RE.match(sql):
+                self.to_explain.append((fp, context['connection'].alias, sql, params))
+
+    def finish(self) -> None:
+        """EXPLAIN the new offenders (after the view, outside the recorder) and publish."""
+        for fp, alias, sql, params in self.to_explain:
+            self.log.set_explain(fp, explain(alias, sql, params))
+        self.log.publish()
+
+
+def explain(alias: str, sql: str, params: Any) -> str:
+    connection = connections[alias]
+    if connection.needs_rollback:
+        return "(not explained: transaction aborted)"
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute(f'{connection.ops.explain_query_prefix()} {sql}', params)
+            return '\n'.join(' '.join(str(column) for column in row) for row in cursor.fetchall())
+    except Exception as exc:
+        return f"(EXPLAIN failed: {exc})"
+
+
+def merge_snapshots(snapshots: Iterable[List[Dict[str, Any]]]) -> Dict[str, Dict[str, Any]]:
+    """Combine per-worker snapshots into one entry per fingerprint."""
+    merged: Dict[str, Dict[str, Any]] = {}
+    for snapshot in snapshots:
+        for entry in snapshot:
+            into = merged.get(entry['fingerprint'])
+            if into is None:
+                merged[entry['fingerprint']] = {**entry, 'samples': list(entry['samples']), 'views': Counter(entry['views'])}
+                continue
+            into['count'] += entry['count']
+            into['total'] += entry['total']
+            into['max'] = max(into['max'], entry['max'])
+            into['rows'] += entry['rows']
+            into['samples'] += entry['samples']
+            into['views'].update(entry['views'])
+            into['explain'] = into['explain'] or entry['explain']
+            into['first_seen'] = min(into['first_seen'], entry['first_seen'])
+            into['last_seen'] = max(into['last_seen'], entry['last_seen'])
+    return merged
+
+
+REPORT_ORDERS = ('total', 'count', 'p95', 'max')
+
+
+def slow_query_report(order: str = 'total', limit: int = 20, snapshots=None) -> List[Dict[str, Any]]:
+    """Top fingerprints across all workers, times in milliseconds."""
+    if snapshots is None:
+        snapshots = slow_query_log.published()
+    rows = []
+    for entry in merge_snapshots(snapshots).values():
+        rows.append({
+            'fingerprint': entry['fingerprint'],
+            'sql': entry['sql'],
+            'count': entry['count'],
+            'total_ms': round(entry['total'] * 1000, 1),
+            'p50_ms': round(percentile(entry['samples'], 0.5) * 1000, 1),
+            'p95_ms': round(percentile(entry['samples'], 0.95) * 1000, 1),
+            'max_ms': round(entry['max'] * 1000, 1),
+            'avg_rows': round(entry['rows'] / entry['count'], 1) if entry['count'] else 0,
+            'views': dict(entry['views'].most_common(5)),
+            'explain': entry['explain'],
+            'last_seen': entry['last_seen'],
+        })
+    key = {'total': 'total_ms', 'count': 'count', 'p95': 'p95_ms', 'max': 'max_ms'}[order]
+    rows.sort(key=lambda row: row[key], reverse=True)
+    return rows[:limit]
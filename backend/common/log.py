@@ -0,0 +1,283 @@
+"""
+Logging pipeline.
+
+With ``LOG_QUEUE`` on, ``configure()`` (Django's LOGGING_CONFIG) applies
+LOGGING and then puts a ``QueueHandler`` in front of each configured
+logger's handlers. Request threads then only enqueue; one ``QueueListener``
+thread per process does the formatting and the file and console writes. The
+listener starts on the first record in each process, so it also runs in
+Gunicorn workers forked from a preloaded master. When the queue is full,
+records are dropped and counted rather than blocking the request. Admin mails
+stay on the request thread: their report reads the live request (user,
+session, body), which is only consistent before the response. Queued records
+carry a snapshot of the request's method and path instead.
+
+``RateLimitFilter`` lets a burst of identical warnings and errors through,
+then only samples them. ``DeduplicatedAdminEmailHandler`` sends one mail per
+distinct error and interval, shared across workers through the cache.
+"""
+
+import atexit
+import copy
+import hashlib
+import json
+import logging
+import logging.config
+import logging.handlers
+import os
+import queue
+import threading
+import time
+import traceback
+from datetime import datetime, timezone
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+
+from django.conf import settings
+from django.utils.log import AdminEmailHandler
+
+# Attributes every LogRecord has; anything else was passed with extra=
+RECORD_ATTRS = frozenset(vars(logging.LogRecord('', 0, '', 0, '', None, None))) | {'message', 'asctime'}
+
+
+class JSONFormatter(logging.Formatter):
+    """One JSON object per line, with any ``extra=`` fields included."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry: Dict[str, Any] = {
+            'time': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+            'module': record.module,
+            'line': record.lineno,
+            'process': record.process,
+            'thread': record.thread,
+        }
+        for key, value in record.__dict__.items():
+            if key in RECORD_ATTRS or key.startswith('_'):
+                continue
+            if key == 'request':
+                value = {'method': getattr(value, 'method', None), 'path': getattr(value, 'path', None)}
+            entry[key] = value
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry['exception'] = record.exc_text
+        if record.stack_info:
+            entry['stack'] = self.formatStack(record.stack_info)
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+class RateLimitFilter(logging.Filter):
+    """
+    Pass at most ``burst`` identical WARNING+ records (same logger, level and
+    call site) per ``period`` seconds, then only every ``sample``-th one. The
+    next record that passes carries the number of skipped ones as
+    ``record.suppressed``.
+    """
+
+    def __init__(self, burst: int = 10, period: float = 60.0, sample: int = 100) -> None:
+        super().__init__()
+        self.burst = burst
+        self.period = period
+        self.sample = sample
+        self.windows: Dict[Tuple, List[float]] = {}  # key -> [window start, seen, suppressed]
+        self.lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno < logging.WARNING:
+            return True
+        # One instance filters several handlers; decide once per record
+        decided = record.__dict__.get('_rate_limit_pass')
+        if decided is not None:
+            return decided
+        record._rate_limit_pass = self.decide(record)
+        return record._rate_limit_pass
+
+    def decide(self, record: logging.LogRecord) -> bool:
+        template = record.__dict__.get('_template', record.msg)
+        key = (record.name, record.levelno, record.pathname, record.lineno, str(template)[:200])
+        now = time.monotonic()
+        with self.lock:
+            window = self.windows.get(key)
+            if window is None or now - window[0] >= self.period:
+                if len(self.windows) > 10000:
+                    self.windows.clear()
+                suppressed = int(window[2]) if window else 0
+                self.windows[key] = window = [now, 0, 0]
+            else:
+                suppressed = 0
+            window[1] += 1
+            seen = window[1]
+            if seen > self.burst and (seen - self.burst) % self.sample:
+                window[2] += 1
+                return False
+            suppressed += int(window[2])
+            window[2] = 0
+        if suppressed:
+            record.suppressed = suppressed
+        return True
+
+
+class DeduplicatedAdminEmailHandler(AdminEmailHandler):
+    """
+    AdminEmailHandler that mails each distinct error (exception type and the
+    frame that raised it) at most once per ``interval`` seconds across all
+    workers; the next mail says how many were skipped in between.
+    """
+
+    def __init__(self, interval: int = 600, **kwargs: Any) -> None:
+        super().__init__(**kwargs)
+        self.interval = interval
+        self.local_sent: Dict[str, float] = {}
+        self.local_skipped: Dict[str, int] = {}
+        self.pending_note = threading.local()
+
+    @staticmethod
+    def signature(record: logging.LogRecord) -> str:
+        if record.exc_info and record.exc_info[2] is not None:
+            frame = traceback.extract_tb(record.exc_info[2])[-1]
+            origin = f'{record.exc_info[0].__name__}:{frame.filename}:{frame.lineno}'
+        else:
+            origin = f'{record.pathname}:{record.lineno}:{record.msg}'
+        return hashlib.sha1(f'{record.name}:{record.levelno}:{origin}'.encode()).hexdigest()
+
+    def should_send(self, signature: str) -> Tuple[bool, int]:
+        """Return whether to mail and how many duplicates were skipped since the last mail."""
+        from django.core.cache import cache
+
+        key = f'admin-mail:{signature}'
+        try:
+            if cache.add(key, 1, timeout=self.interval):
+                skipped = cache.get(f'{key}:skipped') or 0
+                cache.delete(f'{key}:skipped')
+                return True, skipped
+            cache.add(f'{key}:skipped', 0, timeout=self.interval * 2)
+            cache.incr(f'{key}:skipped')
+            return False, 0
+        except Exception:
+            # Cache down: deduplicate within this process only
+            now = time.monotonic()
+            if now - self.local_sent.get(signature, float('-inf')) >= self.interval:
+                self.local_sent[signature] = now
+                return True, self.local_skipped.pop(signature, 0)
+            self.local_skipped[signature] = self.local_skipped.get(signature, 0) + 1
+            return False, 0
+
+    def emit(self, record: logging.LogRecord) -> None:
+        send, skipped = self.should_send(self.signature(record))
+        if not send:
+            return
+        self.pending_note.text = (
+            f"{skipped} more occurrences of this error were not mailed in the last "
+            f"{self.interval}s.\n\n" if skipped else ''
+        )
+        super().emit(record)
+
+    def send_mail(self, subject: str, message: str, *args: Any, **kwargs: Any) -> None:
+        note = getattr(self.pending_note, 'text', '')
+        super().send_mail(subject, note + message, *args, **kwargs)
+
+
+class RequestSnapshot(NamedTuple):
+    """What queued records keep of ``record.request``"""
+    method: Optional[str]
+    path: Optional[str]
+
+
+class QueueListener(logging.handlers.QueueListener):
+    """Dispatches each record to the handlers of the QueueHandler that queued it."""
+
+    def __init__(self, log_queue: queue.Queue) -> None:
+        super().__init__(log_queue, respect_handler_level=True)
+
+    def handle(self, record: logging.LogRecord) -> None:
+        for handler in record._targets:
+            if record.levelno >= handler.level:
+                handler.handle(record)
+
+
+class QueueHandler(logging.handlers.QueueHandler):
+    """
+    Enqueue records for the per-process listener, which passes them on to
+    ``targets``. Never blocks: a full queue drops the record and the next
+    one that fits reports how many were lost.
+    """
+
+    _lock = threading.Lock()
+    _queue: Optional[queue.Queue] = None
+    _listener: Optional[QueueListener] = None
+    _pid: Optional[int] = None
+
+    def __init__(self, targets: List[logging.Handler], maxsize: int = 10000) -> None:
+        super().__init__(None)
+        self.targets = tuple(targets)
+        self.maxsize = maxsize
+        self.dropped = 0
+
+    @classmethod
+    def start_listener(cls, maxsize: int) -> queue.Queue:
+        with cls._lock:
+            if cls._pid != os.getpid():
+                # A forked child inherits the queue object but not the listener thread
+                cls._queue = queue.Queue(maxsize)
+                cls._listener = QueueListener(cls._queue)
+                cls._listener.start()
+                cls._pid = os.getpid()
+                atexit.register(_stop_listener, cls._listener, cls._pid)
+        return cls._queue
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Formatting happens in the listener; only freeze what may change meanwhile
+        record = copy.copy(record)
+        record._template = record.msg
+        record.msg, record.args = record.getMessage(), None
+        request = getattr(record, 'request', None)
+        if request is not None:
+            # The live request (lazy user and session) must not reach the listener thread
+            record.request = RequestSnapshot(getattr(request, 'method', None), getattr(request, 'path', None))
+        record._targets = self.targets
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        log_queue = self._queue if self._pid == os.getpid() else self.start_listener(self.maxsize)
+        if self.dropped:
+            record.dropped_records, self.dropped = self.dropped, 0
+        try:
+            log_queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1 + getattr(record, 'dropped_records', 0)
+
+
+def _stop_listener(listener: QueueListener, pid: int) -> None:
+    # Flush what is still queued; forked children inherit this callback too
+    if os.getpid() == pid and listener._thread is not None:
+        listener.stop()
+
+
+def queue_loggers(names: List[str], maxsize: int = 10000) -> None:
+    """Put the handlers of the named loggers ('' for root), except admin mails, behind QueueHandlers."""
+    shared: Dict[Tuple[int, ...], QueueHandler] = {}
+    for name in names:
+        logger = logging.getLogger(name or None)
+        handlers = [handler for handler in logger.handlers if not isinstance(handler, QueueHandler)]
+        direct = [handler for handler in handlers if isinstance(handler, AdminEmailHandler)]
+        queued = [handler for handler in handlers if handler not in direct]
+        if not queued:
+            continue
+        key = tuple(id(handler) for handler in queued)
+        if key not in shared:
+            shared[key] = QueueHandler(queued, maxsize)
+        logger.handlers = [shared[key], *direct]
+
+
+def configure(logging_settings: Dict[str, Any]) -> None:
+    """LOGGING_CONFIG entry point: dictConfig, then queue the handlers when LOG_QUEUE is set."""
+    if not logging_settings:
+        return
+    logging.config.dictConfig(logging_settings)
+    if getattr(settings, 'LOG_QUEUE', False):
+        names = [*logging_settings.get('loggers', {})]
+        if 'root' in logging_settings:
+            names.append('')
+        queue_loggers(names, settings.LOG_QUEUE_SIZE)
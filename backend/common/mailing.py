@@ -0,0 +1,334 @@
+"""
+Newsletter campaign sending.
+
+``send_campaign()`` first materializes one CampaignDelivery per subscribed
+recipient (streamed from a server-side cursor), then walks the pending
+deliveries in id order and hands them to a ``ParallelSender``: a fixed set of
+worker threads, each keeping one SMTP connection open for all its messages,
+throttled by a shared token bucket. Delivery state is flushed every
+``flush_every`` results, so a crash can resend at most that many messages.
+Deliveries that failed fewer than NEWSLETTER_MAX_ATTEMPTS times stay pending
+and are retried in further passes, each after a longer pause.
+
+A run holds an advisory lock on the campaign (PostgreSQL), so a second run
+of the same campaign is refused instead of sending duplicates, and so is a
+campaign that was already sent. Every batch re-reads the recipients'
+subscriptions: deliveries to people who unsubscribed meanwhile are cancelled.
+"""
+
+import hashlib
+import logging
+import smtplib
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from contextlib import contextmanager
+from itertools import islice
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.db import connections
+from django.db.models import F
+from django.utils import timezone
+
+from .models import Campaign, CampaignDelivery, Newsletter
+
+logger = logging.getLogger(__name__)
+
+# Errors after which the connection is dropped and the message retried once
+RECONNECT_ERRORS = (smtplib.SMTPServerDisconnected, ConnectionError, TimeoutError)
+# Campaign states a run may start from
+SENDABLE_STATUSES = ('draft', 'sending')
+# Passes over deliveries that failed and may be retried, and the pause before
+# the first of them (seconds, doubled for each further pass)
+RETRY_PASSES = 3
+RETRY_DELAY = 5.0
+
+
+class CampaignError(Exception):
+    pass
+
+
+class RateLimiter:
+    """Thread-safe token bucket; ``rate`` tokens per second, 0 disables it."""
+
+    def __init__(self, rate: float, burst: Optional[float] = None) -> None:
+        self.rate = rate
+        self.capacity = burst or max(rate, 1.0)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self) -> None:
+        if self.rate <= 0:
+            return
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            # Reserve a token even if it is not there yet and wait for it
+            self.tokens -= 1
+            delay = -self.tokens / self.rate if self.tokens < 0 else 0.0
+        if delay:
+            time.sleep(delay)
+
+
+class ParallelSender:
+    """
+    Send messages over ``concurrency`` persistent SMTP connections.
+
+    Use as a context manager; ``send_all()`` yields ``(key, error)`` for every
+    ``(key, message)`` it was given, ``error`` being None on success.
+    """
+
+    def __init__(
+        self,
+        concurrency: int,
+        rate: float,
+        connection_factory: Callable[..., Any] = get_connection,
+    ) -> None:
+        self.concurrency = max(1, concurrency)
+        self.limiter = RateLimiter(rate)
+        self.connection_factory = connection_factory
+        self.local = threading.local()
+        self.connections: List[Any] = []
+        self.lock = threading.Lock()
+        self.executor: Optional[ThreadPoolExecutor] = None
+
+    def __enter__(self) -> 'ParallelSender':
+        self.executor = ThreadPoolExecutor(self.concurrency, thread_name_prefix='smtp')
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        if self.executor is not None:
+            self.executor.shutdown(wait=True)
+        with self.lock:
+            for connection in self.connections:
+                try:
+                    connection.close()
+                except Exception:
+                    pass
+            self.connections.clear()
+
+    def connection(self) -> Any:
+        connection = getattr(self.local, 'connection', None)
+        if connection is None:
+            connection = self.connection_factory(fail_silently=False)
+            connection.open()
+            self.local.connection = connection
+            with self.lock:
+                self.connections.append(connection)
+        return connection
+
+    def drop_connection(self) -> None:
+        connection = self.local.__dict__.pop('connection', None)
+        if connection is not None:
+            with self.lock:
+                self.connections.remove(connection)
+            try:
+                connection.close()
+            except Exception:
+                pass
+
+    def send_one(self, message: EmailMultiAlternatives) -> None:
+        self.limiter.acquire()
+        try:
+            message.connection = self.connection()
+            message.send()
+        except RECONNECT_ERRORS:
+            # The server closed an idle or exhausted connection, retry on a new one
+            self.drop_connection()
+            message.connection = self.connection()
+            message.send()
+
+    def send_all(self, messages: Iterable[Tuple[Any, EmailMultiAlternatives]]) -> Iterator[Tuple[Any, Optional[str]]]:
+        assert self.executor is not None, "ParallelSender must be used as a context manager"
+        in_flight: Dict[Future, Any] = {}
+        source = iter(messages)
+        # Keep a bounded window of submitted messages so large campaigns stream
+        window = self.concurrency * 4
+        while True:
+            for key, message in islice(source, window - len(in_flight)):
+                in_flight[self.executor.submit(self.send_one, message)] = key
+            if not in_flight:
+                return
+            done: Set[Future] = wait(in_flight, return_when=FIRST_COMPLETED).done
+            for future in done:
+                key = in_flight.pop(future)
+                error = future.exception()
+                yield key, (f'{type(error).__name__}: {error}' if error else None)
+
+
+def build_message(campaign: Campaign, email: str) -> EmailMultiAlternatives:
+    message = EmailMultiAlternatives(
+        subject=campaign.subject,
+        body=campaign.body_text,
+        from_email=campaign.from_email or settings.DEFAULT_FROM_EMAIL,
+        to=[email],
+    )
+    if campaign.body_html:
+        message.attach_alternative(campaign.body_html, 'text/html')
+    return message
+
+
+def enqueue_recipients(campaign: Campaign, batch_size: int = 2000) -> int:
+    """
+    Create a pending delivery for every subscribed address and return how
+    many subscribers were scanned. Streams the subscribers with a server-side
+    cursor; existing deliveries are kept, so this is safe to repeat when resuming.
+    """
+    subscribers = (
+        Newsletter.objects.filter(is_subscribed=True)
+        .order_by('id')
+        .values_list('id', 'email')
+        .iterator(chunk_size=batch_size)
+    )
+    scanned = 0
+    while True:
+        chunk = list(islice(subscribers, batch_size))
+        if not chunk:
+            return scanned
+        CampaignDelivery.objects.bulk_create(
+            [CampaignDelivery(campaign=campaign, subscriber_id=pk, email=email) for pk, email in chunk],
+            ignore_conflicts=True,
+        )
+        scanned += len(chunk)
+
+
+class DeliveryRecorder:
+    """Buffer send results and write them back in a few set-based UPDATEs"""
+
+    def __init__(self, max_attempts: int) -> None:
+        self.max_attempts = max_attempts
+        self.sent: List[int] = []
+        self.failed: Dict[str, List[int]] = {}
+        self.totals = {'sent': 0, 'failed': 0}  # failed: out of attempts
+
+    def add(self, delivery_id: int, error: Optional[str]) -> None:
+        if error is None:
+            self.sent.append(delivery_id)
+        else:
+            self.failed.setdefault(error, []).append(delivery_id)
+
+    def __len__(self) -> int:
+        return len(self.sent) + sum(len(ids) for ids in self.failed.values())
+
+    def flush(self) -> None:
+        if self.sent:
+            CampaignDelivery.objects.filter(id__in=self.sent).update(
+                state='sent', sent_at=timezone.now(), attempts=F('attempts') + 1, error=None,
+            )
+            self.totals['sent'] += len(self.sent)
+            self.sent = []
+        for error, ids in self.failed.items():
+            deliveries = CampaignDelivery.objects.filter(id__in=ids)
+            deliveries.update(attempts=F('attempts') + 1, error=error[:1000])
+            self.totals['failed'] += deliveries.filter(attempts__gte=self.max_attempts).update(state='failed')
+            logger.warning("Campaign delivery failed for %d recipients: %s", len(ids), error)
+        self.failed = {}
+
+
+@contextmanager
+def campaign_lock(campaign: Campaign, using: str = 'default') -> Iterator[None]:
+    """
+    Hold a session-level advisory lock on ``campaign`` for the duration of a
+    run (no transaction stays open meanwhile); CampaignError if another run has it.
+    """
+    connection = connections[using]
+    if connection.vendor != 'postgresql':
+        yield
+        return
+    key = int.from_bytes(hashlib.blake2b(f'campaign:{campaign.pk}'.encode(), digest_size=8).digest(), 'big', signed=True)
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT pg_try_advisory_lock(%s)', [key])
+        if not cursor.fetchone()[0]:
+            raise CampaignError(f"Campaign {campaign.pk} is being sent by another run")
+    try:
+        yield
+    finally:
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT pg_advisory_unlock(%s)', [key])
+
+
+def send_campaign(
+    campaign: Campaign,
+    concurrency: Optional[int] = None,
+    rate: Optional[float] = None,
+    batch_size: int = 1000,
+    flush_every: int = 50,
+    connection_factory: Callable[..., Any] = get_connection,
+) -> Dict[str, int]:
+    """
+    Send (or resume sending) ``campaign`` and return recipient/sent/failed/cancelled
+    counts, and how many failed deliveries are still pending for a retry
+    ('retryable', left for the next run once the retry passes are used up).
+    Raises CampaignError when it is already sent or being sent.
+    """
+    concurrency = concurrency or settings.NEWSLETTER_SEND_CONCURRENCY
+    rate = settings.NEWSLETTER_SEND_RATE if rate is None else rate
+
+    with campaign_lock(campaign):
+        # Another run may have finished it while we waited for the lock
+        campaign.refresh_from_db(fields=['status'])
+        if campaign.status not in SENDABLE_STATUSES:
+            raise CampaignError(f"Campaign {campaign.pk} is {campaign.status}, it can only be sent once")
+        if campaign.status == 'draft':
+            campaign.status, campaign.started_at = 'sending', timezone.now()
+            campaign.save(update_fields=['status', 'started_at'])
+        recipients = enqueue_recipients(campaign)
+        logger.info("Campaign %s: %d subscribed recipients", campaign.pk, recipients)
+
+        recorder = DeliveryRecorder(settings.NEWSLETTER_MAX_ATTEMPTS)
+        pending = campaign.deliveries.filter(state='pending').order_by('id')
+        retryable = pending.filter(attempts__gt=0)
+        cancelled = 0
+        with ParallelSender(concurrency, rate, connection_factory) as sender:
+            for retry in range(RETRY_PASSES + 1):
+                if retry:
+                    waiting = retryable.count()
+                    if not waiting:
+                        break
+                    delay = RETRY_DELAY * 2 ** (retry - 1)
+                    logger.info("Campaign %s: retrying %d failed deliveries in %.0fs", campaign.pk, waiting, delay)
+                    time.sleep(delay)
+                cancelled += send_pending(campaign, pending, sender, recorder, batch_size, flush_every)
+
+        left = retryable.count()
+        if not pending.exists():
+            campaign.status, campaign.finished_at = 'sent', timezone.now()
+            campaign.save(update_fields=['status', 'finished_at'])
+    return {'recipients': recipients, **recorder.totals, 'retryable': left, 'cancelled': cancelled}
+
+
+def send_pending(
+    campaign: Campaign,
+    pending: Any,
+    sender: ParallelSender,
+    recorder: DeliveryRecorder,
+    batch_size: int,
+    flush_every: int,
+) -> int:
+    """One pass over the ``pending`` deliveries in id order; returns how many were cancelled."""
+    cancelled = 0
+    last_id = 0
+    while True:
+        batch = list(
+            pending.filter(id__gt=last_id)
+            .values_list('id', 'email', 'subscriber__is_subscribed')[:batch_size]
+        )
+        if not batch:
+            return cancelled
+        last_id = batch[-1][0]
+        unsubscribed = [delivery_id for delivery_id, _, subscribed in batch if not subscribed]
+        if unsubscribed:
+            cancelled += CampaignDelivery.objects.filter(id__in=unsubscribed).update(state='cancelled')
+        messages = (
+            (delivery_id, build_message(campaign, email))
+            for delivery_id, email, subscribed in batch if subscribed
+        )
+        for delivery_id, error in sender.send_all(messages):
+            recorder.add(delivery_id, error)
+            if len(recorder) >= flush_every:
+                recorder.flush()
+        recorder.flush()
@@ -0,0 +1,148 @@
+import asyncio
+import re
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from common.traffic import (
+    PERCENTILES, HTTPClient, TrafficReport, analyze, compare, log_files, parse_entries, read_logs, replay, spread,
+)
+
+
+def ms(value) -> str:
+    return f'{value:.1f}' if value is not None else '-'
+
+
+class Command(BaseCommand):
+    help = (
+        "Per-endpoint latency percentiles and throughput from Gunicorn/nginx "
+        "access logs, replay of a logged traffic mix against a running instance, "
+        "and comparison of two saved reports."
+    )
+
+    def add_arguments(self, parser):
+        subcommands = parser.add_subparsers(dest='action', required=True)
+
+        analyze_parser = subcommands.add_parser('analyze', help="Report latency per endpoint and time window")
+        analyze_parser.add_argument('logs', nargs='+', help="Log files or globs, e.g. 'logs/access.log*'")
+        analyze_parser.add_argument('--window', type=int, default=60, help="Seconds per throughput window")
+        analyze_parser.add_argument('--limit', type=int, default=20, help="Endpoints to print")
+        analyze_parser.add_argument('--max-endpoints', type=int, default=200,
+                                    help="Endpoints tracked; the rest count as 'other'")
+        analyze_parser.add_argument('--output', help="Save the report as JSON for compare")
+
+        replay_parser = subcommands.add_parser('replay', help="Replay the requests of access logs")
+        replay_parser.add_argument('logs', nargs='+')
+        replay_parser.add_argument('--target', default='http://127.0.0.1:8000', help="Base URL of the instance")
+        replay_parser.add_argument('--speedup', type=float, default=1.0, help="e.g. 10 replays an hour in 6 minutes")
+        replay_parser.add_argument('--concurrency', type=int, default=50, help="Most requests in flight")
+        replay_parser.add_argument('--methods', nargs='+', default=['GET', 'HEAD'],
+                                   help="Methods to replay; logs have no request bodies")
+        replay_parser.add_argument('--exclude', default=r'/stream/', help="Regex of paths to leave out")
+        replay_parser.add_argument('--header', action='append', default=[],
+                                   help="Extra header, e.g. 'Authorization: Basic <key>'")
+        replay_parser.add_argument('--host', help="Host header (default: first ALLOWED_HOSTS entry)")
+        replay_parser.add_argument('--timeout', type=float, default=30.0)
+        replay_parser.add_argument('--window', type=int, default=10)
+        replay_parser.add_argument('--output', help="Save the report as JSON for compare")
+
+        compare_parser = subcommands.add_parser('compare', help="Compare two saved reports")
+        compare_parser.add_argument('baseline')
+        compare_parser.add_argument('candidate')
+        compare_parser.add_argument('--min-count', type=int, default=20,
+                                    help="Skip endpoints with fewer timed requests in either report")
+        compare_parser.add_argument('--threshold', type=float, default=10.0,
+                                    help="p95 increase in percent that counts as a regression")
+        compare_parser.add_argument('--fail-on-regression', action='store_true')
+
+    def handle(self, *args: Any, **options: Any) -> None:
+        getattr(self, options['action'])(options)
+
+    def analyze(self, options: Dict[str, Any]) -> None:
+        started = time.perf_counter()
+        report = analyze(log_files(options['logs']), options['window'], options['max_endpoints'])
+        if not report.requests:
+            raise CommandError(f"No access-log lines found ({report.skipped} lines skipped)")
+        self.stdout.write(
+            f"{report.requests} requests over {report.duration:.0f}s in {time.perf_counter() - started:.1f}s "
+            f"({report.skipped} other lines skipped)"
+        )
+        self.print_report(report, options['limit'])
+        if options['output']:
+            report.save(options['output'])
+            self.stdout.write(f"Saved to {options['output']}")
+
+    def replay(self, options: Dict[str, Any]) -> None:
+        headers = {}
+        for header in options['header']:
+            name, _, value = header.partition(':')
+            headers[name.strip()] = value.strip()
+        host = options['host'] or next(
+            (host.lstrip('.') for host in settings.ALLOWED_HOSTS if host not in ('*', '')), None
+        )
+        methods = {method.upper() for method in options['methods']}
+        exclude = re.compile(options['exclude']) if options['exclude'] else None
+        entries = spread(
+            entry for entry in parse_entries(read_logs(log_files(options['logs'])))
+            if entry.method in methods and not (exclude and exclude.search(entry.target))
+        )
+        client = HTTPClient(options['target'], host, headers, options['timeout'])
+        report = TrafficReport(options['window'], source=f"replay x{options['speedup']:g} of {', '.join(options['logs'])}")
+        self.stdout.write(f"Replaying against {options['target']} at {options['speedup']:g}x")
+        stats = asyncio.run(replay(
+            entries, client, options['speedup'], options['concurrency'], report, self.stdout.write,
+        ))
+        if not stats['sent']:
+            raise CommandError("No requests to replay")
+        self.stdout.write(
+            f"{stats['sent']} requests in {stats['elapsed']:.1f}s ({stats['sent'] / stats['elapsed']:.1f}/s), "
+            f"{stats['failed']} connection failures, {stats['late']} sent over 100ms late "
+            f"(max {stats['max_lag'] * 1000:.0f}ms; raise --concurrency if the target keeps up)"
+        )
+        self.print_report(report, 20)
+        if options['output']:
+            report.save(options['output'])
+            self.stdout.write(f"Saved to {options['output']}")
+
+    def compare(self, options: Dict[str, Any]) -> None:
+        baseline, candidate = TrafficReport.load(options['baseline']), TrafficReport.load(options['candidate'])
+        rows = compare(baseline, candidate, options['min_count'], options['threshold'])
+        self.stdout.write(f"baseline:  {baseline.source}\ncandidate: {candidate.source}")
+        self.stdout.write(f"{'endpoint':<48} {'req/s':>15} {'p50 ms':>15} {'p95 ms':>15} {'p99 ms':>15} {'p95':>8}")
+        for row in rows:
+            line = f"{row['endpoint'][:48]:<48} {row['rps'][0]:>7.1f}→{row['rps'][1]:<7.1f}"
+            for key in ('p50', 'p95', 'p99'):
+                line += f" {ms(row[key][0]):>7}→{ms(row[key][1]):<7}"
+            line += f" {row['p95_change']:>+7.0f}%"
+            self.stdout.write(self.style.ERROR(line) if row['regressed'] else line)
+        regressed = [row['endpoint'] for row in rows if row['regressed']]
+        only = set(baseline.endpoints) ^ set(candidate.endpoints)
+        if only:
+            self.stdout.write(f"{len(only)} endpoints appear in one report only")
+        if regressed and options['fail_on_regression']:
+            raise CommandError(f"p95 regressed over {options['threshold']:g}% on: {', '.join(regressed)}")
+        self.stdout.write(f"{len(regressed)} of {len(rows)} endpoints regressed over {options['threshold']:g}%")
+
+    def print_report(self, report: TrafficReport, limit: int) -> None:
+        self.stdout.write(f"{'endpoint':<48} {'count':>8} {'req/s':>8} {'p50':>8} {'p95':>8} {'p99':>8} {'max':>8} {'5xx':>6}")
+        ranked = sorted(report.endpoints.items(), key=lambda item: -item[1].count)
+        for name, histogram in ranked[:limit]:
+            p50, p95, p99 = (histogram.percentile(fraction) for fraction in PERCENTILES)
+            self.stdout.write(
+                f"{name[:48]:<48} {histogram.count:>8} {histogram.count / report.duration:>8.2f} "
+                f"{ms(p50):>8} {ms(p95):>8} {ms(p99):>8} {ms(histogram.max if histogram.timed else None):>8} "
+                f"{histogram.errors:>6}"
+            )
+        self.stdout.write(f"\nPer {report.window}s window (all endpoints, ms):")
+        for start, histogram in sorted(report.windows.items()):
+            p50, p95, p99 = (histogram.percentile(fraction) for fraction in PERCENTILES)
+            stamp = datetime.fromtimestamp(start, timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+            # The first and last windows are only partly covered by the log
+            covered = max(1.0, min(start + report.window, report.last) - max(start, report.first))
+            self.stdout.write(
+                f"  {stamp}  {histogram.count:>7} req  {histogram.count / covered:>8.2f}/s  "
+                f"p50 {ms(p50):>7}  p95 {ms(p95):>7}  p99 {ms(p99):>7}  5xx {histogram.errors}"
+            )
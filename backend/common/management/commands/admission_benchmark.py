@@ -0,0 +1,236 @@
+import asyncio
+import itertools
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, Optional
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from common.models import Lead
+from common.traffic import HTTPClient, LatencyHistogram
+
+FAILED = 599
+# Leads the benchmark submits, deleted again when it is done
+EMAIL_DOMAIN = 'admission-benchmark.example.com'
+
+
+def ms(value) -> str:
+    return f'{value:.0f}' if value is not None else '-'
+
+
+class Results:
+    """Latencies of one request kind, split by outcome"""
+
+    def __init__(self) -> None:
+        self.admitted = LatencyHistogram()
+        self.shed = LatencyHistogram()
+        self.statuses: Counter = Counter()
+        self.not_sent = 0
+
+    def add(self, status: int, elapsed_ms: float) -> None:
+        self.statuses[status] += 1
+        if status == 503:
+            self.shed.add(elapsed_ms)
+        elif status < 500:
+            self.admitted.add(elapsed_ms)
+
+
+class Command(BaseCommand):
+    help = (
+        "Overload a local Gunicorn (started with the repo's gunicorn.conf.py) "
+        "with an open-loop request rate above its measured capacity, once "
+        "without and once with admission control, and report latency "
+        "percentiles of admitted and shed requests and of health checks. "
+        "A share of the load is lead-form POSTs, which create leads in the "
+        "configured database; they are deleted afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=2)
+        parser.add_argument('--path', default='/backend/api/v1/leads/', help="Low priority endpoint to load")
+        parser.add_argument('--form-path', default='/backend/api/v1/leads/', help="Lead form endpoint to POST to")
+        parser.add_argument('--form-share', type=float, default=0.2,
+                            help="Share of the offered rate sent as lead-form POSTs (1 = a lead-form spike)")
+        parser.add_argument('--overload', type=float, default=2.0, help="Offered rate as a multiple of capacity")
+        parser.add_argument('--duration', type=float, default=20.0, help="Seconds of load per run")
+        parser.add_argument('--calibrate', type=float, default=5.0, help="Seconds spent measuring capacity")
+        parser.add_argument('--health-rate', type=float, default=5.0, help="Health checks per second")
+        parser.add_argument('--budget-ms', type=int, default=settings.ADMISSION_QUEUE_BUDGET_MS)
+        parser.add_argument('--max-in-flight', type=int, default=1000,
+                            help="Client-side limit on open requests; beyond it requests are not sent")
+        parser.add_argument('--api-key', default=settings.BASIC_API_KEY)
+        parser.add_argument('--timeout', type=float, default=30.0)
+        parser.add_argument('--seed', type=int, default=1)
+
+    def handle(self, *args: Any, **options: Any) -> None:
+        if not options['api_key']:
+            raise CommandError("Pass --api-key (or set BASIC_API_KEY)")
+        self.options = options
+        self.rng = random.Random(options['seed'])
+        self.submitted = itertools.count()
+        try:
+            self.run()
+        finally:
+            Lead.objects.filter(email__endswith=f'@{EMAIL_DOMAIN}').delete()
+
+    def run(self) -> None:
+        options = self.options
+        rate: Optional[float] = None
+        for enabled in (False, True):
+            label = 'admission control on' if enabled else 'admission control off'
+            with self.server(enabled) as base_url:
+                client = HTTPClient(base_url, None, {
+                    'Authorization': f"Basic {options['api_key']}", 'X-Forwarded-Proto': 'https',
+                }, options['timeout'])
+                if rate is None:
+                    capacity = asyncio.run(self.capacity(client))
+                    rate = capacity * options['overload']
+                    self.stdout.write(
+                        f"Capacity {capacity:.0f} req/s with {options['workers']} workers, "
+                        f"offering {rate:.0f} req/s for {options['duration']:.0f}s"
+                    )
+                results = asyncio.run(self.load(client, rate))
+            self.report(label, results)
+
+    @contextmanager
+    def server(self, admission: bool) -> Iterator[str]:
+        with socket.socket() as probe:
+            probe.bind(('127.0.0.1', 0))
+            port = probe.getsockname()[1]
+        env = {
+            **os.environ,
+            'GUNICORN_BIND': f'127.0.0.1:{port}',
+            'GUNICORN_WORKERS': str(self.options['workers']),
+            'GUNICORN_WORKER_CLASS': 'sync',
+            'GUNICORN_ACCESS_LOG': '/dev/null',
+            'GUNICORN_LOG_LEVEL': 'warning',
+            'ADMISSION_CONTROL': str(admission),
+            'ADMISSION_QUEUE_BUDGET_MS': str(self.options['budget_ms']),
+            # Keep the per-key throttle out of the measurement
+            'API_KEY_DEFAULT_RATE': '1000000/second',
+        }
+        with tempfile.TemporaryFile() as log:
+            process = subprocess.Popen(
+                [sys.executable, '-m', 'gunicorn', 'backend.wsgi:application', '-c', 'gunicorn.conf.py'],
+                cwd=settings.BASE_DIR, env=env, stdout=log, stderr=subprocess.STDOUT,
+            )
+            try:
+                base_url = f'http://127.0.0.1:{port}'
+                if not asyncio.run(self.ready(base_url)):
+                    log.seek(0)
+                    raise CommandError(f"Gunicorn did not start:\n{log.read().decode(errors='replace')[-2000:]}")
+                yield base_url
+            finally:
+                process.terminate()
+                process.wait(timeout=30)
+
+    async def ready(self, base_url: str) -> bool:
+        client = HTTPClient(base_url, None, {'X-Forwarded-Proto': 'https'}, 5)
+        deadline = time.monotonic() + 60
+        while time.monotonic() < deadline:
+            try:
+                if await client.request('GET', '/backend/health/') < 500:
+                    return True
+            except (OSError, asyncio.TimeoutError, ValueError, IndexError, asyncio.IncompleteReadError):
+                pass
+            await asyncio.sleep(0.5)
+        return False
+
+    def headers(self) -> Dict[str, str]:
+        # A stamp like nginx's, and one address per visitor as nginx would forward it
+        return {
+            'X-Request-Start': f't={time.time():.3f}',
+            'X-Forwarded-For': f'10.{self.rng.randrange(256)}.{self.rng.randrange(256)}.{self.rng.randrange(1, 255)}',
+        }
+
+    def form(self) -> bytes:
+        number = next(self.submitted)
+        return json.dumps({
+            'full_name': f'Benchmark {number}', 'position': 'CTO', 'company_name': 'Benchmark',
+            'email': f'lead-{number}@{EMAIL_DOMAIN}', 'source': 'website',
+        }).encode()
+
+    async def send(self, client: HTTPClient, target: str, results: Results, method: str = 'GET') -> None:
+        headers, body = self.headers(), b''
+        if method == 'POST':
+            headers['Content-Type'] = 'application/json'
+            body = self.form()
+        started = time.perf_counter()
+        try:
+            status = await client.request(method, target, headers, body)
+        except (OSError, asyncio.TimeoutError, ValueError, IndexError, asyncio.IncompleteReadError):
+            status = FAILED
+        results.add(status, (time.perf_counter() - started) * 1000)
+
+    async def capacity(self, client: HTTPClient) -> float:
+        """Requests per second served by closed-loop clients, one per worker."""
+        results = Results()
+        deadline = time.monotonic() + self.options['calibrate']
+
+        async def worker() -> None:
+            while time.monotonic() < deadline:
+                await self.send(client, self.options['path'], results)
+
+        started = time.monotonic()
+        await asyncio.gather(*(worker() for _ in range(self.options['workers'])))
+        unexpected = {status: count for status, count in results.statuses.items() if status >= 300}
+        if unexpected:
+            raise CommandError(f"{self.options['path']} answered {unexpected} while measuring capacity")
+        client.close()
+        return results.admitted.count / (time.monotonic() - started)
+
+    async def load(self, client: HTTPClient, rate: float) -> Dict[str, Results]:
+        """Poisson arrivals at ``rate`` (plus health checks), whatever the server's pace."""
+        share = min(max(self.options['form_share'], 0.0), 1.0)
+        results = {'api': Results(), 'form': Results(), 'health': Results()}
+        targets = {'api': self.options['path'], 'form': self.options['form_path'], 'health': '/backend/health/'}
+        rates = {'api': rate * (1 - share), 'form': rate * share, 'health': self.options['health_rate']}
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        due = {kind: started + self.rng.expovariate(rates[kind]) for kind in rates if rates[kind]}
+        pending: set = set()
+        while True:
+            kind = min(due, key=due.get)
+            if due[kind] - started >= self.options['duration']:
+                break
+            await asyncio.sleep(max(0.0, due[kind] - loop.time()))
+            due[kind] += self.rng.expovariate(rates[kind])
+            if len(pending) >= self.options['max_in_flight']:
+                results[kind].not_sent += 1
+                continue
+            method = 'POST' if kind == 'form' else 'GET'
+            task = asyncio.create_task(self.send(client, targets[kind], results[kind], method))
+            pending.add(task)
+            task.add_done_callback(pending.discard)
+        if pending:
+            await asyncio.wait(pending)
+        client.close()
+        return results
+
+    def report(self, label: str, results: Dict[str, Results]) -> None:
+        self.stdout.write(f"\n{label}")
+        self.stdout.write(f"  {'':<8} {'sent':>7} {'served':>7} {'shed':>7} {'failed':>7} "
+                          f"{'p50':>7} {'p95':>7} {'p99':>7} {'max':>7}  (ms, served requests)")
+        for kind, result in results.items():
+            if not result.statuses and not result.not_sent:
+                continue
+            served = result.admitted
+            failed = sum(count for status, count in result.statuses.items() if status >= 500 and status != 503)
+            self.stdout.write(
+                f"  {kind:<8} {sum(result.statuses.values()):>7} {served.count:>7} {result.shed.count:>7} "
+                f"{failed:>7} {ms(served.percentile(0.5)):>7} {ms(served.percentile(0.95)):>7} "
+                f"{ms(served.percentile(0.99)):>7} {ms(served.max if served.count else None):>7}"
+            )
+            if result.shed.count:
+                self.stdout.write(f"  {'':<8} shed answers: p99 {ms(result.shed.percentile(0.99))}ms")
+            if result.not_sent:
+                self.stdout.write(f"  {'':<8} {result.not_sent} not sent (--max-in-flight reached)")
@@ -0,0 +1,52 @@
+from typing import Any
+
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+
+from common.models import APIKey, validate_rate
+
+
+class Command(BaseCommand):
+    help = "Create, list and revoke per-client API keys."
+
+    def add_arguments(self, parser):
+        subcommands = parser.add_subparsers(dest='action', required=True)
+
+        create = subcommands.add_parser('create', help="Create a key and print it once")
+        create.add_argument('name')
+        create.add_argument('--rate', default=None, help="e.g. 100/minute (default: API_KEY_DEFAULT_RATE)")
+        create.add_argument('--daily-quota', type=int, default=None,
+                            help="Requests per UTC day (default: API_KEY_DEFAULT_DAILY_QUOTA)")
+
+        subcommands.add_parser('list', help="List keys")
+
+        revoke = subcommands.add_parser('revoke', help="Revoke a key by its prefix")
+        revoke.add_argument('prefix')
+
+    def handle(self, *args: Any, **options: Any) -> None:
+        getattr(self, options['action'])(options)
+
+    def create(self, options: Any) -> None:
+        if options['rate']:
+            try:
+                validate_rate(options['rate'])
+            except ValidationError as error:
+                raise CommandError(f"--rate: {error.messages[0]}")
+        api_key, key = APIKey.generate(options['name'], rate=options['rate'], daily_quota=options['daily_quota'])
+        self.stdout.write(f"Created {api_key}. The key is shown only once:")
+        self.stdout.write(key)
+
+    def list(self, options: Any) -> None:
+        for api_key in APIKey.objects.order_by('created_at'):
+            self.stdout.write(
+                f"{api_key.prefix}  {api_key.name:<30} rate={api_key.rate or 'default'} "
+                f"quota={api_key.daily_quota if api_key.daily_quota is not None else 'default'} "
+                f"{'revoked ' + api_key.revoked_at.isoformat() if api_key.revoked_at else 'active'}"
+            )
+
+    def revoke(self, options: Any) -> None:
+        api_keys = list(APIKey.objects.filter(prefix=options['prefix'], revoked_at__isnull=True))
+        if len(api_keys) != 1:
+            raise CommandError(f"{len(api_keys)} active keys match prefix {options['prefix']}")
+        api_keys[0].revoke()
+        self.stdout.write(f"Revoked {api_keys[0]}")
@@ -0,0 +1,50 @@
+import difflib
+from pathlib import Path
+from typing import Any
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from common.schema import SCHEMA_FORMATS, generate_schema, read_stored_schema, write_schema
+
+
+class Command(BaseCommand):
+    help = (
+        "Generate the OpenAPI schema once and store it (plus .gz copies) for "
+        "StaticSchemaView. With --check, fail if the stored schema drifted from the code."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--root', default=None,
+                            help="Output directory (default: API_SCHEMA_ROOT)")
+        parser.add_argument('--check', action='store_true',
+                            help="Compare the stored schema with the live one instead of writing it")
+
+    def handle(self, *args: Any, **options: Any) -> None:
+        if not settings.API_DOCS_ENABLED:
+            raise CommandError("API_DOCS_ENABLED is off, there is no schema to build")
+
+        root = Path(options['root'] or settings.API_SCHEMA_ROOT)
+        documents = generate_schema()
+
+        if options['check']:
+            stored = read_stored_schema(root)
+            drifted = [fmt for fmt in SCHEMA_FORMATS if stored.get(fmt) != documents[fmt]]
+            if not drifted:
+                self.stdout.write(self.style.SUCCESS(f"Stored schema in {root} is up to date"))
+                return
+            if 'yaml' in stored:
+                diff = difflib.unified_diff(
+                    stored['yaml'].decode().splitlines(), documents['yaml'].decode().splitlines(),
+                    'stored', 'live', lineterm='', n=2,
+                )
+                self.stdout.write('\n'.join(list(diff)[:80]))
+            raise CommandError(
+                f"Stored schema ({', '.join(drifted)}) in {root} is missing or out of date, "
+                f"run: python manage.py build_schema"
+            )
+
+        write_schema(documents, root)
+        for fmt, content in documents.items():
+            self.stdout.write(f"{root / SCHEMA_FORMATS[fmt][0]}: {len(content)} bytes")
+        self.stdout.write(self.style.SUCCESS("Schema written"))
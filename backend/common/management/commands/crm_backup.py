@@ -0,0 +1,67 @@
+import os
+import time
+from typing import Any
+
+from django.core.management.base import BaseCommand, CommandError
+
+from common.backup import DEFAULT_MODELS, OPTIONAL_MODELS, BackupError, export, plan_truncate, restore
+
+
+class Command(BaseCommand):
+    help = (
+        "Export the CRM tables (leads, clients, newsletter subscribers, status "
+        "history, campaigns and their deliveries) to a "
+        "directory of compressed COPY chunks in parallel, or restore them from "
+        "one. Interrupted runs resume where they stopped."
+    )
+
+    def add_arguments(self, parser):
+        subcommands = parser.add_subparsers(dest='action', required=True)
+        jobs = min(8, os.cpu_count() or 1)
+
+        export_parser = subcommands.add_parser('export', help="Export the tables to a directory")
+        export_parser.add_argument('directory')
+        export_parser.add_argument('--jobs', type=int, default=jobs, help="Parallel connections")
+        export_parser.add_argument('--chunk-rows', type=int, default=100000, help="Rows per chunk file")
+        export_parser.add_argument('--compress-level', type=int, default=1, choices=range(1, 10),
+                                   help="gzip level; 1 is fastest")
+        export_parser.add_argument('--tables', nargs='+', default=list(DEFAULT_MODELS),
+                                   choices=DEFAULT_MODELS + OPTIONAL_MODELS,
+                                   help="Models to export, referenced ones first")
+
+        restore_parser = subcommands.add_parser('restore', help="Restore the tables from a directory")
+        restore_parser.add_argument('directory')
+        restore_parser.add_argument('--jobs', type=int, default=jobs, help="Parallel connections")
+        restore_parser.add_argument('--truncate', action='store_true',
+                                    help="Empty the exported tables first; fails if other tables reference them with rows")
+        restore_parser.add_argument('--plan', action='store_true',
+                                    help="Only print the tables --truncate would empty, one per line")
+        restore_parser.add_argument('--maintenance-work-mem', default='256MB',
+                                    help="Memory for each index build")
+
+    def handle(self, *args: Any, **options: Any) -> None:
+        started = time.perf_counter()
+        try:
+            if options['action'] == 'export':
+                manifest = export(
+                    options['directory'], options['tables'], max(1, options['jobs']),
+                    max(1, options['chunk_rows']), options['compress_level'], self.stdout.write,
+                )
+                chunks = [chunk for table in manifest['tables'] for chunk in table['chunks']]
+                rows = sum(chunk['rows'] for chunk in chunks)
+                size = sum(chunk['bytes'] for chunk in chunks)
+                self.stdout.write(self.style.SUCCESS(
+                    f"Exported {rows} rows in {len(chunks)} chunks ({size / 2 ** 20:.1f} MiB) "
+                    f"in {time.perf_counter() - started:.1f}s"
+                ))
+            elif options['plan']:
+                for table in plan_truncate(options['directory']):
+                    self.stdout.write(table)
+            else:
+                restore(
+                    options['directory'], max(1, options['jobs']), options['truncate'],
+                    options['maintenance_work_mem'], self.stdout.write,
+                )
+                self.stdout.write(self.style.SUCCESS(f"Restored in {time.perf_counter() - started:.1f}s"))
+        except BackupError as error:
+            raise CommandError(str(error))
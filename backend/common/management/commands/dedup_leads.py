@@ -0,0 +1,84 @@
+import time
+from typing import Any, List, Tuple
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from common.dedup import KEY_FIELDS, blocking_keys, cluster_leads, iter_duplicate_groups
+from common.models import Lead
+
+
+class Command(BaseCommand):
+    help = (
+        "Find duplicate lead clusters over the whole table in one streaming pass "
+        "over the indexed blocking keys, and optionally flag them."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rebuild-keys', action='store_true',
+                            help="Recompute the blocking keys of every lead first")
+        parser.add_argument('--apply', action='store_true',
+                            help="Point duplicate_of of every duplicate at its cluster's oldest lead")
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--show', type=int, default=10, help="Number of clusters to print")
+
+    def handle(self, *args: Any, **options: Any) -> None:
+        batch_size: int = options['batch_size']
+        if options['rebuild_keys']:
+            self.rebuild_keys(batch_size)
+
+        started = time.perf_counter()
+        rows = Lead.objects.order_by('id').values_list('id', *KEY_FIELDS).iterator(chunk_size=batch_size)
+        clusters = cluster_leads(rows)
+        groups = sorted(iter_duplicate_groups(clusters), key=lambda group: len(group[1]), reverse=True)
+        duplicates = sum(len(members) for _, members in groups)
+        self.stdout.write(
+            f"Scanned {len(clusters.parent)} leads in {time.perf_counter() - started:.1f}s: "
+            f"{len(groups)} clusters, {duplicates} duplicates"
+        )
+        for root, members in groups[:options['show']]:
+            self.stdout.write(f"  lead {root}: {len(members)} duplicates {members[:10]}")
+
+        if options['apply']:
+            self.stdout.write(f"Flagged {self.apply(groups, batch_size)} leads")
+
+    def rebuild_keys(self, batch_size: int) -> None:
+        fields = ('id', 'email', 'phone_number', 'full_name', 'company_name', *KEY_FIELDS)
+        changed: List[Lead] = []
+        total = 0
+        for lead_id, email, phone, name, company, *keys in (
+            Lead.objects.order_by('id').values_list(*fields).iterator(chunk_size=batch_size)
+        ):
+            fresh = blocking_keys(email, phone, name, company)
+            if tuple(keys) != fresh:
+                changed.append(Lead(id=lead_id, **dict(zip(KEY_FIELDS, fresh))))
+            if len(changed) >= batch_size:
+                total += self.flush_keys(changed)
+        total += self.flush_keys(changed)
+        self.stdout.write(f"Rebuilt blocking keys of {total} leads")
+
+    @staticmethod
+    def flush_keys(leads: List[Lead]) -> int:
+        count = len(leads)
+        if leads:
+            Lead.objects.bulk_update(leads, KEY_FIELDS)
+            leads.clear()
+        return count
+
+    @staticmethod
+    def apply(groups: List[Tuple[int, List[int]]], batch_size: int) -> int:
+        flagged = 0
+        pending: List[Lead] = []
+        for root, members in groups:
+            pending.append(Lead(id=root, duplicate_of_id=None))
+            pending.extend(Lead(id=member, duplicate_of_id=root) for member in members)
+            if len(pending) >= batch_size:
+                with transaction.atomic():
+                    Lead.objects.bulk_update(pending, ['duplicate_of'])
+                flagged += len(pending)
+                pending.clear()
+        if pending:
+            with transaction.atomic():
+                Lead.objects.bulk_update(pending, ['duplicate_of'])
+            flagged += len(pending)
+        return flagged
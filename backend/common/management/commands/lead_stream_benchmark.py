@@ -0,0 +1,148 @@
+import asyncio
+import json
+import statistics
+import threading
+import time
+from typing import Any, Dict, List
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from common.events import broker
+from common.models import APIKey
+
+STREAM_PATH = '/backend/api/v1/leads/stream/'
+
+
+def rss_kib() -> int:
+    with open('/proc/self/status') as status:
+        for line in status:
+            if line.startswith('VmRSS:'):
+                return int(line.split()[1])
+    return 0
+
+
+class StreamClient:
+    """One fake ASGI connection to the stream, recording when each event id arrived"""
+
+    def __init__(self, application, headers: List, host: str) -> None:
+        self.application = application
+        self.scope = {
+            'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1',
+            'method': 'GET', 'scheme': 'https', 'path': STREAM_PATH, 'raw_path': STREAM_PATH.encode(),
+            'query_string': b'', 'headers': headers, 'server': (host, 443), 'client': ('127.0.0.1', 0),
+        }
+        self.status = None
+        self.streaming = False
+        self.received: Dict[int, float] = {}
+        self.disconnect = asyncio.Event()
+        self.sent_request = False
+
+    async def receive(self) -> Dict[str, Any]:
+        if not self.sent_request:
+            self.sent_request = True
+            return {'type': 'http.request', 'body': b'', 'more_body': False}
+        await self.disconnect.wait()
+        return {'type': 'http.disconnect'}
+
+    async def send(self, message: Dict[str, Any]) -> None:
+        if message['type'] == 'http.response.start':
+            self.status = message['status']
+        elif message['type'] == 'http.response.body':
+            self.streaming = True
+            now = time.perf_counter()
+            for line in message.get('body', b'').split(b'\n'):
+                if line.startswith(b'data: {"id"'):
+                    self.received[json.loads(line[6:])['id']] = now
+
+    async def run(self) -> None:
+        await self.application(self.scope, self.receive, self.send)
+
+
+class Command(BaseCommand):
+    help = (
+        "Open many idle lead event streams against the ASGI application in this "
+        "process, then measure memory per client, idle CPU and how long one event "
+        "takes to reach every client."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--clients', type=int, default=2000)
+        parser.add_argument('--events', type=int, default=20, help="Events to publish")
+        parser.add_argument('--idle', type=float, default=10.0, help="Seconds to stay idle while measuring CPU")
+
+    def handle(self, *args: Any, **options: Any) -> None:
+        if options['clients'] > settings.LEAD_STREAM_MAX_CLIENTS:
+            raise CommandError(f"--clients is above LEAD_STREAM_MAX_CLIENTS ({settings.LEAD_STREAM_MAX_CLIENTS})")
+        api_key, key = (None, settings.BASIC_API_KEY) if settings.BASIC_API_KEY else APIKey.generate('stream-benchmark')
+        try:
+            asyncio.run(self.benchmark(key, options['clients'], options['events'], options['idle']))
+        finally:
+            if api_key is not None:
+                api_key.delete()
+
+    async def benchmark(self, key: str, count: int, events: int, idle: float) -> None:
+        from backend.asgi import application
+
+        host = next((host.lstrip('.') for host in settings.ALLOWED_HOSTS if host not in ('*', '')), 'localhost')
+        headers = [(b'host', host.encode()), (b'authorization', f'Basic {key}'.encode())]
+        rss_before = rss_kib()
+        clients = [StreamClient(application, headers, host) for _ in range(count)]
+        started = time.perf_counter()
+        tasks = [asyncio.create_task(client.run()) for client in clients]
+        while not all(client.streaming for client in clients):
+            failed = [client.status for client in clients if client.status not in (None, 200)]
+            if failed:
+                raise CommandError(f"{len(failed)} streams were refused, e.g. HTTP {failed[0]}")
+            await asyncio.sleep(0.05)
+        connect_time = time.perf_counter() - started
+        await asyncio.sleep(0.5)
+        rss_connected = rss_kib()
+        self.stdout.write(
+            f"{count} clients connected in {connect_time:.1f}s, "
+            f"{(rss_connected - rss_before) / count:.1f} KiB RSS per client"
+        )
+
+        cpu_started, wall_started = time.process_time(), time.perf_counter()
+        await asyncio.sleep(idle)
+        cpu = time.process_time() - cpu_started
+        self.stdout.write(
+            f"Idle for {time.perf_counter() - wall_started:.0f}s: {cpu * 1000:.0f}ms CPU "
+            f"({cpu / idle * 100:.1f}% of a core, heartbeat every {settings.LEAD_STREAM_HEARTBEAT:g}s)"
+        )
+
+        # Publish from a thread, as the LISTEN/poll thread does
+        base_id = 10 ** 15
+        published: Dict[int, float] = {}
+
+        def publish() -> None:
+            for n in range(events):
+                event_id = base_id + n
+                published[event_id] = time.perf_counter()
+                broker.publish(event_id, json.dumps({'id': event_id, 'benchmark': True}))
+                time.sleep(0.05)
+
+        thread = threading.Thread(target=publish)
+        thread.start()
+        deadline = time.perf_counter() + 30 + events * 0.05
+        while time.perf_counter() < deadline:
+            if all(len(client.received) >= events for client in clients):
+                break
+            await asyncio.sleep(0.05)
+        thread.join()
+
+        latencies = [
+            max(client.received.get(event_id, float('inf')) for client in clients) - at
+            for event_id, at in published.items()
+        ]
+        delivered = sum(len(client.received) for client in clients)
+        self.stdout.write(
+            f"{events} events to {count} clients: {delivered}/{events * count} delivered, "
+            f"time until the last client had an event p50 {statistics.median(latencies) * 1000:.1f}ms, "
+            f"max {max(latencies) * 1000:.1f}ms"
+        )
+
+        for client in clients:
+            client.disconnect.set()
+        await asyncio.wait(tasks, timeout=30)
+        self.stdout.write(f"Disconnected, {broker.subscribers} subscribers left")
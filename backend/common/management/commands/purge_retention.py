@@ -0,0 +1,61 @@
+from typing import Any
+
+from django.core.management.base import BaseCommand, CommandError
+
+from common.models import RetentionCheckpoint
+from common.retention import RetentionPurge, policies
+
+
+class Command(BaseCommand):
+    help = (
+        "Delete leads and newsletter subscribers past their retention period "
+        "(RETENTION_* settings) in small batches, resuming an interrupted run."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--policy', action='append', choices=sorted(policies()),
+                            help="Only these policies (default: all enabled)")
+        parser.add_argument('--dry-run', action='store_true', help="Count what would be deleted")
+        parser.add_argument('--restart', action='store_true',
+                            help="Start over with a fresh cutoff instead of resuming")
+        parser.add_argument('--batch-size', type=int, help="Rows per batch (default: RETENTION_BATCH_SIZE)")
+        parser.add_argument('--max-seconds', type=float,
+                            help="Stop after this long; the next run resumes")
+        parser.add_argument('--status', action='store_true', help="Show the latest run of each policy")
+
+    def handle(self, *args: Any, **options: Any) -> None:
+        if options['status']:
+            for checkpoint in RetentionCheckpoint.objects.order_by('policy'):
+                self.stdout.write(
+                    f"{checkpoint.policy:<12} cutoff {checkpoint.cutoff:%Y-%m-%d %H:%M}  "
+                    f"{checkpoint.deleted} deleted, {checkpoint.cascaded} related, {checkpoint.batches} batches, "
+                    f"{checkpoint.throttled_seconds:.0f}s throttled, last id {checkpoint.last_id}, "
+                    f"{'finished ' + checkpoint.finished_at.isoformat() if checkpoint.finished_at else 'unfinished'}"
+                )
+            return
+
+        selected = [policy for name, policy in sorted(policies().items())
+                    if not options['policy'] or name in options['policy']]
+        enabled = [policy for policy in selected if policy.days > 0]
+        for policy in selected:
+            if policy.days <= 0:
+                self.stdout.write(f"{policy.name}: disabled (set RETENTION_{policy.name.upper()}_DAYS)")
+        if not enabled:
+            if options['policy']:
+                raise CommandError("None of the selected policies is enabled")
+            return
+
+        for policy in enabled:
+            purge = RetentionPurge(policy, batch_size=options['batch_size'], progress=self.stdout.write)
+            if options['dry_run']:
+                counts = purge.dry_run(restart=options['restart'])
+                self.stdout.write(f"{policy.name} (older than {policy.days} days), would remove:")
+                for label, count in counts.items():
+                    self.stdout.write(f"  {count:>10}  {label}")
+                continue
+            checkpoint = purge.run(restart=options['restart'], max_seconds=options['max_seconds'])
+            self.stdout.write(self.style.SUCCESS(
+                f"{policy.name}: {checkpoint.deleted} deleted, {checkpoint.cascaded} related rows "
+                f"removed or detached in {checkpoint.batches} batches"
+                f"{'' if checkpoint.finished_at else ' (unfinished, run again to resume)'}"
+            ))
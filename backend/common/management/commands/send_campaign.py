@@ -0,0 +1,51 @@
+import time
+from typing import Any
+
+from django.core.management.base import BaseCommand, CommandError
+
+from common.mailing import CampaignError, send_campaign
+from common.models import Campaign
+
+
+class Command(BaseCommand):
+    help = (
+        "Send a newsletter campaign to all subscribed addresses. Re-running it "
+        "resumes an interrupted campaign without resending delivered messages; "
+        "a campaign that is sent or being sent by another run is refused."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('campaign_id', type=int)
+        parser.add_argument('--concurrency', type=int, default=None,
+                            help="Parallel SMTP connections (default: NEWSLETTER_SEND_CONCURRENCY)")
+        parser.add_argument('--rate', type=float, default=None,
+                            help="Messages per second, 0 for unlimited (default: NEWSLETTER_SEND_RATE)")
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help="Pending deliveries read per query")
+        parser.add_argument('--flush-every', type=int, default=50,
+                            help="Write delivery state back after this many results")
+
+    def handle(self, *args: Any, **options: Any) -> None:
+        try:
+            campaign = Campaign.objects.get(pk=options['campaign_id'])
+        except Campaign.DoesNotExist:
+            raise CommandError(f"Campaign {options['campaign_id']} does not exist")
+
+        started = time.perf_counter()
+        try:
+            totals = send_campaign(
+                campaign,
+                concurrency=options['concurrency'],
+                rate=options['rate'],
+                batch_size=options['batch_size'],
+                flush_every=options['flush_every'],
+            )
+        except CampaignError as error:
+            raise CommandError(str(error))
+        elapsed = time.perf_counter() - started
+        self.stdout.write(
+            f"Campaign {campaign.pk} ({campaign.status}): {totals['recipients']} recipients, "
+            f"{totals['sent']} sent, {totals['failed']} failed, {totals['retryable']} to retry, "
+            f"{totals['cancelled']} unsubscribed in {elapsed:.1f}s "
+            f"({totals['sent'] / elapsed if elapsed else 0:.0f} msg/s)"
+        )
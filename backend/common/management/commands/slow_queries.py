@@ -0,0 +1,51 @@
+import json
+from datetime import datetime, timezone
+from typing import Any
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from common.instrumentation import REPORT_ORDERS, slow_query_log, slow_query_report
+
+
+class Command(BaseCommand):
+    help = (
+        "Show the slowest query fingerprints published by the running workers "
+        "(needs a shared cache such as Redis), with the views that ran them and "
+        "an EXPLAIN sample."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--order', choices=REPORT_ORDERS, default='total')
+        parser.add_argument('--limit', type=int, default=10)
+        parser.add_argument('--json', action='store_true', help="Print the report as JSON")
+        parser.add_argument('--explain', action='store_true', help="Include the EXPLAIN samples")
+        parser.add_argument('--reset', action='store_true', help="Drop the published statistics")
+
+    def handle(self, *args: Any, **options: Any) -> None:
+        if options['reset']:
+            slow_query_log.clear_published()
+            self.stdout.write("Published slow query statistics cleared")
+            return
+
+        rows = slow_query_report(options['order'], options['limit'], slow_query_log.published(include_own=False))
+        if options['json']:
+            self.stdout.write(json.dumps(rows, indent=2, default=str))
+            return
+        if not rows:
+            self.stdout.write(f"No queries over {settings.SLOW_QUERY_MS:g}ms published yet")
+            return
+
+        for rank, row in enumerate(rows, 1):
+            last_seen = datetime.fromtimestamp(row['last_seen'], timezone.utc)
+            self.stdout.write(
+                f"{rank}. {row['count']}x total {row['total_ms']:.0f}ms, p50 {row['p50_ms']:.0f}ms, "
+                f"p95 {row['p95_ms']:.0f}ms, max {row['max_ms']:.0f}ms, {row['avg_rows']:g} rows "
+                f"(last {last_seen:%Y-%m-%d %H:%M:%S})"
+            )
+            self.stdout.write(f"   {row['fingerprint'][:300]}")
+            for view, count in row['views'].items():
+                self.stdout.write(f"   {count:>6}  {view}")
+            if options['explain'] and row['explain']:
+                for line in row['explain'].splitlines():
+                    self.stdout.write(f"   | {line}")
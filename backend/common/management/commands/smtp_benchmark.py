@@ -0,0 +1,91 @@
+import logging
+import socket
+import time
+from typing import Any, Dict
+
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.core.management.base import BaseCommand, CommandError
+
+from common.mailing import ParallelSender
+
+
+class CountingHandler:
+    """aiosmtpd handler that accepts everything, optionally after a delay"""
+
+    def __init__(self, delay: float) -> None:
+        self.delay = delay
+        self.received = 0
+
+    async def handle_DATA(self, server, session, envelope) -> str:
+        if self.delay:
+            import asyncio
+            await asyncio.sleep(self.delay)
+        self.received += 1
+        return '250 Message accepted for delivery'
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure ParallelSender throughput against a local aiosmtpd server "
+        "(pip install aiosmtpd) for one or more concurrency levels."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--messages', type=int, default=2000)
+        parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 4, 8])
+        parser.add_argument('--rate', type=float, default=0, help="Messages per second, 0 for unlimited")
+        parser.add_argument('--latency-ms', type=float, default=5,
+                            help="Simulated server time per message (default: 5)")
+
+    def handle(self, *args: Any, **options: Any) -> None:
+        try:
+            from aiosmtpd.controller import Controller
+        except ImportError:
+            raise CommandError("aiosmtpd is required: pip install aiosmtpd")
+
+        # aiosmtpd logs every SMTP command at INFO
+        logging.getLogger('mail.log').setLevel(logging.WARNING)
+        handler = CountingHandler(options['latency_ms'] / 1000)
+        port = self.free_port()
+        controller = Controller(handler, hostname='127.0.0.1', port=port)
+        controller.start()
+        try:
+            results: Dict[int, float] = {}
+            for concurrency in options['concurrency']:
+                results[concurrency] = self.run(port, concurrency, options['messages'], options['rate'])
+        finally:
+            controller.stop()
+
+        baseline = results[options['concurrency'][0]]
+        for concurrency, rate in results.items():
+            self.stdout.write(
+                f"concurrency={concurrency:<3} {rate:>8.0f} msg/s  ({rate / baseline:.1f}x)"
+            )
+        self.stdout.write(f"Server received {handler.received} messages")
+
+    @staticmethod
+    def free_port() -> int:
+        with socket.socket() as sock:
+            sock.bind(('127.0.0.1', 0))
+            return sock.getsockname()[1]
+
+    @staticmethod
+    def run(port: int, concurrency: int, count: int, rate: float) -> float:
+        def connection_factory(**kwargs: Any) -> Any:
+            return get_connection(
+                'django.core.mail.backends.smtp.EmailBackend',
+                host='127.0.0.1', port=port, username='', password='',
+                use_tls=False, use_ssl=False, **kwargs,
+            )
+
+        messages = (
+            (n, EmailMultiAlternatives('Benchmark', 'Hello', 'bench@localhost', [f'user{n}@example.com']))
+            for n in range(count)
+        )
+        started = time.perf_counter()
+        with ParallelSender(concurrency, rate, connection_factory) as sender:
+            errors = [error for _, error in sender.send_all(messages) if error]
+        elapsed = time.perf_counter() - started
+        if errors:
+            raise CommandError(f"{len(errors)} sends failed, first: {errors[0]}")
+        return count / elapsed
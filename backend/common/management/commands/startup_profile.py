@@ -0,0 +1,119 @@
+import json
+import os
+import subprocess
+import sys
+import time
+from collections import defaultdict
+from typing import Any, Dict, List, Tuple
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+# What a worker does before it can serve its first request
+BOOT_TARGETS: Dict[str, str] = {
+    'setup': "import django; django.setup()",
+    'wsgi': (
+        "from django.core.wsgi import get_wsgi_application; get_wsgi_application(); "
+        "from django.urls import get_resolver; get_resolver().url_patterns"
+    ),
+}
+
+
+def parse_importtime(stderr: str) -> Tuple[Dict[str, float], List[Tuple[str, float]]]:
+    """
+    Parse ``-X importtime`` output.
+
+    Returns the cumulative milliseconds per top-level package (for imports made
+    directly by the boot code, i.e. not nested under another import) and the
+    flat list of (module, cumulative ms) for every import.
+    """
+    packages: Dict[str, float] = defaultdict(float)
+    modules: List[Tuple[str, float]] = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, _, rest = line.partition(':')
+        _self_us, cumulative_us, name = rest.split('|')
+        cumulative_ms = int(cumulative_us) / 1000
+        modules.append((name.strip(), cumulative_ms))
+        # Nested imports are indented below their parent
+        if not name[1:].startswith(' '):
+            packages[name.strip().split('.')[0]] += cumulative_ms
+    return dict(packages), modules
+
+
+class Command(BaseCommand):
+    help = (
+        "Profile the import cost of a cold Django boot with -X importtime and "
+        "fail when it exceeds STARTUP_IMPORT_BUDGET_MS."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--target', choices=sorted(BOOT_TARGETS), default='wsgi',
+                            help="Boot sequence to profile (default: wsgi)")
+        parser.add_argument('--budget-ms', type=float, default=None,
+                            help="Cumulative import budget in ms (default: STARTUP_IMPORT_BUDGET_MS)")
+        parser.add_argument('--repeat', type=int, default=3,
+                            help="Run the boot this many times and keep the fastest (default: 3)")
+        parser.add_argument('--top', type=int, default=15, help="Number of packages to list")
+        parser.add_argument('--forbid', action='append', default=[], metavar='MODULE',
+                            help="Fail if MODULE is imported during boot (repeatable)")
+        parser.add_argument('--json', action='store_true', help="Print the report as JSON")
+
+    def handle(self, *args: Any, **options: Any) -> None:
+        budget: float = options['budget_ms'] or settings.STARTUP_IMPORT_BUDGET_MS
+        runs = [self.profile(BOOT_TARGETS[options['target']]) for _ in range(max(1, options['repeat']))]
+
+        # Keep the per-package minimum across runs to filter out scheduler noise
+        packages: Dict[str, float] = {}
+        for run_packages, _, _ in runs:
+            for name, ms in run_packages.items():
+                packages[name] = min(ms, packages.get(name, ms))
+        total_ms = sum(packages.values())
+        wall_ms = min(wall for _, _, wall in runs)
+        imported = {name for _, modules, _ in runs for name, _ in modules}
+        forbidden = sorted(
+            module for module in options['forbid']
+            if any(name == module or name.startswith(module + '.') for name in imported)
+        )
+
+        top = sorted(packages.items(), key=lambda item: item[1], reverse=True)[:options['top']]
+        if options['json']:
+            self.stdout.write(json.dumps({
+                'target': options['target'],
+                'total_import_ms': round(total_ms, 1),
+                'wall_ms': round(wall_ms, 1),
+                'budget_ms': budget,
+                'modules': len(imported),
+                'packages': {name: round(ms, 1) for name, ms in top},
+                'forbidden_imported': forbidden,
+            }, indent=2))
+        else:
+            self.stdout.write(f"{'package':<30} {'cumulative':>12}")
+            for name, ms in top:
+                self.stdout.write(f"{name:<30} {ms:>10.1f}ms")
+            self.stdout.write(
+                f"\ntarget={options['target']} modules={len(imported)} "
+                f"import total={total_ms:.1f}ms wall={wall_ms:.1f}ms budget={budget:.0f}ms"
+            )
+
+        if forbidden:
+            raise CommandError(f"Imported during boot but should be lazy: {', '.join(forbidden)}")
+        if total_ms > budget:
+            raise CommandError(
+                f"Startup import time {total_ms:.1f}ms exceeds the budget of {budget:.0f}ms"
+            )
+        self.stdout.write(self.style.SUCCESS("Startup import time within budget"))
+
+    def profile(self, code: str) -> Tuple[Dict[str, float], List[Tuple[str, float]], float]:
+        env = {**os.environ, 'DJANGO_SETTINGS_MODULE': os.environ.get('DJANGO_SETTINGS_MODULE', 'backend.settings')}
+        started = time.perf_counter()
+        result = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', code],
+            cwd=settings.BASE_DIR, env=env, capture_output=True, text=True,
+        )
+        wall_ms = (time.perf_counter() - started) * 1000
+        if result.returncode != 0:
+            raise CommandError(f"Django boot failed:\n{result.stderr[-2000:]}")
+        packages, modules = parse_importtime(result.stderr)
+        return packages, modules, wall_ms
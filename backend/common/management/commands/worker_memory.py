@@ -0,0 +1,135 @@
+import json
+import os
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from django.core.management.base import BaseCommand, CommandError
+
+PROC = Path('/proc')
+SMAPS_FIELDS = ('Rss', 'Pss', 'Shared_Clean', 'Shared_Dirty', 'Private_Clean', 'Private_Dirty')
+
+
+def is_gunicorn(pid: int) -> bool:
+    """True if the process executable (or the script run by python) is gunicorn."""
+    try:
+        argv = (PROC / str(pid) / 'cmdline').read_bytes().split(b'\0')
+    except OSError:
+        return False
+    return any(b'gunicorn' in os.path.basename(arg) for arg in argv[:2])
+
+
+def read_ppid(pid: int) -> Optional[int]:
+    try:
+        stat = (PROC / str(pid) / 'stat').read_text()
+    except OSError:
+        return None
+    # The command name may contain spaces, so split after its closing paren
+    return int(stat.rsplit(')', 1)[1].split()[1])
+
+
+def read_memory(pid: int) -> Dict[str, int]:
+    """Return the smaps_rollup counters of a process in kB, plus its USS."""
+    counters: Dict[str, int] = {}
+    with open(PROC / str(pid) / 'smaps_rollup') as fh:
+        for line in fh:
+            key, _, rest = line.partition(':')
+            if key in SMAPS_FIELDS:
+                counters[key] = int(rest.split()[0])
+    counters['Uss'] = counters.get('Private_Clean', 0) + counters.get('Private_Dirty', 0)
+    return counters
+
+
+def find_master() -> int:
+    """Find a Gunicorn master: a gunicorn process whose parent is not gunicorn."""
+    for entry in PROC.iterdir():
+        if not entry.name.isdigit():
+            continue
+        pid = int(entry.name)
+        if is_gunicorn(pid) and not is_gunicorn(read_ppid(pid) or 0):
+            return pid
+    raise CommandError("No running Gunicorn master found, pass --pid")
+
+
+def find_workers(master: int) -> List[int]:
+    return sorted(
+        int(entry.name) for entry in PROC.iterdir()
+        if entry.name.isdigit() and read_ppid(int(entry.name)) == master
+    )
+
+
+class Command(BaseCommand):
+    help = (
+        "Report per-worker memory (RSS, PSS and unique set size) of a running "
+        "Gunicorn master, optionally comparing against a saved snapshot."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--pid', type=int, help="Gunicorn master pid (auto-detected by default)")
+        parser.add_argument('--save', metavar='FILE', help="Write the report as JSON to FILE")
+        parser.add_argument('--compare', metavar='FILE', help="Compare against a report saved with --save")
+
+    def handle(self, *args: Any, **options: Any) -> None:
+        if not PROC.is_dir():
+            raise CommandError("This command needs a Linux /proc filesystem")
+
+        master: int = options['pid'] or find_master()
+        workers = find_workers(master)
+        if not workers:
+            raise CommandError(f"Process {master} has no worker children")
+
+        report: Dict[str, Any] = {
+            'master': {'pid': master, **read_memory(master)},
+            'workers': [{'pid': pid, **read_memory(pid)} for pid in workers],
+            'preload': os.getenv('GUNICORN_PRELOAD', 'false').lower() == 'true',
+        }
+        report['summary'] = self.summarize(report)
+        self.print_report(report)
+
+        if options['compare']:
+            with open(options['compare']) as fh:
+                self.print_comparison(json.load(fh)['summary'], report['summary'])
+        if options['save']:
+            with open(options['save'], 'w') as fh:
+                json.dump(report, fh, indent=2)
+            self.stdout.write(f"Report saved to {options['save']}")
+
+    @staticmethod
+    def summarize(report: Dict[str, Any]) -> Dict[str, float]:
+        workers = report['workers']
+        count = len(workers)
+        total_uss = sum(w['Uss'] for w in workers)
+        total_pss = sum(w['Pss'] for w in workers) + report['master']['Pss']
+        return {
+            'workers': count,
+            'avg_worker_rss_kb': sum(w['Rss'] for w in workers) / count,
+            'avg_worker_uss_kb': total_uss / count,
+            'total_worker_uss_kb': total_uss,
+            'total_pss_kb': total_pss,
+        }
+
+    def print_report(self, report: Dict[str, Any]) -> None:
+        header = f"{'pid':>8} {'role':>7} {'rss':>10} {'pss':>10} {'uss':>10} {'shared':>10}"
+        self.stdout.write(header)
+        rows = [('master', report['master'])] + [('worker', w) for w in report['workers']]
+        for role, mem in rows:
+            shared = mem.get('Shared_Clean', 0) + mem.get('Shared_Dirty', 0)
+            self.stdout.write(
+                f"{mem['pid']:>8} {role:>7} {mem['Rss']:>8}kB {mem['Pss']:>8}kB "
+                f"{mem['Uss']:>8}kB {shared:>8}kB"
+            )
+        summary = report['summary']
+        self.stdout.write(
+            f"\npreload={report['preload']} workers={summary['workers']} "
+            f"avg unique/worker={summary['avg_worker_uss_kb'] / 1024:.1f}MB "
+            f"total PSS={summary['total_pss_kb'] / 1024:.1f}MB"
+        )
+
+    def print_comparison(self, before: Dict[str, float], after: Dict[str, float]) -> None:
+        self.stdout.write("\nChange against saved report:")
+        for key in ('avg_worker_rss_kb', 'avg_worker_uss_kb', 'total_worker_uss_kb', 'total_pss_kb'):
+            delta = after[key] - before[key]
+            percent = (delta / before[key] * 100) if before[key] else 0.0
+            self.stdout.write(
+                f"  {key:<22} {before[key] / 1024:>8.1f}MB -> {after[key] / 1024:>8.1f}MB "
+                f"({percent:+.1f}%)"
+            )
@@ -0,0 +1,121 @@
+# Generated by Django 5.2.3 on 2026-10-19 00:01
+
+import re
+import unicodedata
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+# Frozen copy of the key derivation in common/dedup.py as of this migration;
+# later changes to dedup.py are applied by `manage.py dedup_leads --rebuild-keys`
+GMAIL_DOMAINS = {'gmail.com', 'googlemail.com'}
+COMPANY_SUFFIXES = {
+    'inc', 'incorporated', 'ltd', 'limited', 'llc', 'llp', 'plc', 'corp', 'corporation',
+    'co', 'company', 'gmbh', 'ag', 'sa', 'srl', 'spa', 'bv', 'nv', 'oy', 'ab',
+    'doo', 'dd', 'jdoo', 'obrt', 'd', 'o',
+}
+TOKEN_RE = re.compile(r'\w+')
+BATCH_SIZE = 2000
+
+
+def tokens(value):
+    folded = unicodedata.normalize('NFKD', value)
+    folded = ''.join(ch for ch in folded if not unicodedata.combining(ch)).casefold()
+    return TOKEN_RE.findall(folded)
+
+
+def email_key(email):
+    if not email or '@' not in email:
+        return None
+    local, _, domain = email.strip().lower().rpartition('@')
+    local = local.split('+', 1)[0]
+    if domain in GMAIL_DOMAINS:
+        local, domain = local.replace('.', ''), 'gmail.com'
+    return f'{local}@{domain}' if local and domain else None
+
+
+def phone_key(phone, country_code):
+    if not phone:
+        return None
+    phone = phone.strip()
+    digits = re.sub(r'\D', '', phone)
+    if len(digits) < 7:
+        return None
+    if phone.startswith('+'):
+        return digits
+    if digits.startswith('00'):
+        return digits[2:]
+    if digits.startswith('0') and country_code:
+        return country_code + digits[1:]
+    return digits
+
+
+def name_key(full_name, company_name):
+    name = sorted(tokens(full_name or ''))
+    company = [token for token in tokens(company_name or '') if token not in COMPANY_SUFFIXES]
+    if not name or not company:
+        return None
+    return f"{' '.join(name)}|{' '.join(company)}"[:255]
+
+
+def backfill_keys(apps, schema_editor):
+    """Derive the keys of existing leads, or create-time dedup would never match them."""
+    Lead = apps.get_model('common', 'Lead')
+    db = schema_editor.connection.alias
+    country_code = getattr(settings, 'LEAD_DEDUP_COUNTRY_CODE', '385')
+    fields = ('id', 'email', 'phone_number', 'full_name', 'company_name')
+    last_id = 0
+    while True:
+        rows = list(Lead.objects.using(db).filter(id__gt=last_id).order_by('id').values_list(*fields)[:BATCH_SIZE])
+        if not rows:
+            return
+        last_id = rows[-1][0]
+        Lead.objects.using(db).bulk_update([
+            Lead(id=lead_id, email_key=email_key(email), phone_key=phone_key(phone, country_code),
+                 name_key=name_key(full_name, company))
+            for lead_id, email, phone, full_name, company in rows
+        ], ['email_key', 'phone_key', 'name_key'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('common', '0002_newsletter_alter_client_category_alter_lead_category'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='lead',
+            name='duplicate_of',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='duplicates', to='common.lead'),
+        ),
+        migrations.AddField(
+            model_name='lead',
+            name='email_key',
+            field=models.CharField(blank=True, editable=False, max_length=254, null=True),
+        ),
+        migrations.AddField(
+            model_name='lead',
+            name='name_key',
+            field=models.CharField(blank=True, editable=False, max_length=255, null=True),
+        ),
+        migrations.AddField(
+            model_name='lead',
+            name='phone_key',
+            field=models.CharField(blank=True, editable=False, max_length=20, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='lead',
+            index=models.Index(fields=['email_key'], name='lead_email_key_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='lead',
+            index=models.Index(fields=['phone_key'], name='lead_phone_key_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='lead',
+            index=models.Index(fields=['name_key'], name='lead_name_key_idx'),
+        ),
+        migrations.RunPython(backfill_keys, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 5.2.3 on 2026-10-19 00:03
+
+import django.contrib.postgres.indexes
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('common', '0003_lead_dedup_keys'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LeadStatusEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('from_status', models.CharField(blank=True, max_length=50, null=True)),
+                ('to_status', models.CharField(max_length=50)),
+                ('at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('lead', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='status_events', to='common.lead')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['lead', 'at'], name='leadstatusevent_lead_at_idx'), django.contrib.postgres.indexes.BrinIndex(fields=['at'], name='leadstatusevent_at_brin')],
+            },
+        ),
+        # Seed the history with each existing lead's current status. Leads that
+        # are still new entered it at creation, the others at their last update.
+        migrations.RunSQL(
+            sql="""
+                INSERT INTO common_leadstatusevent (lead_id, from_status, to_status, at)
+                SELECT id, NULL, status, CASE WHEN status = 'new' THEN created_at ELSE updated_at END
+                FROM common_lead
+                ORDER BY 4
+            """,
+            reverse_sql=migrations.RunSQL.noop,
+        ),
+    ]
@@ -0,0 +1,75 @@
+# Generated by Django 5.2.3 on 2026-10-19 00:11
+
+from django.db import migrations, models
+from django.utils import timezone
+
+# Frozen copy of the scoring rules in common/scoring.py as of this migration;
+# later changes to scoring.py are applied by `manage.py score_leads`
+SOURCE_POINTS = {
+    'referral': 30, 'website': 25, 'linkedin': 20, 'email_campaign': 15, 'cold_call': 10, 'other': 5,
+}
+CATEGORY_POINTS = {
+    'ecommerce_auto': 15, 'sales_auto': 15, 'web_dev': 12, 'mobile_dev': 12,
+    'social_media_auto': 10, 'automated_testing': 8,
+}
+STATUS_POINTS = {
+    'interested': 25, 'contacted': 15, 'new': 10, 'converted': 0, 'not_interested': -30, 'closed': -30,
+}
+COMPANY_POINTS = 8.0
+EMAIL_POINTS = 6.0
+PHONE_POINTS = 6.0
+AGE_POINTS = 20.0
+AGE_HALF_LIFE_DAYS = 30.0
+MAX_SCORE = 100
+BATCH_SIZE = 2000
+
+
+def score(source, category, status, company_name, email, phone_number, created_at, now):
+    age_days = max((now - created_at).total_seconds(), 0) / 86400 if created_at else 0.0
+    value = (
+        SOURCE_POINTS.get(source, 0)
+        + CATEGORY_POINTS.get(category, 0)
+        + STATUS_POINTS.get(status, 0)
+        + (COMPANY_POINTS if company_name else 0)
+        + (EMAIL_POINTS if email else 0)
+        + (PHONE_POINTS if phone_number else 0)
+        + AGE_POINTS * 0.5 ** (age_days / AGE_HALF_LIFE_DAYS)
+    )
+    return int(min(max(round(value), 0), MAX_SCORE))
+
+
+def score_existing_leads(apps, schema_editor):
+    Lead = apps.get_model('common', 'Lead')
+    db = schema_editor.connection.alias
+    now = timezone.now()
+    fields = ('id', 'source', 'category', 'status', 'company_name', 'email', 'phone_number', 'created_at')
+    last_id = 0
+    while True:
+        rows = list(Lead.objects.using(db).filter(id__gt=last_id).order_by('id').values_list(*fields)[:BATCH_SIZE])
+        if not rows:
+            return
+        last_id = rows[-1][0]
+        Lead.objects.using(db).bulk_update(
+            [Lead(id=row[0], score=score(*row[1:], now)) for row in rows], ['score']
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('common', '0005_campaign'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='lead',
+            name='score',
+            field=models.PositiveSmallIntegerField(default=0, editable=False),
+        ),
+        # Before the index exists, so the initial writes do not maintain it
+        migrations.RunPython(score_existing_leads, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='lead',
+            index=models.Index(fields=['-score', '-id'], name='lead_score_idx'),
+        ),
+    ]
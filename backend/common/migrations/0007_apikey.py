@@ -0,0 +1,31 @@
+# Generated by Django 5.2.3 on 2026-10-19 00:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('common', '0006_lead_score'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='APIKey',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100)),
+                ('prefix', models.CharField(editable=False, max_length=8)),
+                ('key_hash', models.CharField(editable=False, max_length=64, unique=True)),
+                ('rate', models.CharField(blank=True, help_text='Request rate such as 100/minute (default: API_KEY_DEFAULT_RATE)', max_length=20, null=True)),
+                ('daily_quota', models.PositiveIntegerField(blank=True, help_text='Requests per UTC day (default: API_KEY_DEFAULT_DAILY_QUOTA, 0 = unlimited)', null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('revoked_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'verbose_name': 'API key',
+                'indexes': [models.Index(fields=['updated_at'], name='apikey_updated_at_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,52 @@
+from django.db import migrations
+
+# Keep the object in step with common.events.event_data()
+CREATE_TRIGGER = """
+CREATE OR REPLACE FUNCTION common_leadstatusevent_notify() RETURNS trigger AS $$
+BEGIN
+    PERFORM pg_notify('lead_events', json_build_object(
+        'id', NEW.id,
+        'lead', NEW.lead_id,
+        'from_status', NEW.from_status,
+        'to_status', NEW.to_status,
+        'at', NEW.at,
+        'full_name', lead.full_name,
+        'company_name', lead.company_name,
+        'source', lead.source,
+        'category', lead.category,
+        'score', lead.score
+    )::text)
+    FROM common_lead lead
+    WHERE lead.id = NEW.lead_id;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER common_leadstatusevent_notify
+    AFTER INSERT ON common_leadstatusevent
+    FOR EACH ROW EXECUTE FUNCTION common_leadstatusevent_notify();
+"""
+
+DROP_TRIGGER = """
+DROP TRIGGER IF EXISTS common_leadstatusevent_notify ON common_leadstatusevent;
+DROP FUNCTION IF EXISTS common_leadstatusevent_notify();
+"""
+
+
+def run_on_postgresql(sql):
+    # Other databases are polled by common.events instead
+    def run(apps, schema_editor):
+        if schema_editor.connection.vendor == 'postgresql':
+            schema_editor.execute(sql)
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('common', '0007_apikey'),
+    ]
+
+    operations = [
+        migrations.RunPython(run_on_postgresql(CREATE_TRIGGER), run_on_postgresql(DROP_TRIGGER)),
+    ]
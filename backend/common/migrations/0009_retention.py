@@ -0,0 +1,49 @@
+# Generated by Django 5.2.3 on 2026-10-19 00:48
+
+import django.utils.timezone
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def start_retention_clock(apps, schema_editor):
+    # When they unsubscribed is unknown, so the retention period starts now
+    Newsletter = apps.get_model('common', 'Newsletter')
+    Newsletter.objects.using(schema_editor.connection.alias).filter(
+        is_subscribed=False, unsubscribed_at__isnull=True,
+    ).update(unsubscribed_at=timezone.now())
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('common', '0008_lead_event_notify'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RetentionCheckpoint',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('policy', models.CharField(max_length=50, unique=True)),
+                ('cutoff', models.DateTimeField()),
+                ('last_id', models.BigIntegerField(default=0)),
+                ('deleted', models.BigIntegerField(default=0)),
+                ('cascaded', models.BigIntegerField(default=0)),
+                ('batches', models.PositiveIntegerField(default=0)),
+                ('throttled_seconds', models.FloatField(default=0)),
+                ('started_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='newsletter',
+            name='unsubscribed_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.RunPython(start_retention_clock, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='campaigndelivery',
+            index=models.Index(fields=['subscriber'], name='campaigndelivery_subscr_idx'),
+        ),
+    ]
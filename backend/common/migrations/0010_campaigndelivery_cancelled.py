@@ -0,0 +1,18 @@
+# Generated by Django 5.2.3 on 2026-10-19 01:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('common', '0009_retention'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='campaigndelivery',
+            name='state',
+            field=models.CharField(choices=[('pending', 'Pending'), ('sent', 'Sent'), ('failed', 'Failed'), ('cancelled', 'Cancelled')], default='pending', max_length=10),
+        ),
+    ]
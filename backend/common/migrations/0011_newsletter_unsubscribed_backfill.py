@@ -0,0 +1,24 @@
+# Generated by Django 5.2.3 on 2026-10-19 01:40
+
+from django.db import migrations
+from django.utils import timezone
+
+
+def start_retention_clock(apps, schema_editor):
+    # Rows unsubscribed by queryset updates since 0009 never got a timestamp;
+    # when they unsubscribed is unknown, so their retention period starts now
+    Newsletter = apps.get_model('common', 'Newsletter')
+    Newsletter.objects.using(schema_editor.connection.alias).filter(
+        is_subscribed=False, unsubscribed_at__isnull=True,
+    ).update(unsubscribed_at=timezone.now())
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('common', '0010_campaigndelivery_cancelled'),
+    ]
+
+    operations = [
+        migrations.RunPython(start_retention_clock, migrations.RunPython.noop),
+    ]
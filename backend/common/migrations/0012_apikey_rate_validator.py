@@ -0,0 +1,19 @@
+# Generated by Django 5.2.3 on 2026-10-19 01:40
+
+import common.models
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('common', '0011_newsletter_unsubscribed_backfill'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='apikey',
+            name='rate',
+            field=models.CharField(blank=True, help_text='Request rate such as 100/minute (default: API_KEY_DEFAULT_RATE)', max_length=20, null=True, validators=[common.models.validate_rate]),
+        ),
+    ]
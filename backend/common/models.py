@@ -1,9 +1,17 @@
+import hashlib
+import secrets
 import uuid
-from typing import Optional
-from django.db import models
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+from django.contrib.postgres.indexes import BrinIndex
+from django.db import IntegrityError, connections, models, transaction
+from django.db.models.functions import Coalesce
 from django.utils import timezone
 from datetime import timedelta
+from django.core.exceptions import ValidationError
 from django.core.validators import RegexValidator, MinValueValidator
+from rest_framework.throttling import SimpleRateThrottle
+from .dedup import blocking_keys
+from .scoring import SCORE_FIELDS, rescore_ids, score_lead
 
 
 CATEGORY_CHOICES = [
@@ -14,6 +22,166 @@ CATEGORY_CHOICES = [
         ('ecommerce_auto', 'E-commerce Automation'),
         ('sales_auto', 'Sales Automation'),
     ]
+
+
+# Leads per batch when a queryset update has to read them (expressions, rescoring)
+UPDATE_BATCH_SIZE = 1000
+
+
+class LeadQuerySet(models.QuerySet):
+    def bulk_create(self, objs, *args: Any, **kwargs: Any):
+        """Derive dedup keys, score the leads and record their creation, as save() does."""
+        objs = list(objs)
+        now = timezone.now()
+        for lead in objs:
+            lead.refresh_dedup_keys()
+            lead.score = score_lead(lead, now)
+        with transaction.atomic(using=self.db):
+            created = super().bulk_create(objs, *args, **kwargs)
+            LeadStatusEvent.objects.using(self.db).bulk_create([
+                LeadStatusEvent(lead_id=lead.pk, to_status=lead.status, at=now)
+                for lead in created if lead.pk is not None
+            ], batch_size=1000)
+        return created
+
+    def update(self, **kwargs: Any) -> int:
+        """
+        Queryset updates bypass save(), so status changes are recorded here:
+        a literal status with one INSERT ... SELECT, an expression (e.g. from
+        bulk_update) by comparing the statuses before and after. Leads whose
+        scoring fields changed are rescored afterwards. Expression updates and
+        rescoring walk the leads in id batches (one transaction overall), so
+        memory stays bounded on any table size.
+        """
+        rescore = bool(SCORE_FIELDS & kwargs.keys())
+        if not rescore and isinstance(kwargs.get('status', ''), str):
+            return self._update_recording_status(**kwargs)
+        ids = self.order_by().values_list('id', flat=True)
+        rows = last_id = 0
+        with transaction.atomic(using=self.db):
+            while True:
+                batch = list(ids.filter(id__gt=last_id).order_by('id')[:UPDATE_BATCH_SIZE])
+                if not batch:
+                    return rows
+                last_id = batch[-1]
+                rows += self.filter(id__in=batch)._update_recording_status(**kwargs)
+                if rescore:
+                    rescore_ids(batch, using=self.db)
+
+    def update_in_batches(self, batch_size: int = 1000, **changes: Any) -> Tuple[int, int]:
+        """
+        Apply literal field changes to the matching leads, `batch_size` ids at a
+        time, each batch an UPDATE in its own short transaction so row locks
+        are never held for the whole set. Only leads that actually change are
+        written; they get a fresh updated_at, status events and new scores
+        through update(). Returns (matched, updated).
+        """
+        unchanged = models.Q(**changes)
+        ids = self.order_by().values_list('id', flat=True)
+        matched = updated = 0
+        last_id = 0
+        while True:
+            batch = list(ids.filter(id__gt=last_id).order_by('id')[:batch_size])
+            if not batch:
+                return matched, updated
+            matched += len(batch)
+            last_id = batch[-1]
+            with transaction.atomic(using=self.db):
+                # Re-applies the selection, so leads that left it since their id was read are skipped
+                updated += self.filter(id__in=batch).exclude(unchanged).update(
+                    updated_at=timezone.now(), **changes,
+                )
+
+    def convert_to_clients(self, team_id: str, batch_size: int = 1000, dry_run: bool = False) -> Dict[str, List[int]]:
+        """
+        Make every matching lead a Client, `batch_size` leads per transaction.
+        Each batch locks its leads with SELECT ... FOR UPDATE SKIP LOCKED, then
+        bulk-creates their clients (category copied, `team_id` assigned), then
+        sets them to 'converted' with one UPDATE. Leads that cannot be converted
+        do not fail the batch; they are returned by reason, next to 'converted':
+        'locked' (in use by another transaction, retry later), 'already_client'
+        (including clients a concurrent conversion created first) and
+        'duplicate' (flagged as a duplicate of another lead).
+        With dry_run nothing is written.
+        """
+        result: Dict[str, List[int]] = {'converted': [], 'locked': [], 'already_client': [], 'duplicate': []}
+        ids = self.order_by().values_list('id', flat=True)
+        last_id = 0
+        while True:
+            batch = list(ids.filter(id__gt=last_id).order_by('id')[:batch_size])
+            if not batch:
+                return result
+            last_id = batch[-1]
+            with transaction.atomic(using=self.db):
+                # Re-applies the selection under the lock, so leads changed meanwhile are re-checked
+                leads: Dict[int, Tuple[str, Optional[int]]] = {
+                    lead_id: (category, duplicate_of_id)
+                    for lead_id, category, duplicate_of_id in self.filter(id__in=batch).order_by('id')
+                    .select_for_update(skip_locked=True, of=('self',))
+                    .values_list('id', 'category', 'duplicate_of_id')
+                }
+                skipped = [lead_id for lead_id in batch if lead_id not in leads]
+                if skipped:
+                    # Skipped rows that still match are locked; the others no longer match
+                    result['locked'] += sorted(self.filter(id__in=skipped).values_list('id', flat=True))
+                clients = self._client_lead_ids(leads)
+                convert: List[int] = []
+                for lead_id, (category, duplicate_of_id) in leads.items():
+                    if lead_id in clients:
+                        result['already_client'].append(lead_id)
+                    elif duplicate_of_id is not None:
+                        result['duplicate'].append(lead_id)
+                    else:
+                        convert.append(lead_id)
+                if dry_run or not convert:
+                    result['converted'] += convert
+                    continue
+                new_clients = [
+                    Client(client_info_id=lead_id, team_id=team_id, category=leads[lead_id][0]) for lead_id in convert
+                ]
+                try:
+                    with transaction.atomic(using=self.db):
+                        Client.objects.using(self.db).bulk_create(new_clients, batch_size=batch_size)
+                except IntegrityError:
+                    # A client was created for some lead since the check; find which, one savepoint each
+                    convert = []
+                    for client in new_clients:
+                        try:
+                            with transaction.atomic(using=self.db):
+                                client.save(using=self.db)
+                        except IntegrityError:
+                            result['already_client'].append(client.client_info_id)
+                        else:
+                            convert.append(client.client_info_id)
+                result['converted'] += convert
+                Lead.objects.using(self.db).filter(id__in=convert).exclude(status='converted').update(
+                    status='converted', updated_at=timezone.now(),
+                )
+
+    def _client_lead_ids(self, lead_ids: Iterable[int]) -> Set[int]:
+        return set(
+            Client.objects.using(self.db).filter(client_info_id__in=lead_ids).values_list('client_info_id', flat=True)
+        )
+
+    def _update_recording_status(self, **kwargs: Any) -> int:
+        if 'status' not in kwargs:
+            return super().update(**kwargs)
+        with transaction.atomic(using=self.db):
+            if isinstance(kwargs['status'], str):
+                LeadStatusEvent.record_bulk(self, kwargs['status'])
+                return super().update(**kwargs)
+            # An expression: only called on one id batch at a time by update()
+            before: Dict[int, str] = dict(self.select_for_update().values_list('id', 'status'))
+            rows = super().update(**kwargs)
+            now = timezone.now()
+            LeadStatusEvent.objects.using(self.db).bulk_create([
+                LeadStatusEvent(lead_id=lead_id, from_status=before[lead_id], to_status=status, at=now)
+                for lead_id, status in Lead.objects.using(self.db).filter(id__in=before).values_list('id', 'status')
+                if status != before[lead_id]
+            ], batch_size=1000)
+            return rows
+
+
 class Lead(models.Model):
     # Basic info
     full_name: str = models.CharField(max_length=255)
@@ -71,9 +239,71 @@ class Lead(models.Model):
         default='web_dev'
     )
 
+    # Deduplication (blocking keys are derived in save(), see common/dedup.py)
+    email_key: Optional[str] = models.CharField(max_length=254, blank=True, null=True, editable=False)
+    phone_key: Optional[str] = models.CharField(max_length=20, blank=True, null=True, editable=False)
+    name_key: Optional[str] = models.CharField(max_length=255, blank=True, null=True, editable=False)
+    duplicate_of: Optional['Lead'] = models.ForeignKey(
+        'self',
+        on_delete=models.SET_NULL,
+        related_name='duplicates',
+        blank=True,
+        null=True)
+
+    # Priority score, see common/scoring.py
+    score: int = models.PositiveSmallIntegerField(default=0, editable=False)
+
+    objects = LeadQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # Plain btree indexes for the dedup equality lookups
+            models.Index(fields=['email_key'], name='lead_email_key_idx'),
+            models.Index(fields=['phone_key'], name='lead_phone_key_idx'),
+            models.Index(fields=['name_key'], name='lead_name_key_idx'),
+            # ?ordering=-score on the leads endpoint
+            models.Index(fields=['-score', '-id'], name='lead_score_idx'),
+        ]
+
     def __str__(self) -> str:
         return f"{self.full_name} ({self.company_name or 'No company'})"
 
+    def refresh_dedup_keys(self) -> None:
+        self.email_key, self.phone_key, self.name_key = blocking_keys(
+            self.email, self.phone_number, self.full_name, self.company_name
+        )
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember the stored status so save() can tell when it changes
+        instance._loaded_status = instance.__dict__.get('status')
+        return instance
+
+    def save(self, *args, **kwargs) -> None:
+        self.refresh_dedup_keys()
+        self.score = score_lead(self)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            kwargs['update_fields'] = {*update_fields, 'email_key', 'phone_key', 'name_key'}
+            if SCORE_FIELDS.intersection(update_fields):
+                kwargs['update_fields'].add('score')
+
+        adding = self._state.adding
+        tracks_status = update_fields is None or 'status' in update_fields
+        previous = getattr(self, '_loaded_status', None)
+        if not adding and tracks_status and previous is None:
+            # Built without a database read (e.g. Lead(id=...)), look it up
+            previous = Lead.objects.filter(pk=self.pk).values_list('status', flat=True).first()
+
+        with transaction.atomic(using=kwargs.get('using')):
+            super().save(*args, **kwargs)
+            if adding or (tracks_status and previous != self.status):
+                LeadStatusEvent.objects.create(
+                    lead=self, from_status=None if adding else previous, to_status=self.status,
+                )
+        self._loaded_status = self.status
+
 class Client(models.Model):
     client_info: Optional[Lead] = models.OneToOneField(
         Lead,
@@ -110,9 +340,246 @@ class Client(models.Model):
     def __str__(self) -> str:
         return self.team_id
 
+class NewsletterQuerySet(models.QuerySet):
+    """Keeps unsubscribed_at in step with is_subscribed on the bulk paths too, as save() does."""
+
+    def bulk_create(self, objs, *args: Any, **kwargs: Any):
+        objs = list(objs)
+        now = timezone.now()
+        for subscriber in objs:
+            subscriber.refresh_unsubscribed_at(now)
+        return super().bulk_create(objs, *args, **kwargs)
+
+    def bulk_update(self, objs, fields, *args: Any, **kwargs: Any):
+        objs = list(objs)
+        if 'is_subscribed' in fields and 'unsubscribed_at' not in fields:
+            now = timezone.now()
+            for subscriber in objs:
+                subscriber.refresh_unsubscribed_at(now)
+            fields = [*fields, 'unsubscribed_at']
+        return super().bulk_update(objs, fields, *args, **kwargs)
+
+    def update(self, **kwargs: Any) -> int:
+        if 'is_subscribed' in kwargs and 'unsubscribed_at' not in kwargs:
+            subscribed = kwargs['is_subscribed']
+            unsubscribed_at = Coalesce('unsubscribed_at', models.Value(timezone.now()))
+            if isinstance(subscribed, bool):
+                kwargs['unsubscribed_at'] = None if subscribed else unsubscribed_at
+            else:
+                kwargs['unsubscribed_at'] = models.Case(
+                    models.When(models.ExpressionWrapper(subscribed, output_field=models.BooleanField()),
+                                then=models.Value(None)),
+                    default=unsubscribed_at,
+                )
+        return super().update(**kwargs)
+
+
 class Newsletter(models.Model):
     email: str = models.EmailField(unique=True)
     is_subscribed: bool = models.BooleanField(default=True)
+    # Set on unsubscribing (by save() and the queryset); the retention purge counts from it
+    unsubscribed_at = models.DateTimeField(blank=True, null=True, editable=False)
+
+    objects = NewsletterQuerySet.as_manager()
+
+    def __str__(self) -> str:
+        return f"{self.email} - {'Subscribed' if self.is_subscribed else 'Unsubscribed'}"
+
+    def refresh_unsubscribed_at(self, now=None) -> None:
+        if self.is_subscribed:
+            self.unsubscribed_at = None
+        elif self.unsubscribed_at is None:
+            self.unsubscribed_at = now or timezone.now()
+
+    def save(self, *args, **kwargs) -> None:
+        self.refresh_unsubscribed_at()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'is_subscribed' in update_fields:
+            kwargs['update_fields'] = {*update_fields, 'unsubscribed_at'}
+        super().save(*args, **kwargs)
+
+
+class LeadStatusEvent(models.Model):
+    """
+    Append-only history of lead status transitions, written by Lead.save()
+    and LeadQuerySet.update(). A lead's creation is recorded with an empty
+    from_status, so time spent in the first stage is measurable too.
+    """
+    lead: Lead = models.ForeignKey(
+        Lead,
+        on_delete=models.CASCADE,
+        related_name='status_events',
+        db_index=False)  # covered by the (lead, at) index
+    from_status: Optional[str] = models.CharField(max_length=50, blank=True, null=True)
+    to_status: str = models.CharField(max_length=50)
+    at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            # Per-lead timelines
+            models.Index(fields=['lead', 'at'], name='leadstatusevent_lead_at_idx'),
+            # Time range scans; rows are inserted in `at` order so BRIN stays tiny
+            BrinIndex(fields=['at'], name='leadstatusevent_at_brin'),
+        ]
+
+    def __str__(self) -> str:
+        return f"{self.lead_id}: {self.from_status or '-'} -> {self.to_status}"
+
+    def save(self, *args, **kwargs) -> None:
+        if not self._state.adding:
+            raise ValueError("Status events are append-only")
+        super().save(*args, **kwargs)
+
+    @classmethod
+    def record_bulk(cls, leads: 'LeadQuerySet', to_status: str) -> None:
+        """Record a transition to `to_status` for every lead in `leads` not already in it."""
+        changed = leads.exclude(status=to_status).values('id', 'status')
+        subquery, params = changed.query.sql_with_params()
+        connection = connections[leads.db]
+        quote = connection.ops.quote_name
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"INSERT INTO {quote(cls._meta.db_table)} "
+                f"({quote('lead_id')}, {quote('from_status')}, {quote('to_status')}, {quote('at')}) "
+                f"SELECT changed.id, changed.status, %s, %s FROM ({subquery}) changed",
+                [to_status, timezone.now(), *params],
+            )
+
+
+class Campaign(models.Model):
+    """A newsletter mailing, sent by `manage.py send_campaign`"""
+    subject: str = models.CharField(max_length=255)
+    body_text: str = models.TextField()
+    body_html: Optional[str] = models.TextField(blank=True, null=True)
+    from_email: Optional[str] = models.EmailField(blank=True, null=True)
+    status: str = models.CharField(
+        max_length=20,
+        choices=[
+            ('draft', 'Draft'),
+            ('sending', 'Sending'),
+            ('sent', 'Sent'),
+        ],
+        default='draft'
+    )
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(blank=True, null=True)
+    finished_at = models.DateTimeField(blank=True, null=True)
+
+    def __str__(self) -> str:
+        return f"{self.subject} ({self.status})"
+
+
+class CampaignDelivery(models.Model):
+    """Per-recipient delivery state, so an interrupted campaign resumes where it stopped"""
+    campaign: Campaign = models.ForeignKey(Campaign, on_delete=models.CASCADE, related_name='deliveries')
+    subscriber: Newsletter = models.ForeignKey(
+        Newsletter,
+        on_delete=models.CASCADE,
+        related_name='deliveries',
+        db_index=False)  # named index below
+    email: str = models.EmailField()
+    state: str = models.CharField(
+        max_length=10,
+        choices=[
+            ('pending', 'Pending'),
+            ('sent', 'Sent'),
+            ('failed', 'Failed'),
+            ('cancelled', 'Cancelled'),  # unsubscribed before it was sent
+        ],
+        default='pending'
+    )
+    attempts: int = models.PositiveSmallIntegerField(default=0)
+    error: Optional[str] = models.TextField(blank=True, null=True)
+    sent_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['campaign', 'subscriber'], name='campaigndelivery_unique_recipient'),
+        ]
+        indexes = [
+            # Keyset scan over a campaign's pending deliveries
+            models.Index(fields=['campaign', 'state', 'id'], name='campaigndelivery_pending_idx'),
+            # Deleting subscribers (retention purge, cascades) finds their deliveries by it
+            models.Index(fields=['subscriber'], name='campaigndelivery_subscr_idx'),
+        ]
+
+    def __str__(self) -> str:
+        return f"{self.email} - {self.state}"
+
+
+
+def validate_rate(value: str) -> None:
+    """A rate DRF's throttles can parse, such as ``100/minute``"""
+    try:
+        SimpleRateThrottle.parse_rate(None, value)  # a plain parser, it does not use self
+    except (ValueError, KeyError, IndexError):
+        raise ValidationError(
+            "Enter a rate such as 100/minute: a number, a slash and second, minute, hour or day.",
+            code='invalid_rate',
+        )
+
+
+class APIKey(models.Model):
+    """
+    An API client. Only the SHA-256 of the key is stored; the key itself is
+    shown once when it is created (`manage.py api_keys create`).
+    """
+    name: str = models.CharField(max_length=100)
+    prefix: str = models.CharField(max_length=8, editable=False)  # identifies the key in listings and logs
+    key_hash: str = models.CharField(max_length=64, unique=True, editable=False)
+    rate: Optional[str] = models.CharField(
+        max_length=20, blank=True, null=True, validators=[validate_rate],
+        help_text="Request rate such as 100/minute (default: API_KEY_DEFAULT_RATE)")
+    daily_quota: Optional[int] = models.PositiveIntegerField(
+        blank=True, null=True,
+        help_text="Requests per UTC day (default: API_KEY_DEFAULT_DAILY_QUOTA, 0 = unlimited)")
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    revoked_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        verbose_name = 'API key'
+        indexes = [
+            # Workers poll MAX(updated_at) to notice revocations
+            models.Index(fields=['updated_at'], name='apikey_updated_at_idx'),
+        ]
+
+    def __str__(self) -> str:
+        return f"{self.name} ({self.prefix}…{' revoked' if self.revoked_at else ''})"
+
+    @staticmethod
+    def hash_key(key: str) -> str:
+        # Keys are 256-bit random tokens, so a fast unsalted hash is enough
+        return hashlib.sha256(key.encode()).hexdigest()
+
+    @classmethod
+    def generate(cls, name: str, **fields: Any) -> Tuple['APIKey', str]:
+        """Create a key and return it with its plaintext, which is not stored anywhere."""
+        prefix = secrets.token_hex(4)
+        key = f'{prefix}.{secrets.token_urlsafe(32)}'
+        return cls.objects.create(name=name, prefix=prefix, key_hash=cls.hash_key(key), **fields), key
+
+    def revoke(self) -> None:
+        self.revoked_at = timezone.now()
+        self.save(update_fields=['revoked_at', 'updated_at'])
+
+
+class RetentionCheckpoint(models.Model):
+    """
+    Progress of a retention purge policy (common/retention.py). A run that is
+    interrupted resumes after last_id with the same cutoff; the counters are
+    kept as metrics of the latest run.
+    """
+    policy: str = models.CharField(max_length=50, unique=True)
+    cutoff = models.DateTimeField()
+    last_id: int = models.BigIntegerField(default=0)
+    deleted: int = models.BigIntegerField(default=0)
+    cascaded: int = models.BigIntegerField(default=0)  # related rows deleted or detached
+    batches: int = models.PositiveIntegerField(default=0)
+    throttled_seconds: float = models.FloatField(default=0)
+    started_at = models.DateTimeField(default=timezone.now)
+    updated_at = models.DateTimeField(auto_now=True)
+    finished_at = models.DateTimeField(blank=True, null=True)
 
     def __str__(self) -> str:
-        return f"{self.email} - {'Subscribed' if self.is_subscribed else 'Unsubscribed'}"
\ No newline at end of file
+        return f"{self.policy}: {self.deleted} deleted{'' if self.finished_at else ', running'}"
@@ -0,0 +1,297 @@
+"""
+Retention purges: deleting old rows in small batches without holding locks.
+
+A policy names a model, the timestamp its age is measured from and the rows
+it applies to. Rows referenced by a model the policy keeps are never purged:
+leads that became clients stay, with their Client (billing, contract) rows.
+A purge walks the matching primary keys in order, a batch at a time. Each
+batch is one short transaction:
+
+- lock the batch's rows, skipping any that other transactions hold;
+- drop the ones that gained a kept reference (say a conversion) meanwhile;
+- delete or null the rows that reference them, with one statement per
+  relation (LeadStatusEvent for leads, CampaignDelivery for subscribers);
+- delete the rows themselves, with one statement;
+- advance the RetentionCheckpoint.
+
+Nothing is loaded into Python, and no lock lives longer than one batch. Rows
+skipped because they were locked are retried in up to RETRY_PASSES further
+passes from the start. An interrupted purge resumes after the checkpoint with
+the same cutoff. Between batches the purge waits while a replica lags or the
+host is loaded.
+"""
+
+import logging
+import os
+import time
+from datetime import timedelta
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import OperationalError, connections, models, transaction
+from django.db.models import Exists, OuterRef
+from django.utils import timezone
+
+from .models import Client, Lead, Newsletter, RetentionCheckpoint
+
+logger = logging.getLogger(__name__)
+
+# A batch waits at most this long for a row or table lock before it backs off
+LOCK_TIMEOUT_MS = 2000
+LOCK_RETRIES = 5
+# Passes over the range again for rows skipped while locked, and the wait before each
+RETRY_PASSES = 3
+RETRY_DELAY = 5.0
+
+
+class RetentionPolicy:
+    """
+    Rows of ``model`` matching ``filters`` whose ``age_field`` is more than
+    ``days`` old, and not referenced by any row of the ``keep`` models.
+    """
+
+    def __init__(self, name: str, model, days: int, age_field: str, keep: Tuple = (), **filters: Any) -> None:
+        self.name = name
+        self.model = model
+        self.days = days
+        self.age_field = age_field
+        self.filters = filters
+        self.kept = [relation for relation in model._meta.related_objects if relation.related_model in keep]
+        self.relations = self.related_rows(model, keep)
+
+    @staticmethod
+    def related_rows(model, keep: Tuple = ()) -> List[Tuple[str, Any]]:
+        """('delete' or 'detach', relation) for every table pointing at model, except kept ones."""
+        relations = []
+        for relation in model._meta.related_objects:
+            on_delete = relation.on_delete
+            if on_delete is models.DO_NOTHING or relation.related_model in keep:
+                continue
+            if on_delete is models.SET_NULL:
+                relations.append(('detach', relation))
+            elif on_delete is models.CASCADE:
+                nested = [
+                    related for related in relation.related_model._meta.related_objects
+                    if related.on_delete is not models.DO_NOTHING
+                ]
+                if nested:
+                    raise ImproperlyConfigured(
+                        f"Retention of {model.__name__} would cascade through "
+                        f"{relation.related_model.__name__} to {nested[0].related_model.__name__}"
+                    )
+                relations.append(('delete', relation))
+            else:
+                raise ImproperlyConfigured(
+                    f"Retention cannot purge {model.__name__} referenced by {relation.related_model.__name__} "
+                    f"with on_delete={on_delete.__name__}"
+                )
+        return relations
+
+    def cutoff(self) -> Any:
+        return timezone.now() - timedelta(days=self.days)
+
+    def queryset(self, cutoff: Any, using: str = 'default') -> models.QuerySet:
+        queryset = self.model._default_manager.using(using).filter(**{f'{self.age_field}__lt': cutoff}, **self.filters)
+        for relation in self.kept:
+            referencing = relation.related_model._default_manager.using(using)
+            queryset = queryset.filter(~Exists(referencing.filter(**{relation.field.name: OuterRef('pk')})))
+        return queryset
+
+
+def policies() -> Dict[str, RetentionPolicy]:
+    """The policies configured in settings, enabled or not (days = 0)."""
+    return {
+        'lead': RetentionPolicy(
+            'lead', Lead, settings.RETENTION_LEAD_DAYS, 'updated_at', keep=(Client,),
+            status__in=settings.RETENTION_LEAD_STATUSES,
+        ),
+        'newsletter': RetentionPolicy(
+            'newsletter', Newsletter, settings.RETENTION_NEWSLETTER_DAYS, 'unsubscribed_at',
+            is_subscribed=False,
+        ),
+    }
+
+
+def replication_lag(using: str = 'default') -> float:
+    """Seconds the slowest streaming replica is behind; 0 without replicas or off PostgreSQL."""
+    connection = connections[using]
+    if connection.vendor != 'postgresql':
+        return 0.0
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT COALESCE(EXTRACT(EPOCH FROM MAX(replay_lag)), 0) FROM pg_stat_replication')
+        return float(cursor.fetchone()[0])
+
+
+def overload(max_lag: float, max_load: float, using: str = 'default') -> Optional[str]:
+    """Why the purge should wait right now, if it should."""
+    if max_lag:
+        lag = replication_lag(using)
+        if lag > max_lag:
+            return f"replica {lag:.1f}s behind"
+    if max_load:
+        load = os.getloadavg()[0] / (os.cpu_count() or 1)
+        if load > max_load:
+            return f"load {load:.2f} per CPU"
+    return None
+
+
+class RetentionPurge:
+    def __init__(self, policy: RetentionPolicy, batch_size: int = None, pause: float = None,
+                 max_lag: float = None, max_load: float = None, using: str = 'default',
+                 progress: Optional[Callable[[str], None]] = None) -> None:
+        self.policy = policy
+        self.batch_size = batch_size or settings.RETENTION_BATCH_SIZE
+        self.pause = settings.RETENTION_BATCH_PAUSE if pause is None else pause
+        self.max_lag = settings.RETENTION_MAX_REPLICATION_LAG if max_lag is None else max_lag
+        self.max_load = settings.RETENTION_MAX_LOAD if max_load is None else max_load
+        self.using = using
+        self.progress = progress or (lambda message: None)
+        self.passes = 0
+
+    def checkpoint(self, restart: bool = False) -> RetentionCheckpoint:
+        """The unfinished run to resume, or a new one from a fresh cutoff."""
+        checkpoint, created = RetentionCheckpoint.objects.using(self.using).get_or_create(
+            policy=self.policy.name, defaults={'cutoff': self.policy.cutoff()},
+        )
+        if not created and (restart or checkpoint.finished_at is not None):
+            checkpoint.cutoff = self.policy.cutoff()
+            checkpoint.last_id = checkpoint.deleted = checkpoint.cascaded = checkpoint.batches = 0
+            checkpoint.throttled_seconds = 0
+            checkpoint.started_at, checkpoint.finished_at = timezone.now(), None
+            checkpoint.save(using=self.using)
+        return checkpoint
+
+    def dry_run(self, restart: bool = False) -> Dict[str, int]:
+        """Rows the purge would delete or detach, without changing anything."""
+        checkpoint = RetentionCheckpoint.objects.using(self.using).filter(
+            policy=self.policy.name, finished_at__isnull=True,
+        ).first()
+        cutoff, last_id = (checkpoint.cutoff, checkpoint.last_id) if checkpoint and not restart else (
+            self.policy.cutoff(), 0
+        )
+        rows = self.policy.queryset(cutoff, self.using).filter(pk__gt=last_id)
+        counts = {self.policy.model._meta.label: rows.count()}
+        for action, relation in self.policy.relations:
+            related = relation.related_model._default_manager.using(self.using).filter(
+                **{f'{relation.field.name}__in': rows.values('pk')}
+            )
+            counts[f'{relation.related_model._meta.label} ({action})'] = related.count()
+        return counts
+
+    def run(self, restart: bool = False, max_seconds: Optional[float] = None) -> RetentionCheckpoint:
+        checkpoint = self.checkpoint(restart)
+        started = time.monotonic()
+        reported, reported_rows = started, checkpoint.deleted
+        while True:
+            waited = self.wait_while_overloaded()
+            if waited:
+                checkpoint.throttled_seconds += waited
+            passes = self.passes
+            deleted = self.batch_with_retries(checkpoint)
+            if not deleted and checkpoint.finished_at is not None:
+                break
+            if self.passes != passes:
+                # Give the transactions holding the skipped rows time to finish
+                time.sleep(RETRY_DELAY)
+            now = time.monotonic()
+            if now - reported >= 5:
+                self.progress(
+                    f"  {self.policy.name}: {checkpoint.deleted} deleted, {checkpoint.cascaded} related, "
+                    f"{(checkpoint.deleted - reported_rows) / (now - reported):.0f} rows/s, last id {checkpoint.last_id}"
+                )
+                reported, reported_rows = now, checkpoint.deleted
+            if max_seconds is not None and now - started >= max_seconds:
+                self.progress(f"  {self.policy.name}: stopping after {max_seconds:.0f}s, resume by running again")
+                break
+            if self.pause:
+                time.sleep(self.pause)
+        logger.info(
+            "Retention purge %s: %d deleted, %d related rows, %d batches, %.0fs throttled%s",
+            self.policy.name, checkpoint.deleted, checkpoint.cascaded, checkpoint.batches,
+            checkpoint.throttled_seconds, '' if checkpoint.finished_at else ' (unfinished)',
+        )
+        return checkpoint
+
+    def wait_while_overloaded(self) -> float:
+        waited, delay = 0.0, 1.0
+        while True:
+            reason = overload(self.max_lag, self.max_load, self.using)
+            if reason is None:
+                return waited
+            if not waited:
+                self.progress(f"  {self.policy.name}: waiting, {reason}")
+            time.sleep(delay)
+            waited += delay
+            delay = min(delay * 2, 30.0)
+
+    def batch_with_retries(self, checkpoint: RetentionCheckpoint) -> int:
+        for attempt in range(LOCK_RETRIES):
+            try:
+                return self.batch(checkpoint)
+            except OperationalError as error:
+                # lock_timeout: back off instead of queueing behind a long transaction
+                if attempt == LOCK_RETRIES - 1 or 'lock' not in str(error).lower():
+                    raise
+                self.progress(f"  {self.policy.name}: lock wait timed out, retrying")
+                time.sleep(2 ** attempt)
+        return 0
+
+    def batch(self, checkpoint: RetentionCheckpoint) -> int:
+        """Purge the next batch; returns rows deleted, 0 (and finishes the checkpoint) when none are left."""
+        connection = connections[self.using]
+        model = self.policy.model
+        quote = connection.ops.quote_name
+        with transaction.atomic(using=self.using), connection.cursor() as cursor:
+            if connection.vendor == 'postgresql':
+                cursor.execute(f"SET LOCAL lock_timeout = '{LOCK_TIMEOUT_MS}ms'")
+            ids = list(
+                self.policy.queryset(checkpoint.cutoff, self.using).filter(pk__gt=checkpoint.last_id)
+                .order_by('pk').select_for_update(skip_locked=True).values_list('pk', flat=True)[:self.batch_size]
+            )
+            if not ids:
+                skipped = self.policy.queryset(checkpoint.cutoff, self.using).filter(pk__lte=checkpoint.last_id)
+                if checkpoint.last_id and skipped.exists():
+                    if self.passes < RETRY_PASSES:
+                        self.passes += 1
+                        self.progress(f"  {self.policy.name}: pass {self.passes + 1} for rows that were locked")
+                        checkpoint.last_id = 0
+                        checkpoint.save(using=self.using)
+                        return 0
+                    logger.warning(
+                        "Retention purge %s: %d rows stayed locked, left for the next run",
+                        self.policy.name, skipped.count(),
+                    )
+                checkpoint.finished_at = timezone.now()
+                checkpoint.save(using=self.using)
+                return 0
+            checkpoint.last_id = ids[-1]
+            if self.policy.kept:
+                # Kept references committed since the rows were selected are visible now,
+                # and new ones wait for this transaction because the rows are locked
+                ids = list(self.policy.queryset(checkpoint.cutoff, self.using).filter(pk__in=ids)
+                           .order_by('pk').values_list('pk', flat=True))
+                if not ids:
+                    checkpoint.batches += 1
+                    checkpoint.save(using=self.using)
+                    return 0
+            placeholders = ', '.join(['%s'] * len(ids))
+            cascaded = 0
+            for action, relation in self.policy.relations:
+                table = quote(relation.related_model._meta.db_table)
+                column = quote(relation.field.column)
+                if action == 'delete':
+                    cursor.execute(f'DELETE FROM {table} WHERE {column} IN ({placeholders})', ids)
+                else:
+                    cursor.execute(f'UPDATE {table} SET {column} = NULL WHERE {column} IN ({placeholders})', ids)
+                cascaded += cursor.rowcount
+            cursor.execute(
+                f'DELETE FROM {quote(model._meta.db_table)} WHERE {quote(model._meta.pk.column)} IN ({placeholders})',
+                ids,
+            )
+            deleted = cursor.rowcount
+            checkpoint.deleted += deleted
+            checkpoint.cascaded += cascaded
+            checkpoint.batches += 1
+            checkpoint.save(using=self.using)
+        return deleted
@@ -0,0 +1,158 @@
+"""
+Precomputed OpenAPI schema.
+
+The schema is generated once at build/deploy time (``manage.py build_schema``)
+and written next to a gzip-compressed copy. ``StaticSchemaView`` serves those
+bytes with a strong ETag and long cache headers instead of introspecting every
+view and serializer on each request.
+"""
+
+import gzip
+import hashlib
+import logging
+import os
+from pathlib import Path
+from typing import Dict, NamedTuple, Optional, Tuple
+
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils.cache import patch_vary_headers
+from django.utils.http import parse_etags
+from django.utils.module_loading import import_string
+from rest_framework.negotiation import BaseContentNegotiation
+from rest_framework.permissions import AllowAny
+from rest_framework.request import Request
+from rest_framework.views import APIView
+
+logger = logging.getLogger(__name__)
+
+# format -> (file name, content type), same media types as drf-spectacular
+SCHEMA_FORMATS: Dict[str, Tuple[str, str]] = {
+    'yaml': ('schema.yaml', 'application/vnd.oai.openapi'),
+    'json': ('schema.json', 'application/vnd.oai.openapi+json'),
+}
+
+
+def generate_schema() -> Dict[str, bytes]:
+    """Render the live OpenAPI schema in every served format."""
+    from drf_spectacular.renderers import OpenApiJsonRenderer, OpenApiYamlRenderer
+    from drf_spectacular.settings import spectacular_settings
+    from rest_framework.settings import api_settings
+
+    generator = spectacular_settings.DEFAULT_GENERATOR_CLASS(api_version=api_settings.DEFAULT_VERSION)
+    schema = generator.get_schema(request=None, public=True)
+    return {
+        'yaml': OpenApiYamlRenderer().render(schema, renderer_context={}),
+        'json': OpenApiJsonRenderer().render(schema, renderer_context={}),
+    }
+
+
+def write_schema(documents: Dict[str, bytes], root: Path) -> None:
+    """Write each document plus a precompressed ``.gz`` copy, atomically."""
+    root.mkdir(parents=True, exist_ok=True)
+    for fmt, content in documents.items():
+        filename = SCHEMA_FORMATS[fmt][0]
+        # mtime=0 keeps the compressed bytes reproducible between builds
+        compressed = gzip.compress(content, compresslevel=9, mtime=0)
+        for name, data in ((filename, content), (filename + '.gz', compressed)):
+            tmp = root / f'.{name}.tmp'
+            tmp.write_bytes(data)
+            os.replace(tmp, root / name)
+
+
+def read_stored_schema(root: Path) -> Dict[str, bytes]:
+    return {
+        fmt: (root / filename).read_bytes()
+        for fmt, (filename, _) in SCHEMA_FORMATS.items()
+        if (root / filename).is_file()
+    }
+
+
+class SchemaDocument(NamedTuple):
+    mtime: float
+    content: bytes
+    compressed: bytes
+    etag: str
+
+
+# Loaded documents per path, reloaded when the file on disk changes
+_documents: Dict[Path, SchemaDocument] = {}
+
+
+def load_document(path: Path) -> Optional[SchemaDocument]:
+    try:
+        mtime = path.stat().st_mtime
+    except FileNotFoundError:
+        return None
+    document = _documents.get(path)
+    if document is None or document.mtime != mtime:
+        content = path.read_bytes()
+        gz_path = path.with_name(path.name + '.gz')
+        compressed = gz_path.read_bytes() if gz_path.is_file() else gzip.compress(content, mtime=0)
+        etag = hashlib.sha256(content).hexdigest()[:32]
+        document = SchemaDocument(mtime, content, compressed, etag)
+        _documents[path] = document
+    return document
+
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    """If-None-Match (weak comparison, RFC 9110 13.1.2) against the ETag being served."""
+    tags = parse_etags(if_none_match)
+    return tags == ['*'] or any(tag.removeprefix('W/') == etag for tag in tags)
+
+
+class RawBytesNegotiation(BaseContentNegotiation):
+    """The view returns ready-made bytes, so DRF never renders anything"""
+
+    def select_parser(self, request, parsers):
+        return parsers[0] if parsers else None
+
+    def select_renderer(self, request, renderers, format_suffix=None):
+        return (renderers[0], renderers[0].media_type)
+
+
+class StaticSchemaView(APIView):
+    """
+    OpenAPI schema written by ``manage.py build_schema``.
+
+    Format is chosen like drf-spectacular's view: ``?format=json|yaml`` or the
+    Accept header, YAML by default. Falls back to live generation when the
+    stored schema is missing.
+    """
+    permission_classes = [AllowAny]
+    content_negotiation_class = RawBytesNegotiation
+    schema = None
+
+    def get(self, request: Request, *args, **kwargs) -> HttpResponse:
+        fmt = self.get_format(request)
+        filename, content_type = SCHEMA_FORMATS[fmt]
+        document = load_document(Path(settings.API_SCHEMA_ROOT) / filename)
+        if document is None:
+            logger.warning("Stored schema %s not found, generating it live", filename)
+            live_view = import_string('drf_spectacular.views.SpectacularAPIView').as_view()
+            return live_view(request._request, *args, **kwargs)
+
+        use_gzip = 'gzip' in request.META.get('HTTP_ACCEPT_ENCODING', '')
+        # A strong ETag identifies one representation, so the encodings differ
+        etag = f'"{document.etag}-gz"' if use_gzip else f'"{document.etag}"'
+        if etag_matches(request.META.get('HTTP_IF_NONE_MATCH', ''), etag):
+            response: HttpResponse = HttpResponseNotModified()
+        else:
+            response = HttpResponse(
+                document.compressed if use_gzip else document.content,
+                content_type=content_type,
+            )
+            if use_gzip:
+                response['Content-Encoding'] = 'gzip'
+            response['Content-Disposition'] = f'inline; filename="{filename}"'
+        response['ETag'] = etag
+        response['Cache-Control'] = f'public, max-age={settings.API_SCHEMA_CACHE_MAX_AGE}'
+        patch_vary_headers(response, ('Accept', 'Accept-Encoding'))
+        return response
+
+    @staticmethod
+    def get_format(request: Request) -> str:
+        requested = request.query_params.get('format')
+        if requested in SCHEMA_FORMATS:
+            return requested
+        return 'json' if 'json' in request.META.get('HTTP_ACCEPT', '') else 'yaml'
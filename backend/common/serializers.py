@@ -1,7 +1,9 @@
 # serializers.py
 from typing import Dict, Any, Optional, List
+from django.conf import settings
 from rest_framework import serializers
-from .models import Lead, Newsletter
+from .models import CATEGORY_CHOICES, Client, Lead, LeadStatusEvent, Newsletter
+from .validation import is_disposable_email
 import re
 
 class LeadSerializer(serializers.ModelSerializer):
@@ -12,8 +14,9 @@ class LeadSerializer(serializers.ModelSerializer):
             'id', 'full_name', 'position', 'company_name',
             'phone_number', 'email', 'source', 'status',
             'notes', 'created_at', 'updated_at', 'category',
+            'duplicate_of', 'score',
         ]
-        read_only_fields: List[str] = ['id', 'created_at', 'updated_at']
+        read_only_fields: List[str] = ['id', 'created_at', 'updated_at', 'duplicate_of', 'score']
 
     def validate_full_name(self, value: str) -> str:
         """Validate name is not just whitespace or numbers"""
@@ -47,15 +50,9 @@ class LeadSerializer(serializers.ModelSerializer):
     def validate_email(self, value: Optional[str]) -> Optional[str]:
         """Additional email validation beyond model EmailField"""
         if value:
-            # Block disposable email domains
-            disposable_domains: List[str] = [
-                'tempmail.com', 'throwaway.email', '10minutemail.com',
-                'guerrillamail.com', 'mailinator.com', 'maildrop.cc'
-            ]
-            if '@' in value:
-                domain: str = value.split('@')[1].lower()
-                if domain in disposable_domains:
-                    raise serializers.ValidationError("Please use a valid business email")
+            # Block disposable email domains (and their subdomains)
+            if is_disposable_email(value):
+                raise serializers.ValidationError("Please use a valid business email")
         return value.lower() if value else value
 
     def validate_notes(self, value: Optional[str]) -> Optional[str]:
@@ -91,14 +88,80 @@ class NewsletterSerializer(serializers.ModelSerializer):
         if not value or not value.strip():
             raise serializers.ValidationError("Email is required")
 
-        # Block disposable email domains
-        disposable_domains: List[str] = [
-            'tempmail.com', 'throwaway.email', '10minutemail.com',
-            'guerrillamail.com', 'mailinator.com', 'maildrop.cc'
-        ]
-        if '@' in value:
-            domain: str = value.split('@')[1].lower()
-            if domain in disposable_domains:
-                raise serializers.ValidationError("Please use a valid email address")
+        # Block disposable email domains (and their subdomains)
+        if is_disposable_email(value):
+            raise serializers.ValidationError("Please use a valid email address")
+
+        return value.lower().strip()
+
+
+class LeadStatusEventSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = LeadStatusEvent
+        fields: List[str] = ['id', 'lead', 'from_status', 'to_status', 'at']
+        read_only_fields: List[str] = fields
+
+
+class LeadBulkFilterSerializer(serializers.Serializer):
+    """Which leads a bulk update applies to; every given criterion must match"""
+    status = serializers.ChoiceField(choices=Lead._meta.get_field('status').choices, required=False)
+    category = serializers.ChoiceField(choices=CATEGORY_CHOICES, required=False)
+    source = serializers.ChoiceField(choices=Lead._meta.get_field('source').choices, required=False)
+    created_after = serializers.DateTimeField(required=False)
+    created_before = serializers.DateTimeField(required=False)
+
+    def validate(self, data: Dict[str, Any]) -> Dict[str, Any]:
+        if not data:
+            raise serializers.ValidationError("Give at least one criterion, or use ids")
+        return data
+
+    @staticmethod
+    def to_lookups(criteria: Dict[str, Any]) -> Dict[str, Any]:
+        lookups: Dict[str, Any] = dict(criteria)
+        if 'created_after' in lookups:
+            lookups['created_at__gte'] = lookups.pop('created_after')
+        if 'created_before' in lookups:
+            lookups['created_at__lt'] = lookups.pop('created_before')
+        return lookups
+
+
+class LeadBulkChangeSerializer(serializers.Serializer):
+    status = serializers.ChoiceField(choices=Lead._meta.get_field('status').choices, required=False)
+    category = serializers.ChoiceField(choices=CATEGORY_CHOICES, required=False)
+
+    def validate(self, data: Dict[str, Any]) -> Dict[str, Any]:
+        if not data:
+            raise serializers.ValidationError("Set status, category or both")
+        return data
+
+
+class LeadSelectionSerializer(serializers.Serializer):
+    """The leads of a bulk operation: ``{"ids": [...]}`` or ``{"filter": {...}}``"""
+    ids = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        required=False,
+        allow_empty=False,
+        max_length=settings.LEAD_BULK_UPDATE_MAX_IDS,
+    )
+    filter = LeadBulkFilterSerializer(required=False)
+    dry_run = serializers.BooleanField(default=False)
+
+    def validate(self, data: Dict[str, Any]) -> Dict[str, Any]:
+        if ('ids' in data) == ('filter' in data):
+            raise serializers.ValidationError("Give exactly one of ids or filter")
+        return data
+
+    def lookups(self) -> Dict[str, Any]:
+        if 'ids' in self.validated_data:
+            return {'id__in': self.validated_data['ids']}
+        return LeadBulkFilterSerializer.to_lookups(self.validated_data['filter'])
+
+
+class LeadBulkUpdateSerializer(LeadSelectionSerializer):
+    """Selected leads plus ``{"set": {...}}``"""
+    set = LeadBulkChangeSerializer()
+
 
-        return value.lower().strip()
\ No newline at end of file
+class LeadConvertSerializer(LeadSelectionSerializer):
+    """Selected leads plus the ``team_id`` of the clients created for them"""
+    team_id = serializers.CharField(max_length=Client._meta.get_field('team_id').max_length)
@@ -0,0 +1,41 @@
+import uuid
+
+import pytest
+from django.test import Client as TestClient
+
+from common.authentication import key_cache
+from common.models import APIKey, Lead
+
+
+@pytest.fixture(autouse=True)
+def clear_key_cache():
+    key_cache.clear()
+    yield
+    key_cache.clear()
+
+
+@pytest.fixture
+def api_key(db) -> str:
+    _, key = APIKey.generate(f'test-{uuid.uuid4().hex[:8]}')
+    return key
+
+
+@pytest.fixture
+def api_client(api_key) -> TestClient:
+    return TestClient(HTTP_AUTHORIZATION=f'Basic {api_key}')
+
+
+@pytest.fixture
+def admin_client(db, django_user_model) -> TestClient:
+    client = TestClient()
+    client.force_login(django_user_model.objects.create_superuser('admin', password=None))
+    return client
+
+
+def make_lead(**fields) -> Lead:
+    tag = uuid.uuid4().hex[:8]
+    defaults = {
+        'full_name': f'Lead {tag}', 'position': 'CTO', 'company_name': f'Company {tag}',
+        'email': f'lead-{tag}@example.com', 'source': 'website',
+    }
+    return Lead.objects.create(**{**defaults, **fields})
@@ -0,0 +1,89 @@
+import logging
+import time
+
+import pytest
+
+from common.admission import AdmissionController, ShedRequestFilter
+from common.models import Lead
+
+LEADS = '/backend/api/v1/leads/'
+
+
+@pytest.fixture
+def overloaded(settings, monkeypatch):
+    settings.ADMISSION_CONTROL = True
+    settings.ADMISSION_QUEUE_BUDGET_MS = 500
+    settings.ADMISSION_WRITE_QUEUE_BUDGET_MS = 5000
+    settings.ADMISSION_MAX_QUEUE_MS = 10000
+    monkeypatch.setattr('common.admission.admission', AdmissionController())
+    # Queued two seconds, four times the budget
+    return {'HTTP_X_REQUEST_START': f't={time.time() - 2:.3f}', 'secure': True}
+
+
+@pytest.fixture
+def request_records():
+    records = []
+    handler = logging.Handler()
+    handler.emit = records.append
+    logger = logging.getLogger('django.request')
+    logger.addHandler(handler)
+    yield records
+    logger.removeHandler(handler)
+
+
+def test_lead_form_and_signup_are_priority_writes(settings):
+    controller = AdmissionController()
+
+    assert controller.priority('POST', '/backend/api/v1/leads/') == 'write'
+    assert controller.priority('POST', '/backend/api/newsletter/') == 'write'
+    assert controller.priority('GET', '/backend/api/v1/leads/') == 'low'
+    assert controller.priority('POST', '/backend/api/v1/leads/convert/') == 'low'
+    assert controller.priority('GET', '/backend/health/') == 'exempt'
+
+
+def test_reads_are_shed_writes_admitted(api_client, overloaded, request_records):
+    shed = api_client.get(LEADS, **overloaded)
+
+    assert shed.status_code == 503
+    assert int(shed['Retry-After']) >= 2
+    assert shed['X-Shed-Reason'].startswith('queued')
+    assert not request_records
+
+    created = api_client.post(
+        LEADS,
+        {'full_name': 'Ana Horvat', 'position': 'CTO', 'company_name': 'Acme', 'email': 'ana@example.com'},
+        content_type='application/json',
+        **overloaded,
+    )
+
+    assert created.status_code == 201
+    assert Lead.objects.filter(email='ana@example.com').exists()
+
+
+def test_write_spike_is_shed_after_write_budget(settings):
+    settings.ADMISSION_QUEUE_BUDGET_MS = 500
+    settings.ADMISSION_WRITE_QUEUE_BUDGET_MS = 2000
+    settings.ADMISSION_MAX_QUEUE_MS = 10000
+    controller = AdmissionController()
+
+    assert controller.admit('write', 1.5)[0]
+    assert not controller.admit('low', 1.5)[0]
+    admitted, reason = controller.admit('write', 3.0)
+    assert not admitted and reason == 'queued 3000ms'
+    assert controller.admit('exempt', 30.0)[0]
+    # A sustained spike keeps the average above the write budget
+    for _ in range(20):
+        controller.admit('write', 2.5)
+    admitted, reason = controller.admit('write', 0.1)
+    assert not admitted and reason.startswith('queue time')
+
+
+def test_only_shed_requests_are_filtered(rf):
+    shed_filter = ShedRequestFilter()
+    request = rf.get(LEADS)
+    record = logging.LogRecord('django.request', logging.ERROR, '', 0, 'Service Unavailable', None, None)
+    record.request = request
+
+    assert shed_filter.filter(record)
+    request.admission_shed = 'queued 2000ms'
+    assert not shed_filter.filter(record)
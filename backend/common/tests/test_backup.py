@@ -0,0 +1,87 @@
+import json
+
+import pytest
+from django.db import connection
+
+from common.backup import BackupError, DEFAULT_MODELS, RESTORE_STATE, export, plan_truncate, restore
+from common.models import Campaign, CampaignDelivery, Lead, LeadStatusEvent, Newsletter
+
+from .conftest import make_lead
+
+pytestmark = [
+    pytest.mark.django_db(transaction=True),
+    pytest.mark.skipif(connection.vendor != 'postgresql', reason="backups use COPY"),
+]
+
+
+def quiet(message: str) -> None:
+    pass
+
+
+@pytest.fixture
+def crm():
+    lead = make_lead()
+    lead.status = 'contacted'
+    lead.save()
+    subscriber = Newsletter.objects.create(email='reader@example.com')
+    campaign = Campaign.objects.create(subject='News', body_text='Hello')
+    CampaignDelivery.objects.create(campaign=campaign, subscriber=subscriber, email=subscriber.email, state='sent')
+
+
+def test_round_trip_keeps_history_and_deliveries(crm, tmp_path):
+    export(str(tmp_path), list(DEFAULT_MODELS), 2, 1000, 1, quiet)
+    make_lead()
+
+    assert set(plan_truncate(str(tmp_path))) >= {'common_lead', 'common_leadstatusevent', 'common_campaigndelivery'}
+    restore(str(tmp_path), 2, True, '64MB', quiet)
+
+    assert Lead.objects.count() == 1
+    assert LeadStatusEvent.objects.count() == 2
+    assert CampaignDelivery.objects.get().state == 'sent'
+
+
+def test_refuses_to_wipe_unexported_dependents(crm, tmp_path):
+    export(str(tmp_path), ['lead', 'client', 'newsletter'], 2, 1000, 1, quiet)
+
+    with pytest.raises(BackupError, match='common_leadstatusevent'):
+        plan_truncate(str(tmp_path))
+    with pytest.raises(BackupError, match='common_campaigndelivery'):
+        restore(str(tmp_path), 2, True, '64MB', quiet)
+
+    assert LeadStatusEvent.objects.count() == 2
+    assert CampaignDelivery.objects.count() == 1
+
+
+def foreign_keys_and_triggers(table: str):
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT count(*) FROM pg_constraint WHERE conrelid = %s::regclass AND contype = 'f'", [table])
+        foreign_keys = cursor.fetchone()[0]
+        cursor.execute(
+            "SELECT count(*) FROM pg_trigger WHERE tgrelid = %s::regclass AND NOT tgisinternal AND tgenabled = 'O'",
+            [table],
+        )
+        return foreign_keys, cursor.fetchone()[0]
+
+
+def test_interrupted_preparation_is_repeated(crm, tmp_path):
+    export(str(tmp_path), list(DEFAULT_MODELS), 2, 1000, 1, quiet)
+    before = foreign_keys_and_triggers('common_campaigndelivery')
+    assert before[0]
+
+    def die_after_first_table(message: str) -> None:
+        if 'dropped' in message and 'common_lead:' not in message:
+            raise KeyboardInterrupt
+
+    with pytest.raises(KeyboardInterrupt):
+        restore(str(tmp_path), 2, True, '64MB', die_after_first_table)
+
+    # Rolled back: nothing dropped, and the next run prepares again
+    assert foreign_keys_and_triggers('common_campaigndelivery') == before
+    assert json.loads((tmp_path / RESTORE_STATE).read_text())['phase'] == 'prepare'
+    assert Lead.objects.count() == 1
+
+    restore(str(tmp_path), 2, True, '64MB', quiet)
+
+    assert foreign_keys_and_triggers('common_campaigndelivery') == before
+    assert Lead.objects.count() == 1
+    assert CampaignDelivery.objects.get().state == 'sent'
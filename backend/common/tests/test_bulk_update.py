@@ -0,0 +1,92 @@
+from contextlib import contextmanager
+
+import pytest
+from django.db import transaction
+
+from common import models
+from common.models import Lead, LeadStatusEvent
+
+from .conftest import make_lead
+
+URL = '/backend/api/v1/leads/bulk-update/'
+
+
+def post(client, body):
+    return client.post(URL, body, content_type='application/json', secure=True)
+
+
+@pytest.mark.django_db
+def test_ids_or_filter_exactly(api_client):
+    lead = make_lead()
+
+    assert post(api_client, {'set': {'status': 'contacted'}}).status_code == 400
+    assert post(api_client, {
+        'ids': [lead.pk], 'filter': {'status': 'new'}, 'set': {'status': 'contacted'},
+    }).status_code == 400
+    assert post(api_client, {'filter': {}, 'set': {'status': 'contacted'}}).status_code == 400
+    assert post(api_client, {'ids': [lead.pk], 'set': {}}).status_code == 400
+
+
+@pytest.mark.django_db
+def test_dry_run_counts_without_writing(api_client):
+    make_lead(status='contacted')
+    make_lead()
+    make_lead()
+
+    response = post(api_client, {'filter': {'source': 'website'}, 'set': {'status': 'contacted'}, 'dry_run': True})
+
+    assert response.json() == {'matched': 3, 'updated': 2, 'dry_run': True}
+    assert Lead.objects.filter(status='contacted').count() == 1
+
+
+@pytest.mark.django_db
+def test_only_changed_leads_are_written_and_recorded(api_client, settings):
+    settings.LEAD_BULK_UPDATE_BATCH_SIZE = 2
+    done = make_lead(status='contacted')
+    leads = [make_lead() for _ in range(3)]
+    before = Lead.objects.get(pk=done.pk).updated_at
+
+    response = post(api_client, {'ids': [done.pk] + [lead.pk for lead in leads], 'set': {'status': 'contacted'}})
+
+    assert response.json() == {'matched': 4, 'updated': 3, 'dry_run': False}
+    assert Lead.objects.get(pk=done.pk).updated_at == before
+    events = LeadStatusEvent.objects.filter(to_status='contacted', from_status='new')
+    assert sorted(events.values_list('lead_id', flat=True)) == [lead.pk for lead in leads]
+
+
+@pytest.mark.django_db
+def test_leads_leaving_the_selection_are_not_updated(monkeypatch):
+    leads = [make_lead() for _ in range(2)]
+    atomic = transaction.atomic
+    moved = []
+
+    @contextmanager
+    def move_then_atomic(*args, **kwargs):
+        # Another request closes a lead after its id was read, before the UPDATE
+        if not moved:
+            moved.append(leads[0].pk)
+            Lead.objects.filter(pk=leads[0].pk).update(status='closed')
+        with atomic(*args, **kwargs):
+            yield
+
+    monkeypatch.setattr(models.transaction, 'atomic', move_then_atomic)
+    matched, updated = Lead.objects.filter(status='new').update_in_batches(status='contacted')
+
+    assert (matched, updated) == (2, 1)
+    assert Lead.objects.get(pk=leads[0].pk).status == 'closed'
+    assert Lead.objects.get(pk=leads[1].pk).status == 'contacted'
+
+
+@pytest.mark.django_db
+def test_admin_action(admin_client):
+    leads = [make_lead(), make_lead(status='interested')]
+
+    response = admin_client.post('/backend/admin/common/lead/', {
+        'action': 'bulk_update', '_selected_action': [lead.pk for lead in leads], 'status': 'interested',
+    }, secure=True, follow=True)
+
+    assert [str(message) for message in response.context['messages']] == [
+        "Updated 1 of 2 selected leads (1 already set)",
+    ]
+    assert set(Lead.objects.values_list('status', flat=True)) == {'interested'}
+    assert LeadStatusEvent.objects.filter(lead=leads[0], to_status='interested').exists()
@@ -0,0 +1,32 @@
+import pytest
+
+from common.models import Client, Lead, LeadQuerySet
+
+from .conftest import make_lead
+
+
+@pytest.mark.django_db
+def test_convert_reports_existing_clients():
+    leads = [make_lead() for _ in range(3)]
+    Client.objects.create(client_info=leads[1], team_id='other')
+
+    result = Lead.objects.filter(pk__in=[lead.pk for lead in leads]).convert_to_clients('team')
+
+    assert result['converted'] == [leads[0].pk, leads[2].pk]
+    assert result['already_client'] == [leads[1].pk]
+
+
+@pytest.mark.django_db
+def test_convert_survives_concurrent_conversion(monkeypatch):
+    leads = [make_lead() for _ in range(3)]
+    # Created by a concurrent conversion after this one checked for clients
+    Client.objects.create(client_info=leads[1], team_id='other')
+    monkeypatch.setattr(LeadQuerySet, '_client_lead_ids', lambda self, lead_ids: set())
+
+    result = Lead.objects.filter(pk__in=[lead.pk for lead in leads]).convert_to_clients('team')
+
+    assert result['converted'] == [leads[0].pk, leads[2].pk]
+    assert result['already_client'] == [leads[1].pk]
+    assert Client.objects.get(client_info=leads[1]).team_id == 'other'
+    assert Client.objects.filter(team_id='team').count() == 2
+    assert set(Lead.objects.filter(status='converted').values_list('pk', flat=True)) == {leads[0].pk, leads[2].pk}
@@ -0,0 +1,66 @@
+import threading
+import time
+
+import pytest
+from django.db import connection
+
+from common import dedup
+from common.dedup import normalize_phone, save_new_lead
+from common.models import Lead
+
+
+@pytest.mark.parametrize('phone, key', [
+    ('+385 91 123 4567', '385911234567'),
+    ('00385911234567', '385911234567'),
+    ('091 123 4567', '385911234567'),
+    ('+386 91 123 4567', '386911234567'),
+    ('+1 (415) 555-1234', '14155551234'),
+    ('12345', None),
+])
+def test_phone_key_keeps_the_country_code(phone, key):
+    assert normalize_phone(phone, country_code='385') == key
+
+
+def test_bulk_created_leads_get_dedup_keys(db):
+    lead, = Lead.objects.bulk_create([
+        Lead(full_name='Ana Horvat', position='CEO', company_name='Acme d.o.o.',
+             email='Ana.Horvat+news@example.com', phone_number='+385911234567'),
+    ])
+    lead.refresh_from_db()
+    assert (lead.email_key, lead.phone_key, lead.name_key) == (
+        'ana.horvat@example.com', '385911234567', 'ana horvat|acme',
+    )
+    duplicate, merged = save_new_lead(Lead(full_name='A. Nother', position='-', email='ana.horvat@example.com'))
+    assert duplicate.duplicate_of_id == lead.id and not merged
+
+
+@pytest.mark.django_db(transaction=True)
+def test_concurrent_submissions_are_flagged(monkeypatch):
+    if connection.vendor != 'postgresql':
+        pytest.skip("advisory locks are PostgreSQL only")
+    find_original = dedup.find_original
+
+    def slow_find_original(lead):
+        # Widen the window between the lookup and the insert
+        original = find_original(lead)
+        time.sleep(0.3)
+        return original
+
+    monkeypatch.setattr(dedup, 'find_original', slow_find_original)
+    start = threading.Barrier(2)
+
+    def submit():
+        start.wait()
+        try:
+            save_new_lead(Lead(full_name='Same Person', position='CTO', email='same@example.com'), mode='flag')
+        finally:
+            connection.close()
+
+    threads = [threading.Thread(target=submit) for _ in range(2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    leads = list(Lead.objects.filter(email_key='same@example.com').order_by('id'))
+    assert len(leads) == 2
+    assert leads[0].duplicate_of_id is None and leads[1].duplicate_of_id == leads[0].id
@@ -0,0 +1,96 @@
+import pytest
+from django.test import RequestFactory
+from django.utils import timezone
+from rest_framework.exceptions import AuthenticationFailed
+
+from common.authentication import key_cache, sign_stream_token
+from common.events import Cursor, current_cursor, replay
+from common.models import APIKey, LeadStatusEvent
+from common.views import authenticate_stream
+
+from .conftest import make_lead
+
+
+def test_cursor_accepts_late_event_once():
+    cursor = Cursor(10, window=100)
+
+    assert cursor.accept(13)
+    assert cursor.token() == '13~11-12'
+    assert cursor.accept(11)  # committed after 13
+    assert not cursor.accept(11)
+    assert not cursor.accept(13)
+    assert cursor.token() == '13~12'
+
+
+def test_cursor_forgets_gaps_outside_window():
+    cursor = Cursor(10, window=5)
+    cursor.accept(12)
+    cursor.accept(20)
+
+    assert cursor.token() == '20~16-19'
+    assert not cursor.accept(11)
+
+
+def test_cursor_token_round_trip(settings):
+    settings.LEAD_STREAM_REORDER_WINDOW = 100
+    cursor = Cursor.parse('50~20,30-32')
+
+    assert cursor.token() == '50~20,30-32'
+    assert Cursor.parse('50').token() == '50'
+    with pytest.raises(ValueError):
+        Cursor.parse('50~x')
+
+
+@pytest.mark.django_db
+def test_replay_sends_late_commits_without_repeats(settings):
+    settings.LEAD_STREAM_REORDER_WINDOW = 100
+    ids = [make_lead().status_events.get().id for _ in range(4)]
+    # The client saw the newest event while the second one was not committed yet
+    client = Cursor(ids[0])
+    client.accept(ids[2])
+
+    backlog, cursor = replay(client, limit=10)
+
+    replayed = [int(chunk.split(b'"id":')[1].split(b',')[0]) for chunk in backlog]
+    assert replayed == [ids[1], ids[3]]
+    assert cursor.high == ids[3] and not cursor.gaps
+
+
+@pytest.mark.django_db
+def test_current_cursor_treats_missing_ids_as_gaps(settings):
+    settings.LEAD_STREAM_REORDER_WINDOW = 100
+    ids = [make_lead().status_events.get().id for _ in range(3)]
+    LeadStatusEvent.objects.filter(id=ids[1]).delete()
+
+    cursor = current_cursor()
+
+    assert cursor.high == ids[2]
+    assert cursor.accept(ids[1])
+    assert not cursor.accept(ids[0])
+
+
+@pytest.mark.django_db
+def test_stream_token_authenticates(api_client, api_key):
+    response = api_client.post('/backend/api/v1/leads/stream-token/', secure=True)
+    assert response.status_code == 200
+    request = RequestFactory().get('/backend/api/v1/leads/stream/', {'token': response.json()['token']})
+
+    authenticate_stream(request)
+
+    APIKey.objects.filter(key_hash=APIKey.hash_key(api_key)).update(revoked_at=timezone.now())
+    key_cache.clear()
+    with pytest.raises(AuthenticationFailed):
+        authenticate_stream(request)
+
+
+@pytest.mark.django_db
+def test_stream_token_rejects_tampering(settings):
+    settings.BASIC_API_KEY = 'legacy-key'
+    token = sign_stream_token('legacy-key')
+    factory = RequestFactory()
+
+    authenticate_stream(factory.get('/', {'token': token}))
+    with pytest.raises(AuthenticationFailed):
+        authenticate_stream(factory.get('/', {'token': token[:-2] + 'xx'}))
+    with pytest.raises(AuthenticationFailed):
+        authenticate_stream(factory.get('/'))
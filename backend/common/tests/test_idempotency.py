@@ -0,0 +1,56 @@
+import pytest
+from django.core.cache import cache
+
+from common.checks import check_idempotency_cache
+from common.models import Newsletter
+
+URL = '/backend/api/v1/newsletter/'
+
+
+@pytest.fixture(autouse=True)
+def clear_cache():
+    cache.clear()
+    yield
+    cache.clear()
+
+
+def post(client, body, key='retry-1'):
+    return client.post(URL, body, content_type='application/json', secure=True, HTTP_IDEMPOTENCY_KEY=key)
+
+
+def test_success_is_replayed(api_client):
+    first = post(api_client, {'email': 'reader@example.com'})
+    second = post(api_client, {'email': 'reader@example.com'})
+
+    assert first.status_code == second.status_code == 201
+    assert second['Idempotent-Replayed'] == 'true'
+    assert second.content == first.content
+    assert Newsletter.objects.count() == 1
+
+
+def test_client_error_is_not_replayed(api_client):
+    assert post(api_client, {'email': 'not-an-email'}).status_code == 400
+
+    retried = post(api_client, {'email': 'not-an-email'})
+
+    assert retried.status_code == 400
+    assert not retried.has_header('Idempotent-Replayed')
+
+
+def test_concurrent_duplicate_conflicts_immediately(api_client, monkeypatch):
+    # Another worker holds the lock for this key and has not stored a response yet
+    monkeypatch.setattr(cache, 'add', lambda *args, **kwargs: False)
+
+    response = post(api_client, {'email': 'reader@example.com'})
+
+    assert response.status_code == 409
+    assert response['Retry-After'] == '1'
+    assert not Newsletter.objects.exists()
+
+
+def test_deploy_check_needs_shared_cache(settings):
+    settings.CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+    assert [error.id for error in check_idempotency_cache()] == ['common.E003']
+
+    settings.CACHES = {'default': {'BACKEND': 'django.core.cache.backends.redis.RedisCache', 'LOCATION': 'redis://x'}}
+    assert check_idempotency_cache() == []
@@ -0,0 +1,101 @@
+import json
+import logging
+import sys
+
+import pytest
+from django.core import mail
+from django.core.cache import cache
+from django.test import RequestFactory
+
+from common.log import DeduplicatedAdminEmailHandler, JSONFormatter, QueueHandler, RateLimitFilter, queue_loggers
+
+
+def make_record(msg='Something happened', level=logging.WARNING, lineno=10, **extra) -> logging.LogRecord:
+    record = logging.LogRecord('common.test', level, '/app/common/views.py', lineno, msg, None, None)
+    record.__dict__.update(extra)
+    return record
+
+
+def test_json_formatter_includes_extra_fields_and_request():
+    request = RequestFactory().post('/backend/api/v1/leads/')
+    try:
+        raise ValueError('boom')
+    except ValueError:
+        record = make_record(level=logging.ERROR, lead_id=7, request=request)
+        record.exc_info = sys.exc_info()
+
+    entry = json.loads(JSONFormatter().format(record))
+
+    assert entry['message'] == 'Something happened'
+    assert entry['level'] == 'ERROR'
+    assert entry['lead_id'] == 7
+    assert entry['request'] == {'method': 'POST', 'path': '/backend/api/v1/leads/'}
+    assert 'ValueError: boom' in entry['exception']
+
+
+def test_rate_limit_filter_samples_after_burst():
+    rate_limit = RateLimitFilter(burst=3, period=60, sample=5)
+
+    passed = [rate_limit.filter(make_record()) for _ in range(13)]
+
+    assert passed == [True] * 3 + [False] * 4 + [True] + [False] * 4 + [True]
+    assert rate_limit.filter(make_record(level=logging.INFO))
+    assert rate_limit.filter(make_record(lineno=11))
+
+
+def test_rate_limit_filter_reports_suppressed():
+    rate_limit = RateLimitFilter(burst=1, period=60, sample=3)
+    records = [make_record() for _ in range(4)]
+
+    assert [rate_limit.filter(record) for record in records] == [True, False, False, True]
+    assert records[3].suppressed == 2
+    # Decided once per record, whatever the number of handlers it filters
+    assert rate_limit.filter(records[1]) is False
+
+
+@pytest.fixture
+def admins(settings):
+    settings.ADMINS = [('Admin', 'admin@example.com')]
+    settings.EMAIL_BACKEND = 'django.core.mail.backends.locmem.EmailBackend'
+    cache.clear()
+    yield
+    cache.clear()
+
+
+def test_admin_mail_deduplicated(admins):
+    handler = DeduplicatedAdminEmailHandler(interval=600)
+
+    for _ in range(3):
+        handler.emit(make_record(level=logging.ERROR))
+    handler.emit(make_record('Other error', level=logging.ERROR, lineno=20))
+
+    assert len(mail.outbox) == 2
+    cache.delete(f'admin-mail:{handler.signature(make_record(level=logging.ERROR))}')
+    handler.emit(make_record(level=logging.ERROR))
+    assert mail.outbox[-1].body.startswith("2 more occurrences of this error were not mailed")
+
+
+def test_queue_keeps_admin_mail_on_request_thread(admins):
+    logger = logging.getLogger('common.test.queue')
+    stream, mailer = logging.StreamHandler(), DeduplicatedAdminEmailHandler()
+    logger.handlers = [stream, mailer]
+    try:
+        queue_loggers(['common.test.queue'])
+
+        assert isinstance(logger.handlers[0], QueueHandler)
+        assert logger.handlers[0].targets == (stream,)
+        assert logger.handlers[1] is mailer
+    finally:
+        logger.handlers = []
+
+
+def test_queued_records_carry_a_request_snapshot():
+    request = RequestFactory().get('/backend/api/v1/leads/')
+    record = make_record('Lead %s', request=request)
+    record.args = (7,)
+
+    prepared = QueueHandler([logging.NullHandler()]).prepare(record)
+
+    assert prepared.getMessage() == 'Lead 7'
+    assert prepared.request == ('GET', '/backend/api/v1/leads/')
+    assert record.request is request
@@ -0,0 +1,162 @@
+import logging
+import socket
+import threading
+from functools import partial
+
+import pytest
+from aiosmtpd.controller import Controller
+from django.core.mail import get_connection
+from django.db import connection
+
+from common.mailing import CampaignError, campaign_lock, send_campaign
+from common.models import Campaign, Newsletter
+
+logging.getLogger('mail.log').setLevel(logging.WARNING)
+
+
+class Recorder:
+    def __init__(self) -> None:
+        self.recipients = []
+        self.refuse = {}  # address -> how many more times to answer 451
+
+    async def handle_RCPT(self, server, session, envelope, address, rcpt_options):
+        if self.refuse.get(address):
+            self.refuse[address] -= 1
+            return '451 Try again later'
+        envelope.rcpt_tos.append(address)
+        return '250 OK'
+
+    async def handle_DATA(self, server, session, envelope):
+        self.recipients.extend(envelope.rcpt_tos)
+        return '250 OK'
+
+
+@pytest.fixture
+def smtp():
+    with socket.socket() as probe:
+        probe.bind(('127.0.0.1', 0))
+        port = probe.getsockname()[1]
+    handler = Recorder()
+    controller = Controller(handler, hostname='127.0.0.1', port=port)
+    controller.start()
+    yield handler, partial(get_connection, 'django.core.mail.backends.smtp.EmailBackend', host='127.0.0.1', port=port)
+    controller.stop()
+
+
+@pytest.fixture
+def campaign(db) -> Campaign:
+    for number in range(5):
+        Newsletter.objects.create(email=f'reader{number}@example.com')
+    return Campaign.objects.create(subject='News', body_text='Hello', from_email='news@example.com')
+
+
+def run(campaign, connection_factory, **options):
+    return send_campaign(campaign, concurrency=2, rate=0, connection_factory=connection_factory, **options)
+
+
+def test_sends_to_every_subscriber(smtp, campaign):
+    handler, connection_factory = smtp
+    Newsletter.objects.create(email='gone@example.com', is_subscribed=False)
+
+    totals = run(campaign, connection_factory)
+
+    assert sorted(handler.recipients) == [f'reader{number}@example.com' for number in range(5)]
+    assert totals['sent'] == 5
+    campaign.refresh_from_db()
+    assert campaign.status == 'sent'
+
+
+def test_resume_skips_unsubscribed(smtp, campaign, monkeypatch):
+    handler, connection_factory = smtp
+    # An interrupted run: deliveries queued, nothing sent yet
+    monkeypatch.setattr('common.mailing.ParallelSender.send_all', lambda self, messages: iter(()))
+    run(campaign, connection_factory)
+    monkeypatch.undo()
+    Newsletter.objects.filter(email='reader3@example.com').update(is_subscribed=False)
+
+    totals = run(campaign, connection_factory)
+
+    assert 'reader3@example.com' not in handler.recipients
+    assert len(handler.recipients) == 4
+    assert totals['cancelled'] == 1
+    assert campaign.deliveries.get(email='reader3@example.com').state == 'cancelled'
+    campaign.refresh_from_db()
+    assert campaign.status == 'sent'
+
+
+def test_transient_failures_are_retried(smtp, campaign, monkeypatch, settings):
+    handler, connection_factory = smtp
+    settings.NEWSLETTER_MAX_ATTEMPTS = 3
+    monkeypatch.setattr('common.mailing.RETRY_DELAY', 0)
+    handler.refuse = {'reader1@example.com': 2, 'reader2@example.com': 5}
+
+    totals = run(campaign, connection_factory)
+
+    assert sorted(handler.recipients) == [f'reader{number}@example.com' for number in (0, 1, 3, 4)]
+    assert (totals['sent'], totals['failed'], totals['retryable']) == (4, 1, 0)
+    assert campaign.deliveries.get(email='reader1@example.com').attempts == 3
+    assert campaign.deliveries.get(email='reader2@example.com').state == 'failed'
+    campaign.refresh_from_db()
+    assert campaign.status == 'sent'
+
+
+def test_retryable_deliveries_keep_campaign_sending(smtp, campaign, monkeypatch, settings):
+    handler, connection_factory = smtp
+    settings.NEWSLETTER_MAX_ATTEMPTS = 3
+    monkeypatch.setattr('common.mailing.RETRY_PASSES', 0)
+    handler.refuse = {'reader1@example.com': 1}
+
+    totals = run(campaign, connection_factory)
+
+    assert (totals['sent'], totals['failed'], totals['retryable']) == (4, 0, 1)
+    campaign.refresh_from_db()
+    assert campaign.status == 'sending'
+
+    totals = run(campaign, connection_factory)
+
+    assert (totals['sent'], totals['retryable']) == (1, 0)
+    campaign.refresh_from_db()
+    assert campaign.status == 'sent'
+
+
+def test_sent_campaign_is_refused(smtp, campaign):
+    handler, connection_factory = smtp
+    run(campaign, connection_factory)
+    Newsletter.objects.create(email='late@example.com')
+    handler.recipients.clear()
+
+    with pytest.raises(CampaignError):
+        run(campaign, connection_factory)
+    assert handler.recipients == []
+
+
+@pytest.mark.django_db(transaction=True)
+@pytest.mark.skipif(connection.vendor != 'postgresql', reason="advisory locks need PostgreSQL")
+def test_concurrent_run_is_refused(smtp):
+    handler, connection_factory = smtp
+    Newsletter.objects.create(email='reader@example.com')
+    campaign = Campaign.objects.create(subject='News', body_text='Hello', from_email='news@example.com')
+    locked, release = threading.Event(), threading.Event()
+
+    def other_run():
+        from django.db import connection as thread_connection
+        try:
+            with campaign_lock(campaign):
+                locked.set()
+                release.wait(10)
+        finally:
+            thread_connection.close()
+
+    thread = threading.Thread(target=other_run)
+    thread.start()
+    try:
+        assert locked.wait(10)
+        with pytest.raises(CampaignError):
+            run(campaign, connection_factory)
+    finally:
+        release.set()
+        thread.join()
+    assert handler.recipients == []
+
+    run(campaign, connection_factory)
+    assert handler.recipients == ['reader@example.com']
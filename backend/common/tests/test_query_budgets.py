@@ -0,0 +1,48 @@
+import pytest
+from django.conf import settings
+from django.urls import NoReverseMatch, reverse
+
+from common.instrumentation import QueryBudgetExceeded, assert_max_queries, budgeted_views
+from common.models import Campaign, CampaignDelivery, Client, Lead, Newsletter
+
+# Enough rows of each model for an N+1 pattern to repeat past the threshold
+ROWS = 30
+
+
+@pytest.fixture
+def seeded(db) -> Lead:
+    leads = Lead.objects.bulk_create(
+        Lead(full_name=f'Budget Lead {i}', position='CTO', company_name=f'Company {i}',
+             email=f'budget-{i}@example.com', source='website')
+        for i in range(ROWS)
+    )
+    Client.objects.bulk_create(Client(client_info=lead, team_id=f'team-{i}') for i, lead in enumerate(leads))
+    subscribers = Newsletter.objects.bulk_create(Newsletter(email=f'budget-{i}@example.com') for i in range(ROWS))
+    campaign = Campaign.objects.create(subject='Query budget', body_text='-')
+    CampaignDelivery.objects.bulk_create(
+        CampaignDelivery(campaign=campaign, subscriber=subscriber, email=subscriber.email)
+        for subscriber in subscribers
+    )
+    return leads[0]
+
+
+def url_for(name: str, lead: Lead) -> str:
+    try:
+        return reverse(name)
+    except NoReverseMatch:
+        return reverse(name, kwargs={'pk': lead.pk})
+
+
+@pytest.mark.parametrize('name, budget', budgeted_views())
+def test_view_within_query_budget(name, budget, seeded, api_client, admin_client):
+    client = admin_client if name.startswith('admin:') else api_client
+    with assert_max_queries(budget, settings.QUERY_N_PLUS_ONE_THRESHOLD):
+        response = client.get(url_for(name, seeded), secure=True)
+    assert response.status_code == 200
+
+
+def test_budget_overrun_fails(db):
+    with pytest.raises(QueryBudgetExceeded):
+        with assert_max_queries(1):
+            list(Lead.objects.all())
+            list(Newsletter.objects.all())
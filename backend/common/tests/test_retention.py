@@ -0,0 +1,93 @@
+import threading
+from datetime import timedelta
+
+import pytest
+from django.db import connection, transaction
+from django.utils import timezone
+
+from common.models import Client, Lead, LeadStatusEvent, Newsletter
+from common.retention import RetentionPurge, policies
+
+from .conftest import make_lead
+
+
+@pytest.fixture
+def retention(settings):
+    settings.RETENTION_LEAD_DAYS = 30
+    settings.RETENTION_NEWSLETTER_DAYS = 30
+    settings.RETENTION_BATCH_PAUSE = 0
+    settings.RETENTION_MAX_REPLICATION_LAG = 0
+    return policies()
+
+
+def make_old_lead(**fields) -> Lead:
+    lead = make_lead(status='closed', **fields)
+    Lead.objects.filter(pk=lead.pk).update(updated_at=timezone.now() - timedelta(days=60))
+    return lead
+
+
+@pytest.mark.django_db
+def test_leads_with_clients_are_kept(retention):
+    converted = make_old_lead()
+    client = Client.objects.create(client_info=converted, team_id='acme')
+    purged = make_old_lead()
+
+    checkpoint = RetentionPurge(retention['lead']).run()
+
+    assert checkpoint.deleted == 1
+    assert not Lead.objects.filter(pk=purged.pk).exists()
+    assert not LeadStatusEvent.objects.filter(lead_id=purged.pk).exists()
+    assert Lead.objects.filter(pk=converted.pk).exists()
+    assert Client.objects.filter(pk=client.pk).exists()
+
+
+@pytest.mark.django_db
+def test_queryset_unsubscribe_starts_retention_clock(retention):
+    Newsletter.objects.create(email='gone@example.com')
+    Newsletter.objects.create(email='stays@example.com')
+
+    Newsletter.objects.filter(email='gone@example.com').update(is_subscribed=False)
+    gone = Newsletter.objects.get(email='gone@example.com')
+    assert gone.unsubscribed_at is not None
+    Newsletter.objects.filter(pk=gone.pk).update(unsubscribed_at=timezone.now() - timedelta(days=60))
+
+    assert RetentionPurge(retention['newsletter']).run().deleted == 1
+    assert list(Newsletter.objects.values_list('email', flat=True)) == ['stays@example.com']
+
+    Newsletter.objects.update(is_subscribed=False)
+    Newsletter.objects.update(is_subscribed=True)
+    assert Newsletter.objects.get().unsubscribed_at is None
+
+
+@pytest.mark.django_db(transaction=True)
+@pytest.mark.skipif(connection.vendor != 'postgresql', reason="SKIP LOCKED needs PostgreSQL")
+def test_locked_rows_are_retried(retention, monkeypatch):
+    monkeypatch.setattr('common.retention.RETRY_DELAY', 0.5)
+    leads = [make_old_lead() for _ in range(3)]
+    locked, release = threading.Event(), threading.Event()
+
+    def hold_lock():
+        from django.db import connection as thread_connection
+        try:
+            with transaction.atomic():
+                list(Lead.objects.select_for_update().filter(pk=leads[1].pk))
+                locked.set()
+                release.wait(10)
+        finally:
+            thread_connection.close()
+
+    def progress(message):
+        if 'pass 2' in message:
+            release.set()
+
+    thread = threading.Thread(target=hold_lock)
+    thread.start()
+    assert locked.wait(10)
+    try:
+        checkpoint = RetentionPurge(retention['lead'], batch_size=10, progress=progress).run()
+    finally:
+        release.set()
+        thread.join()
+
+    assert checkpoint.deleted == 3
+    assert not Lead.objects.exists()
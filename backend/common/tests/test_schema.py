@@ -0,0 +1,42 @@
+import pytest
+from django.test import RequestFactory
+
+from common.schema import StaticSchemaView, etag_matches, write_schema
+
+
+@pytest.fixture
+def get(settings, tmp_path, api_key):
+    write_schema({'json': b'{"openapi": "3.0.3"}', 'yaml': b'openapi: 3.0.3\n'}, tmp_path)
+    settings.API_SCHEMA_ROOT = str(tmp_path)
+
+    def get(**headers):
+        request = RequestFactory().get(
+            '/backend/api/schema/', {'format': 'json'}, HTTP_AUTHORIZATION=f'Basic {api_key}', **headers,
+        )
+        return StaticSchemaView.as_view()(request)
+    return get
+
+
+@pytest.mark.parametrize('header, matches', [
+    ('"abc"', True),
+    ('W/"abc"', True),
+    ('"x", "abc"', True),
+    ('*', True),
+    ('"abc-gz"', False),
+    ('"ab"', False),
+    ('abc', False),
+    ('', False),
+])
+def test_etag_matches(header, matches):
+    assert etag_matches(header, '"abc"') is matches
+
+
+def test_not_modified_only_for_the_served_encoding(get):
+    plain = get()
+    gzipped = get(HTTP_ACCEPT_ENCODING='gzip')
+    assert plain.status_code == gzipped.status_code == 200
+    assert get(HTTP_IF_NONE_MATCH=plain['ETag']).status_code == 304
+    assert get(HTTP_IF_NONE_MATCH=gzipped['ETag'], HTTP_ACCEPT_ENCODING='gzip').status_code == 304
+    # The gzip ETag must not validate the identity representation, nor the reverse
+    assert get(HTTP_IF_NONE_MATCH=gzipped['ETag']).status_code == 200
+    assert get(HTTP_IF_NONE_MATCH=plain['ETag'], HTTP_ACCEPT_ENCODING='gzip').status_code == 200
@@ -0,0 +1,92 @@
+from datetime import timedelta
+
+import numpy as np
+import pytest
+from django.core.cache import cache
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from common.models import Lead
+from common.scoring import CHUNK_COLUMNS, rescore_leads, score_chunk, score_lead, write_scores
+
+from .conftest import make_lead
+
+
+@pytest.fixture(autouse=True)
+def clear_cache():
+    cache.clear()
+    yield
+    cache.clear()
+
+
+def columns_of(leads):
+    rows = [(
+        lead.id, lead.score, lead.source, lead.category, lead.status,
+        bool(lead.company_name), bool(lead.email), bool(lead.phone_number), lead.created_at,
+    ) for lead in leads]
+    return dict(zip(CHUNK_COLUMNS, zip(*rows)))
+
+
+def test_chunk_matches_single_lead_scoring():
+    now = timezone.now()
+    leads = [
+        Lead(source='referral', category='sales_auto', status='interested', company_name='Acme',
+             email='a@example.com', phone_number='+385911234567', created_at=now),
+        Lead(source='other', category=None, status='closed', company_name='', email='',
+             phone_number='', created_at=now - timedelta(days=400)),
+        Lead(source='website', category='web_dev', status='new', company_name='Acme',
+             email='b@example.com', phone_number='', created_at=now - timedelta(days=45)),
+        Lead(source='unknown', category='unknown', status='contacted', company_name='x',
+             email='c@example.com', phone_number='', created_at=now + timedelta(days=1)),
+    ]
+
+    scores = score_chunk(columns_of(leads), now)
+
+    assert scores.dtype == np.int16
+    assert scores.tolist() == [score_lead(lead, now) for lead in leads]
+    assert scores[0] == 100 and scores[1] == 0
+
+
+@pytest.mark.django_db
+def test_write_scores_one_update_per_distinct_score():
+    leads = [make_lead() for _ in range(6)]
+    ids = np.array([lead.id for lead in leads], np.int64)
+    scores = np.array([40, 7, 40, 7, 99, 40], np.int16)
+
+    with CaptureQueriesContext(connection) as queries:
+        write_scores(Lead, ids, scores)
+
+    assert sum(query['sql'].startswith('UPDATE') for query in queries) == 3
+    assert dict(Lead.objects.values_list('id', 'score')) == dict(zip(ids.tolist(), scores.tolist()))
+
+
+@pytest.mark.django_db
+def test_rescore_writes_only_changed_scores():
+    leads = [make_lead(), make_lead(phone_number='+385911234567'), make_lead()]
+    Lead.objects.filter(pk=leads[0].pk).update(created_at=timezone.now() - timedelta(days=90))
+    updated_at = dict(Lead.objects.values_list('id', 'updated_at'))
+    later = timezone.now() + timedelta(days=60)
+
+    assert rescore_leads(Lead.objects.all(), chunk_size=2, now=later, dry_run=True) == (3, 3)
+    assert dict(Lead.objects.values_list('id', 'updated_at')) == updated_at
+    assert rescore_leads(Lead.objects.all(), chunk_size=2, now=later) == (3, 3)
+    assert rescore_leads(Lead.objects.all(), chunk_size=2, now=later) == (3, 0)
+
+    for lead in Lead.objects.all():
+        assert lead.score == score_lead(lead, later)
+    assert dict(Lead.objects.values_list('id', 'updated_at')) == updated_at
+
+
+@pytest.mark.django_db
+def test_score_ordering_breaks_ties_by_id(api_client):
+    leads = [make_lead() for _ in range(4)]
+    Lead.objects.update(score=50)
+    Lead.objects.filter(pk=leads[2].pk).update(score=80)
+
+    def ids(ordering):
+        response = api_client.get('/backend/api/v1/leads/', {'ordering': ordering}, secure=True)
+        return [lead['id'] for lead in response.json()['results']]
+
+    assert ids('-score') == [leads[2].pk, leads[3].pk, leads[1].pk, leads[0].pk]
+    assert ids('score') == [leads[0].pk, leads[1].pk, leads[3].pk, leads[2].pk]
@@ -0,0 +1,64 @@
+import pytest
+from django.core.cache import cache
+
+from common import instrumentation
+from common.instrumentation import SlowQueryLog
+
+URL = '/backend/api/v1/slow-queries/'
+
+
+@pytest.fixture
+def slow_log(settings, monkeypatch):
+    settings.SLOW_QUERY_MS = 0.0001
+    settings.SLOW_QUERY_EXPLAIN = True
+    settings.QUERY_INSTRUMENTATION_SAMPLE_RATE = 0
+    settings.QUERY_BUDGET_RAISE = False
+    log = SlowQueryLog()
+    monkeypatch.setattr(instrumentation, 'slow_query_log', log)
+    cache.clear()
+    yield log
+    cache.clear()
+
+
+def test_least_recently_seen_fingerprint_is_evicted(settings):
+    settings.SLOW_QUERY_MAX_FINGERPRINTS = 2
+    log = SlowQueryLog()
+
+    assert log.record('a', 'SELECT a', 0.5, 1, 'GET x')
+    assert log.record('b', 'SELECT b', 0.5, 1, 'GET x')
+    assert not log.record('a', 'SELECT a', 0.7, 1, 'GET y')
+    assert log.record('c', 'SELECT c', 0.5, 1, 'GET x')
+
+    assert list(log.entries) == ['a', 'c']
+    assert log.entries['a'].count == 2
+    assert log.entries['a'].views == {'GET x': 1, 'GET y': 1}
+
+
+def test_new_read_fingerprints_are_explained_once(slow_log, api_client, monkeypatch):
+    explained = []
+    explain = instrumentation.explain
+
+    def counting_explain(alias, sql, params):
+        explained.append(sql)
+        return explain(alias, sql, params)
+
+    monkeypatch.setattr(instrumentation, 'explain', counting_explain)
+
+    api_client.get('/backend/api/v1/leads/', secure=True)
+    first = len(explained)
+    api_client.get('/backend/api/v1/leads/', secure=True)
+
+    assert first and len(explained) == first
+    assert all(sql.lstrip().upper().startswith(('SELECT', 'WITH')) for sql in explained)
+    leads = [stats for stats in slow_log.entries.values() if 'FROM "common_lead"' in stats.sql]
+    assert leads and all(stats.count == 2 and stats.explain for stats in leads)
+
+
+def test_report_needs_staff_session(slow_log, api_client, admin_client):
+    assert api_client.get(URL, secure=True).status_code in (401, 403)
+
+    response = admin_client.get(URL, {'order': 'count'}, secure=True)
+
+    assert response.status_code == 200
+    assert response.json()['order'] == 'count'
+    assert admin_client.get(URL, {'order': 'rows'}, secure=True).status_code == 400
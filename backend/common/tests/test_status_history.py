@@ -0,0 +1,62 @@
+from django.db.models import Value
+
+from common import models
+from common.models import Lead, LeadStatusEvent
+
+
+def make_leads(count: int):
+    return Lead.objects.bulk_create(
+        Lead(full_name=f'Lead {i}', position='CTO', email=f'history-{i}@example.com') for i in range(count)
+    )
+
+
+def test_expression_updates_record_events_in_batches(db, monkeypatch):
+    monkeypatch.setattr(models, 'UPDATE_BATCH_SIZE', 7)
+    leads = make_leads(20)
+    for lead in leads[::2]:
+        lead.status = 'contacted'
+    Lead.objects.bulk_update(leads, ['status'])
+
+    events = LeadStatusEvent.objects.exclude(from_status=None)
+    assert sorted(events.values_list('lead_id', flat=True)) == [lead.id for lead in leads[::2]]
+    assert set(events.values_list('from_status', 'to_status')) == {('new', 'contacted')}
+
+    # Leads that stop matching the filter halfway are not skipped by the id batches
+    assert Lead.objects.filter(status='new').update(status=Value('closed')) == 10
+    assert events.filter(to_status='closed').count() == 10
+
+
+def test_literal_status_update_records_every_lead(db, monkeypatch):
+    monkeypatch.setattr(models, 'UPDATE_BATCH_SIZE', 7)
+    make_leads(30)
+    assert Lead.objects.all().update(status='closed') == 30
+    assert LeadStatusEvent.objects.filter(from_status='new', to_status='closed').count() == 30
+    assert set(Lead.objects.values_list('status', flat=True)) == {'closed'}
+
+
+def test_status_events_page_through_shared_timestamps(db, api_client, monkeypatch):
+    monkeypatch.setattr(models, 'UPDATE_BATCH_SIZE', 500)
+    make_leads(1200)
+    # One bulk update stamps all its events with the same `at`, more of them than offset_cutoff
+    Lead.objects.all().update(status='contacted')
+    expected = set(LeadStatusEvent.objects.values_list('id', flat=True))
+
+    pages, url = [], '/backend/api/v1/leads/status-events/'
+    while url:
+        response = api_client.get(url, secure=True)
+        assert response.status_code == 200 and len(pages) < 30
+        pages.append([event['id'] for event in response.json()['results']])
+        previous, url = response.json()['previous'], response.json()['next']
+
+    seen = [event_id for page in pages for event_id in page]
+    assert len(seen) == len(set(seen)) == len(expected) == 2400
+    assert set(seen) == expected
+    back = api_client.get(previous, secure=True).json()['results']
+    assert [event['id'] for event in back] == pages[-2]
+
+
+def test_timeline_of_missing_lead_is_404(db, api_client):
+    lead = make_leads(1)[0]
+
+    assert api_client.get(f'/backend/api/v1/leads/{lead.pk}/timeline/', secure=True).status_code == 200
+    assert api_client.get(f'/backend/api/v1/leads/{lead.pk + 1000}/timeline/', secure=True).status_code == 404
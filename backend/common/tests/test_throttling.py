@@ -0,0 +1,77 @@
+from types import SimpleNamespace
+
+import pytest
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.core.management import CommandError, call_command
+
+from common.authentication import LEGACY_KEY, KeyInfo
+from common.models import APIKey, validate_rate
+from common.throttling import APIKeyQuotaThrottle, APIKeyRateThrottle
+
+
+@pytest.fixture(autouse=True)
+def clear_cache():
+    cache.clear()
+    yield
+    cache.clear()
+
+
+def allowed(throttle_class, auth, times: int) -> int:
+    request = SimpleNamespace(auth=auth, META={})
+    return sum(throttle_class().allow_request(request, None) for _ in range(times))
+
+
+def test_legacy_key_unthrottled_by_default(settings):
+    settings.API_KEY_DEFAULT_RATE = '2/minute'
+    settings.API_KEY_DEFAULT_DAILY_QUOTA = 2
+    settings.API_KEY_LEGACY_RATE = ''
+
+    assert allowed(APIKeyRateThrottle, LEGACY_KEY, 5) == 5
+    assert allowed(APIKeyQuotaThrottle, LEGACY_KEY, 5) == 5
+
+
+def test_legacy_key_rate(settings):
+    settings.API_KEY_DEFAULT_RATE = '100/minute'
+    settings.API_KEY_LEGACY_RATE = '3/minute'
+
+    assert allowed(APIKeyRateThrottle, LEGACY_KEY, 5) == 3
+
+
+def test_issued_key_uses_default_rate(settings):
+    settings.API_KEY_DEFAULT_RATE = '2/minute'
+    key = KeyInfo(id=1, name='crm', rate=None, daily_quota=None)
+
+    assert allowed(APIKeyRateThrottle, key, 5) == 2
+
+
+@pytest.mark.parametrize('rate', ['100 per minute', '100/', '100/week', 'ten/minute', '100'])
+def test_invalid_key_rate_is_rejected(rate):
+    with pytest.raises(ValidationError):
+        validate_rate(rate)
+
+
+def test_key_rates_drf_accepts():
+    for rate in ('100/minute', '5/s', '1000/day', '20/hour'):
+        validate_rate(rate)
+
+
+@pytest.mark.django_db
+def test_admin_refuses_invalid_rate(admin_client):
+    api_key, _ = APIKey.generate('crm')
+
+    response = admin_client.post(f'/backend/admin/common/apikey/{api_key.pk}/change/', {
+        'name': 'crm', 'rate': '100 per minute', 'daily_quota': '',
+    }, secure=True)
+
+    assert response.status_code == 200
+    assert 'rate' in response.context['adminform'].form.errors
+    api_key.refresh_from_db()
+    assert api_key.rate is None
+
+
+@pytest.mark.django_db
+def test_create_command_refuses_invalid_rate():
+    with pytest.raises(CommandError, match='--rate'):
+        call_command('api_keys', 'create', 'crm', '--rate', '100 per minute')
+    assert not APIKey.objects.exists()
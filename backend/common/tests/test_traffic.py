@@ -0,0 +1,86 @@
+import math
+import random
+
+import pytest
+
+from common.traffic import EndpointNamer, LatencyHistogram, TrafficReport, compare, parse_entries
+
+GUNICORN_LINE = (
+    '10.0.0.7 - - [19/Oct/2026:10:15:02 +0000] "GET /backend/api/v1/leads/?status=new HTTP/1.1" 200 512 '
+    '"-" "curl/8.5" 23456\n'
+)
+NGINX_LINE = (
+    '203.0.113.9 - - [19/Oct/2026:10:15:03 +0000] "POST /backend/api/v1/newsletter/ HTTP/1.1" 201 64 '
+    '"https://www.exit3.online/" "Mozilla/5.0" "-" rt=0.120 uct="0.001" uht="0.118" urt="0.118"\n'
+)
+
+
+def test_parse_gunicorn_and_nginx_lines():
+    report = TrafficReport()
+
+    gunicorn, nginx = parse_entries(iter([GUNICORN_LINE, 'not a log line\n', NGINX_LINE]), report)
+
+    assert (gunicorn.method, gunicorn.target, gunicorn.status) == ('GET', '/backend/api/v1/leads/?status=new', 200)
+    assert gunicorn.ms == pytest.approx(23.456)
+    assert (nginx.method, nginx.status) == ('POST', 201)
+    assert nginx.ms == pytest.approx(120.0)
+    assert nginx.at - gunicorn.at == 1
+    assert report.skipped == 1
+
+
+def test_line_without_duration_is_kept_untimed():
+    entry, = parse_entries(iter([GUNICORN_LINE.replace(' 23456', '')]))
+
+    assert entry.ms is None
+
+
+def test_percentiles_within_bucket_error():
+    rng = random.Random(1)
+    values = sorted(rng.lognormvariate(3, 1) for _ in range(20000))
+    histogram = LatencyHistogram()
+    for value in values:
+        histogram.add(value)
+
+    for fraction in (0.5, 0.95, 0.99):
+        exact = values[math.ceil(fraction * len(values)) - 1]
+        # Reported as the bucket's upper bound: never below, at most 2% above
+        assert exact <= histogram.percentile(fraction) <= exact * 1.02
+    assert histogram.percentile(1.0) == histogram.max == values[-1]
+
+
+def test_untimed_requests_count_but_have_no_percentile():
+    histogram = LatencyHistogram()
+    histogram.add(None, error=True)
+
+    assert (histogram.count, histogram.errors, histogram.timed) == (1, 1, 0)
+    assert histogram.percentile(0.5) is None
+
+
+def test_endpoint_namer_collapses_ids():
+    namer = EndpointNamer(size=2)
+
+    assert namer('GET', '/backend/api/v1/leads/12/timeline/') == 'GET v1-lead-timeline'
+    assert namer('GET', '/backend/api/v1/leads/34/timeline/?x=1') == 'GET v1-lead-timeline'
+    assert list(namer.cache) == ['/backend/api/v1/leads/{id}/timeline/']
+    assert namer('GET', '/nowhere/5f0c6a1e9b1d4c3a8e7f6a5b/') == 'GET /nowhere/{id}/'
+    namer('GET', '/backend/health/')
+    assert len(namer.cache) == 2
+
+
+def report_with(p95_ms: float, requests: int = 100) -> TrafficReport:
+    report = TrafficReport()
+    for index in range(requests):
+        report.add(1000.0 + index, 'GET v1-leads-list-create', p95_ms if index >= 90 else 10.0, 200)
+    return report
+
+
+def test_compare_flags_p95_regressions():
+    baseline = report_with(100.0)
+
+    row, = compare(baseline, report_with(150.0), min_count=50, threshold=20)
+    assert row['regressed'] and row['p95_change'] == pytest.approx(50, abs=3)
+
+    row, = compare(baseline, report_with(110.0), min_count=50, threshold=20)
+    assert not row['regressed']
+
+    assert compare(baseline, report_with(150.0, requests=20), min_count=50, threshold=20) == []
@@ -0,0 +1,111 @@
+import gzip
+import os
+
+import pytest
+from django.core.cache import cache
+
+from common import validation
+from common.models import Lead
+from common.validation import DomainBlocklist, choice_values
+
+
+@pytest.fixture(autouse=True)
+def clear_cache():
+    cache.clear()
+    yield
+    cache.clear()
+
+
+def write(path, text: str, mtime: float) -> None:
+    path.write_text(text)
+    os.utime(path, (mtime, mtime))
+
+
+def test_parent_domains_are_blocked():
+    blocklist = DomainBlocklist(builtin={'mailinator.com'})
+
+    assert blocklist.blocks_email('someone@mailinator.com')
+    assert blocklist.blocks_email('someone@EU.Mailinator.com.')
+    assert not blocklist.blocks_email('someone@notmailinator.com')
+    assert not blocklist.blocks_email('someone@mailinator.com.example.org')
+    assert not blocklist.blocks_email('not-an-email')
+
+
+def test_file_is_reloaded_when_it_changes(tmp_path):
+    path = tmp_path / 'domains.txt'
+    write(path, 'burner.io  # from the feed\n\n', 1000)
+    blocklist = DomainBlocklist(str(path), builtin=(), interval=0)
+
+    assert 'x.burner.io' in blocklist
+    write(path, 'other.io\n', 2000)
+
+    assert 'burner.io' not in blocklist
+    assert 'other.io' in blocklist
+
+
+def test_gzipped_file(tmp_path):
+    path = tmp_path / 'domains.txt.gz'
+    with gzip.open(path, 'wt') as file:
+        file.write('burner.io\n')
+
+    assert 'burner.io' in DomainBlocklist(str(path), builtin=())
+
+
+def test_missing_file_keeps_loaded_domains(tmp_path):
+    path = tmp_path / 'domains.txt'
+    write(path, 'burner.io\n', 1000)
+    blocklist = DomainBlocklist(str(path), builtin={'mailinator.com'}, interval=0)
+    path.unlink()
+
+    assert not blocklist.reload()
+    assert 'burner.io' in blocklist and 'mailinator.com' in blocklist
+
+
+def test_file_changed_mid_read_keeps_loaded_domains(tmp_path, monkeypatch):
+    path = tmp_path / 'domains.txt'
+    write(path, 'burner.io\n', 1000)
+    blocklist = DomainBlocklist(str(path), builtin=(), interval=0)
+    write(path, 'half-written.io\n', 2000)
+    read_domains = validation.read_domains
+
+    def read_while_written(file_path):
+        yield from read_domains(file_path)
+        os.utime(file_path, (3000, 3000))
+
+    monkeypatch.setattr(validation, 'read_domains', read_while_written)
+    assert not blocklist.reload()
+    assert 'burner.io' in blocklist.domains and 'half-written.io' not in blocklist.domains
+
+    monkeypatch.undo()
+    assert blocklist.reload()
+    assert 'half-written.io' in blocklist
+
+
+def test_choice_values():
+    statuses = choice_values(Lead, 'status')
+
+    assert isinstance(statuses, frozenset)
+    assert {'new', 'contacted', 'converted'} <= statuses
+    assert choice_values(Lead, 'status') is statuses
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('email, status', [
+    ('reader@eu.mailinator.com', 400),
+    ('reader@notmailinator.com', 201),
+])
+def test_signup_rejects_disposable_subdomains(api_client, email, status):
+    response = api_client.post('/backend/api/v1/newsletter/', {'email': email}, content_type='application/json',
+                               secure=True)
+
+    assert response.status_code == status
+
+
+@pytest.mark.django_db
+def test_lead_form_rejects_disposable_subdomains(api_client):
+    lead = {'full_name': 'Ana Horvat', 'position': 'CTO', 'company_name': 'Acme', 'email': 'ana@eu.mailinator.com'}
+
+    response = api_client.post('/backend/api/v1/leads/', lead, content_type='application/json', secure=True)
+
+    assert response.status_code == 400
+    assert 'email' in response.json()
@@ -0,0 +1,83 @@
+"""
+Per-API-key throttles.
+
+Both key their counters on the authenticated KeyInfo, so one busy client
+only uses up its own allowance. Rates and quotas come from the key itself,
+falling back to API_KEY_DEFAULT_RATE / API_KEY_DEFAULT_DAILY_QUOTA.
+
+The legacy BASIC_API_KEY is shared by every caller relaying through it, so it
+is not throttled unless API_KEY_LEGACY_RATE is set, and has no daily quota.
+"""
+
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+
+from django.conf import settings
+from rest_framework.throttling import BaseThrottle, SimpleRateThrottle
+
+from .authentication import LEGACY_KEY, KeyInfo
+
+
+def _key_id(request) -> Optional[str]:
+    info = getattr(request, 'auth', None)
+    if not isinstance(info, KeyInfo):
+        return None
+    return str(info.id) if info.id is not None else info.name
+
+
+class APIKeyRateThrottle(SimpleRateThrottle):
+    """Sliding-window request rate per key, e.g. ``100/minute``"""
+    scope = 'api_key'
+
+    def __init__(self) -> None:
+        # The rate depends on the request, it is resolved in allow_request()
+        pass
+
+    def get_cache_key(self, request, view) -> Optional[str]:
+        key_id = _key_id(request)
+        return None if key_id is None else self.cache_format % {'scope': self.scope, 'ident': key_id}
+
+    def allow_request(self, request, view) -> bool:
+        info = getattr(request, 'auth', None)
+        if info == LEGACY_KEY:
+            self.rate = settings.API_KEY_LEGACY_RATE
+            if not self.rate:
+                return True
+        else:
+            self.rate = (info.rate if isinstance(info, KeyInfo) else None) or settings.API_KEY_DEFAULT_RATE
+        self.num_requests, self.duration = self.parse_rate(self.rate)
+        return super().allow_request(request, view)
+
+
+class APIKeyQuotaThrottle(BaseThrottle):
+    """Fixed quota of requests per key and UTC day; a counter per day in the cache"""
+    cache = SimpleRateThrottle.cache
+
+    def allow_request(self, request, view) -> bool:
+        self.wait_seconds: Optional[float] = None
+        info = getattr(request, 'auth', None)
+        key_id = _key_id(request)
+        if key_id is None or info == LEGACY_KEY:
+            return True
+        quota = info.daily_quota if info.daily_quota is not None else settings.API_KEY_DEFAULT_DAILY_QUOTA
+        if not quota:
+            return True
+
+        now = datetime.now(timezone.utc)
+        tomorrow = datetime.combine(now.date() + timedelta(days=1), datetime.min.time(), timezone.utc)
+        cache_key = f'throttle_api_key_quota_{key_id}_{now:%Y%m%d}'
+        # add() + incr() is atomic on shared caches, unlike get() + set()
+        self.cache.add(cache_key, 0, timeout=int((tomorrow - now).total_seconds()) + 60)
+        try:
+            used = self.cache.incr(cache_key)
+        except ValueError:
+            # Expired between add() and incr()
+            self.cache.set(cache_key, 1, timeout=int((tomorrow - now).total_seconds()) + 60)
+            used = 1
+        if used > quota:
+            self.wait_seconds = (tomorrow - now).total_seconds()
+            return False
+        return True
+
+    def wait(self) -> Optional[float]:
+        return self.wait_seconds
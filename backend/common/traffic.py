@@ -0,0 +1,392 @@
+"""
+Access-log latency reports and traffic replay.
+
+``read_logs`` streams Gunicorn (``%(D)s`` microseconds, see gunicorn.conf.py)
+and nginx (``rt=$request_time``, see nginx.conf) access logs line by line,
+plain or gzipped, oldest rotated file first. ``TrafficReport`` keeps
+log-bucketed latency histograms (about 2% relative error) per endpoint and
+per time window, so memory depends on the number of endpoints and windows,
+never on the number of lines. Endpoints are Django URL names where a path
+resolves, e.g. ``GET v1-leads-detail``.
+
+``replay`` sends the GET/HEAD requests of a log to a running instance with
+the original spacing divided by a speed-up factor, over a small keep-alive
+HTTP/1.1 client on asyncio, and records the responses in a TrafficReport as
+well. ``compare`` lines up two saved reports.
+"""
+
+import asyncio
+import glob
+import gzip
+import json
+import math
+import os
+import re
+import ssl
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+from django.urls import Resolver404, resolve
+
+LINE_RE = re.compile(
+    r'^(?P<remote>\S+) \S+ \S+ \[(?P<time>[^\]]+)\] "(?P<request>[^"]*)" (?P<status>\d{3}) \S+ '
+    r'"[^"]*" "[^"]*"(?P<rest>.*)$'
+)
+NGINX_TIME_RE = re.compile(r'\brt=(?P<seconds>[\d.]+)')
+ID_SEGMENT_RE = re.compile(r'/(?:\d+|[0-9a-f]{8}-[0-9a-f-]{27}|[0-9a-f]{24,})(?=/|$)', re.IGNORECASE)
+PERCENTILES = (0.5, 0.95, 0.99)
+LOG_GROWTH = math.log(1.02)
+
+
+class LatencyHistogram:
+    """Latency counts in buckets 2% apart; percentiles read from the bucket upper bounds."""
+    __slots__ = ('buckets', 'count', 'errors', 'total', 'max')
+
+    def __init__(self) -> None:
+        self.buckets: Dict[int, int] = {}
+        self.count = 0
+        self.errors = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, ms: Optional[float], error: bool = False) -> None:
+        self.count += 1
+        self.errors += error
+        if ms is None:
+            return
+        bucket = max(0, math.ceil(math.log(max(ms, 0.001) * 1000) / LOG_GROWTH))
+        self.buckets[bucket] = self.buckets.get(bucket, 0) + 1
+        self.total += ms
+        self.max = max(self.max, ms)
+
+    @property
+    def timed(self) -> int:
+        return sum(self.buckets.values())
+
+    def percentile(self, fraction: float) -> Optional[float]:
+        timed = self.timed
+        if not timed:
+            return None
+        rank, seen = math.ceil(fraction * timed), 0
+        for bucket in sorted(self.buckets):
+            seen += self.buckets[bucket]
+            if seen >= rank:
+                return min(math.exp(bucket * LOG_GROWTH) / 1000, self.max)
+        return self.max
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'count': self.count, 'errors': self.errors, 'total': round(self.total, 3), 'max': self.max,
+            'buckets': self.buckets,
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> 'LatencyHistogram':
+        histogram = cls()
+        histogram.count, histogram.errors = data['count'], data['errors']
+        histogram.total, histogram.max = data['total'], data['max']
+        histogram.buckets = {int(bucket): count for bucket, count in data['buckets'].items()}
+        return histogram
+
+
+class TrafficReport:
+    """Per-endpoint and per-window latency histograms of one log or replay run."""
+
+    def __init__(self, window: int = 60, max_endpoints: int = 200, source: str = '') -> None:
+        self.window = window
+        self.max_endpoints = max_endpoints
+        self.source = source
+        self.endpoints: Dict[str, LatencyHistogram] = {}
+        self.windows: Dict[int, LatencyHistogram] = {}
+        self.first: Optional[float] = None
+        self.last: Optional[float] = None
+        self.skipped = 0
+
+    def add(self, at: float, endpoint: str, ms: Optional[float], status: int) -> None:
+        self.first = at if self.first is None else min(self.first, at)
+        self.last = at if self.last is None else max(self.last, at)
+        if endpoint not in self.endpoints and len(self.endpoints) >= self.max_endpoints:
+            endpoint = 'other'
+        error = status >= 500
+        self.endpoints.setdefault(endpoint, LatencyHistogram()).add(ms, error)
+        start = int(at // self.window * self.window)
+        self.windows.setdefault(start, LatencyHistogram()).add(ms, error)
+
+    @property
+    def requests(self) -> int:
+        return sum(histogram.count for histogram in self.endpoints.values())
+
+    @property
+    def duration(self) -> float:
+        if self.first is None:
+            return 0.0
+        return max(self.last - self.first, 1.0)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'source': self.source, 'window': self.window, 'first': self.first, 'last': self.last,
+            'skipped': self.skipped,
+            'endpoints': {name: histogram.to_dict() for name, histogram in self.endpoints.items()},
+            'windows': {str(start): histogram.to_dict() for start, histogram in sorted(self.windows.items())},
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> 'TrafficReport':
+        report = cls(window=data['window'], max_endpoints=len(data['endpoints']) + 1, source=data['source'])
+        report.first, report.last, report.skipped = data['first'], data['last'], data['skipped']
+        report.endpoints = {name: LatencyHistogram.from_dict(value) for name, value in data['endpoints'].items()}
+        report.windows = {int(start): LatencyHistogram.from_dict(value) for start, value in data['windows'].items()}
+        return report
+
+    def save(self, path: str) -> None:
+        with open(path, 'w') as file:
+            json.dump(self.to_dict(), file)
+
+    @classmethod
+    def load(cls, path: str) -> 'TrafficReport':
+        with open(path) as file:
+            return cls.from_dict(json.load(file))
+
+
+def log_files(patterns: List[str]) -> List[str]:
+    """Files matching the patterns, oldest first so rotated logs come before the live one."""
+    paths = {path for pattern in patterns for path in (glob.glob(pattern) or [pattern])}
+    return sorted(paths, key=lambda path: (os.path.getmtime(path), path))
+
+
+def read_logs(paths: List[str]) -> Iterator[str]:
+    for path in paths:
+        opener = gzip.open if path.endswith('.gz') else open
+        with opener(path, 'rt', encoding='utf-8', errors='replace') as file:
+            yield from file
+
+
+class EndpointNamer:
+    """Maps a request path to 'METHOD url-name', caching by the path with ids collapsed."""
+
+    def __init__(self, size: int = 10000) -> None:
+        self.cache: OrderedDict = OrderedDict()
+        self.size = size
+
+    def __call__(self, method: str, path: str) -> str:
+        path = urlsplit(path).path
+        key = ID_SEGMENT_RE.sub('/{id}', path)
+        name = self.cache.get(key)
+        if name is None:
+            try:
+                match = resolve(path)
+                name = match.view_name or key
+            except Resolver404:
+                name = '/static/' if '/static/' in key else key
+            self.cache[key] = name
+            if len(self.cache) > self.size:
+                self.cache.popitem(last=False)
+        else:
+            self.cache.move_to_end(key)
+        return f'{method} {name}'
+
+
+class LogEntry:
+    __slots__ = ('at', 'method', 'target', 'status', 'ms')
+
+    def __init__(self, at: float, method: str, target: str, status: int, ms: Optional[float]) -> None:
+        self.at, self.method, self.target, self.status, self.ms = at, method, target, status, ms
+
+
+def parse_entries(lines: Iterator[str], report: Optional[TrafficReport] = None) -> Iterator[LogEntry]:
+    """Parsed requests; lines that are not access-log lines are counted in report.skipped."""
+    times: Dict[str, float] = {}
+    for line in lines:
+        match = LINE_RE.match(line.rstrip('\n'))
+        parts = match.group('request').split(' ') if match else ()
+        if len(parts) != 3:
+            if report is not None:
+                report.skipped += 1
+            continue
+        stamp = match.group('time')
+        at = times.get(stamp)
+        if at is None:
+            if len(times) > 1000:
+                times.clear()
+            at = times[stamp] = datetime.strptime(stamp, '%d/%b/%Y:%H:%M:%S %z').timestamp()
+        rest = match.group('rest')
+        nginx = NGINX_TIME_RE.search(rest)
+        if nginx:
+            ms: Optional[float] = float(nginx.group('seconds')) * 1000
+        elif rest.strip().isdigit():
+            ms = int(rest.strip()) / 1000
+        else:
+            ms = None
+        yield LogEntry(at, parts[0], parts[1], int(match.group('status')), ms)
+
+
+def analyze(paths: List[str], window: int, max_endpoints: int) -> TrafficReport:
+    report = TrafficReport(window, max_endpoints, source=', '.join(paths))
+    namer = EndpointNamer()
+    for entry in parse_entries(read_logs(paths), report):
+        report.add(entry.at, namer(entry.method, entry.target), entry.ms, entry.status)
+    return report
+
+
+def spread(entries: Iterator[LogEntry]) -> Iterator[LogEntry]:
+    """Log times have one-second resolution; spread each second's requests evenly over it."""
+    second: List[LogEntry] = []
+    for entry in entries:
+        if second and entry.at != second[0].at:
+            for index, queued in enumerate(second):
+                queued.at += index / len(second)
+                yield queued
+            second = []
+        second.append(entry)
+    for index, queued in enumerate(second):
+        queued.at += index / len(second)
+        yield queued
+
+
+class HTTPClient:
+    """Minimal keep-alive HTTP/1.1 client on asyncio streams, one connection per concurrent request."""
+
+    def __init__(self, base_url: str, host_header: Optional[str], headers: Dict[str, str], timeout: float) -> None:
+        url = urlsplit(base_url)
+        self.ssl = ssl.create_default_context() if url.scheme == 'https' else None
+        if self.ssl is not None:
+            self.ssl.check_hostname = False
+            self.ssl.verify_mode = ssl.CERT_NONE
+        self.host = url.hostname or '127.0.0.1'
+        self.port = url.port or (443 if self.ssl else 80)
+        self.prefix = url.path.rstrip('/')
+        self.headers = {'Host': host_header or url.netloc, 'User-Agent': 'exit3-replay', **headers}
+        self.timeout = timeout
+        self.idle: List[Tuple[asyncio.StreamReader, asyncio.StreamWriter]] = []
+
+    async def request(self, method: str, target: str, headers: Optional[Dict[str, str]] = None,
+                      body: bytes = b'') -> int:
+        connection = self.idle.pop() if self.idle else None
+        if connection is None:
+            connection = await asyncio.open_connection(self.host, self.port, ssl=self.ssl)
+        reader, writer = connection
+        try:
+            status, reusable = await asyncio.wait_for(
+                self.exchange(reader, writer, method, target, headers or {}, body), self.timeout,
+            )
+        except BaseException:
+            writer.close()
+            raise
+        if reusable:
+            self.idle.append(connection)
+        else:
+            writer.close()
+        return status
+
+    async def exchange(self, reader, writer, method: str, target: str,
+                       headers: Dict[str, str], body: bytes = b'') -> Tuple[int, bool]:
+        if body:
+            headers = {**headers, 'Content-Length': str(len(body))}
+        head = f'{method} {self.prefix}{target} HTTP/1.1\r\n' + ''.join(
+            f'{name}: {value}\r\n' for name, value in {**self.headers, **headers}.items()
+        ) + '\r\n'
+        writer.write(head.encode('latin-1') + body)
+        await writer.drain()
+        status_line = await reader.readline()
+        if not status_line:
+            raise ConnectionError("Connection closed before the response")
+        status = int(status_line.split()[1])
+        headers: Dict[str, str] = {}
+        while True:
+            line = await reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+        reusable = headers.get('connection', '').lower() != 'close'
+        if method == 'HEAD' or status in (204, 304) or 100 <= status < 200:
+            pass
+        elif headers.get('transfer-encoding', '').lower() == 'chunked':
+            while True:
+                size = int((await reader.readline()).split(b';')[0], 16)
+                await reader.readexactly(size + 2)
+                if size == 0:
+                    break
+        elif 'content-length' in headers:
+            await reader.readexactly(int(headers['content-length']))
+        else:
+            await reader.read()
+            reusable = False
+        return status, reusable
+
+    def close(self) -> None:
+        for _, writer in self.idle:
+            writer.close()
+        self.idle = []
+
+
+async def replay(entries: Iterator[LogEntry], client: HTTPClient, speedup: float, concurrency: int,
+                 report: TrafficReport, progress: Callable[[str], None]) -> Dict[str, Any]:
+    """Send entries on their original schedule divided by speedup; returns lag and failure counts."""
+    loop = asyncio.get_running_loop()
+    slots = asyncio.Semaphore(concurrency)
+    pending: set = set()
+    namer = EndpointNamer()
+    stats = {'sent': 0, 'failed': 0, 'max_lag': 0.0, 'late': 0}
+    started, origin, next_progress = loop.time(), None, time.monotonic() + 10
+
+    async def send(entry: LogEntry, endpoint: str) -> None:
+        at = time.time()
+        sent = time.perf_counter()
+        try:
+            status = await client.request(entry.method, entry.target)
+        except (OSError, asyncio.TimeoutError, ValueError, IndexError, asyncio.IncompleteReadError):
+            status = 599
+            stats['failed'] += 1
+        finally:
+            slots.release()
+        report.add(at, endpoint, (time.perf_counter() - sent) * 1000, status)
+
+    for entry in entries:
+        origin = entry.at if origin is None else origin
+        due = started + max(0.0, entry.at - origin) / speedup
+        if due > loop.time():
+            await asyncio.sleep(due - loop.time())
+        await slots.acquire()
+        lag = loop.time() - due
+        if lag > 0.1:
+            stats['late'] += 1
+        stats['max_lag'] = max(stats['max_lag'], lag)
+        task = asyncio.create_task(send(entry, namer(entry.method, entry.target)))
+        pending.add(task)
+        task.add_done_callback(pending.discard)
+        stats['sent'] += 1
+        if time.monotonic() > next_progress:
+            next_progress = time.monotonic() + 10
+            progress(f"  {stats['sent']} sent, {len(pending)} in flight, {stats['failed']} failed")
+    if pending:
+        await asyncio.wait(pending)
+    client.close()
+    stats['elapsed'] = loop.time() - started
+    return stats
+
+
+def compare(baseline: TrafficReport, candidate: TrafficReport, min_count: int,
+            threshold: float) -> List[Dict[str, Any]]:
+    """Per-endpoint percentiles and throughput of two reports, with the p95 change in percent."""
+    rows = []
+    for name in sorted(set(baseline.endpoints) & set(candidate.endpoints)):
+        before, after = baseline.endpoints[name], candidate.endpoints[name]
+        if min(before.timed, after.timed) < min_count:
+            continue
+        row: Dict[str, Any] = {
+            'endpoint': name,
+            'count': (before.count, after.count),
+            'rps': (before.count / baseline.duration, after.count / candidate.duration),
+            'errors': (before.errors, after.errors),
+        }
+        for fraction in PERCENTILES:
+            row[f'p{round(fraction * 100)}'] = (before.percentile(fraction), after.percentile(fraction))
+        p95_before, p95_after = row['p95']
+        row['p95_change'] = (p95_after - p95_before) / p95_before * 100 if p95_before else 0.0
+        row['regressed'] = row['p95_change'] > threshold
+        rows.append(row)
+    return rows
@@ -0,0 +1,131 @@
+"""
+Validation rules shared by the serializers and views, built once per process.
+
+The disposable-email blocklist is a built-in set of domains plus, when
+DISPOSABLE_DOMAINS_FILE is set, one domain per line from that file (plain or
+gzipped, ``#`` starts a comment). A domain is blocked when it or any of its
+parent domains is listed, so ``mailinator.com`` also blocks
+``eu.mailinator.com``. That costs one set lookup per label, whatever the size
+of the list.
+
+Every VALIDATION_RELOAD_INTERVAL seconds at most, a check looks at the file's
+modification time. When it changed, the check builds a new set and swaps it in,
+so running workers pick up a new feed without a restart. Replace the file
+atomically (write elsewhere, then ``mv``).
+
+Choice sets come from the model field choices and are cached as frozensets.
+"""
+
+import gzip
+import logging
+import os
+import threading
+import time
+from functools import lru_cache
+from typing import FrozenSet, Iterable, Iterator, Optional
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+BUILTIN_DISPOSABLE_DOMAINS = frozenset({
+    'tempmail.com', 'throwaway.email', '10minutemail.com',
+    'guerrillamail.com', 'mailinator.com', 'maildrop.cc',
+})
+
+
+def normalize_domain(domain: str) -> str:
+    return domain.strip().lower().rstrip('.')
+
+
+def read_domains(path: str) -> Iterator[str]:
+    opener = gzip.open if path.endswith('.gz') else open
+    with opener(path, 'rt', encoding='utf-8', errors='replace') as file:
+        for line in file:
+            domain = normalize_domain(line.split('#', 1)[0])
+            if domain:
+                yield domain
+
+
+class DomainBlocklist:
+    """Domains (and their subdomains) to refuse, reloaded from ``path`` when it changes."""
+
+    def __init__(self, path: str = '', builtin: Iterable[str] = BUILTIN_DISPOSABLE_DOMAINS,
+                 interval: float = 30.0) -> None:
+        self.path = path
+        self.builtin = frozenset(builtin)
+        self.interval = interval
+        self.domains: FrozenSet[str] = self.builtin
+        self.mtime: Optional[float] = None
+        self.checked = 0.0
+        self.lock = threading.Lock()
+        if path:
+            self.reload()
+
+    def reload(self) -> bool:
+        """Rebuild from the file if it changed since the last load; returns whether it did."""
+        with self.lock:
+            self.checked = time.monotonic()
+            try:
+                mtime = os.stat(self.path).st_mtime
+                if mtime == self.mtime:
+                    return False
+                domains = self.builtin.union(read_domains(self.path))
+                # Written to while we read it: keep what we have, look again next time
+                if os.stat(self.path).st_mtime != mtime:
+                    return False
+            except OSError as error:
+                logger.warning("Cannot load blocklist %s, keeping %d domains: %s", self.path, len(self.domains), error)
+                return False
+            self.domains, self.mtime = domains, mtime
+        logger.info("Loaded %d blocked domains from %s", len(domains), self.path)
+        return True
+
+    def refresh(self) -> None:
+        if self.path and time.monotonic() - self.checked >= self.interval:
+            self.reload()
+
+    def __len__(self) -> int:
+        return len(self.domains)
+
+    def __contains__(self, domain: str) -> bool:
+        self.refresh()
+        domains = self.domains
+        domain = normalize_domain(domain)
+        start = 0
+        while True:
+            if domain[start:] in domains:
+                return True
+            start = domain.find('.', start) + 1
+            if not start:
+                return False
+
+    def blocks_email(self, email: str) -> bool:
+        _, at, domain = email.rpartition('@')
+        return bool(at) and domain in self
+
+
+_disposable_domains: Optional[DomainBlocklist] = None
+_disposable_lock = threading.Lock()
+
+
+def disposable_domains() -> DomainBlocklist:
+    """The process-wide disposable-email blocklist, loaded on first use."""
+    global _disposable_domains
+    if _disposable_domains is None:
+        with _disposable_lock:
+            if _disposable_domains is None:
+                _disposable_domains = DomainBlocklist(
+                    settings.DISPOSABLE_DOMAINS_FILE, interval=settings.VALIDATION_RELOAD_INTERVAL,
+                )
+    return _disposable_domains
+
+
+def is_disposable_email(email: str) -> bool:
+    return disposable_domains().blocks_email(email)
+
+
+@lru_cache(maxsize=None)
+def choice_values(model, field_name: str) -> FrozenSet[str]:
+    """The stored values allowed by a model field's choices."""
+    return frozenset(value for value, _ in model._meta.get_field(field_name).flatchoices)
@@ -1,33 +1,71 @@
 # views.py
-from typing import Any, List, Optional
-from django.db.models import QuerySet
-from rest_framework import generics, filters
+from datetime import datetime, time, timedelta
+from functools import wraps
+from typing import Any, Callable, List, Optional, Tuple
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.http import HttpRequest, HttpResponse, JsonResponse, StreamingHttpResponse
+from django.db import connection
+from django.db.models import Q, QuerySet
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from rest_framework import generics, filters, status
+from rest_framework.exceptions import AuthenticationFailed, NotFound, ValidationError
+from rest_framework.authentication import SessionAuthentication
+from rest_framework.pagination import CursorPagination
+from rest_framework.permissions import IsAdminUser
 from rest_framework.response import Response
 from rest_framework.request import Request
 from rest_framework.throttling import AnonRateThrottle
-from .models import Lead, Newsletter
-from .serializers import LeadSerializer, NewsletterSerializer
+from rest_framework.views import APIView
+from .authentication import BasicAPIKeyAuthentication, StreamTokenAuthentication, sign_stream_token
+from .dedup import save_new_lead
+from .events import Cursor, broker, current_cursor, replay, stream
+from .history import stage_durations
+from .idempotency import IdempotentCreateMixin
+from .instrumentation import REPORT_ORDERS, slow_query_report
+from .models import Lead, LeadStatusEvent, Newsletter
+from .serializers import (
+    LeadBulkUpdateSerializer, LeadConvertSerializer, LeadSerializer, LeadStatusEventSerializer, NewsletterSerializer,
+)
+from .throttling import APIKeyQuotaThrottle, APIKeyRateThrottle
+from .validation import choice_values
 
 
 class LeadCreateThrottle(AnonRateThrottle):
     rate: str = '10/hour'
 
-class LeadListCreateAPIView(generics.ListCreateAPIView):
+class LeadOrderingFilter(filters.OrderingFilter):
+    """Break score ties by id so ``-score`` matches ``lead_score_idx`` and pages are stable"""
+
+    def get_ordering(self, request, queryset, view):
+        ordering = super().get_ordering(request, queryset, view)
+        if ordering and ordering[-1].lstrip('-') == 'score':
+            ordering = [*ordering, '-id' if ordering[-1].startswith('-') else 'id']
+        return ordering
+
+
+class LeadListCreateAPIView(IdempotentCreateMixin, generics.ListCreateAPIView):
     """
     GET  /api/leads/?status=<status>   → list all leads, optionally filtered by status
-    POST /api/leads/                   → create a new Lead
+    GET  /api/leads/?ordering=-score   → highest priority first (indexed)
+    POST /api/leads/                   → create a new Lead (honours Idempotency-Key)
     """
+    idempotency_scope = 'leads'
+    query_budget = {'GET': 5, 'POST': 10}
     serializer_class = LeadSerializer
     queryset = Lead.objects.all()
-    throttle_classes = [LeadCreateThrottle]
+    throttle_classes = [LeadCreateThrottle, APIKeyRateThrottle, APIKeyQuotaThrottle]
+    filter_backends = [LeadOrderingFilter]
+    ordering_fields = ['score', 'created_at']
 
     def get_queryset(self) -> QuerySet[Lead]:
         qs: QuerySet[Lead] = super().get_queryset()
         status_param: Optional[str] = self.request.query_params.get('status')
         if status_param:
             # forward-thinking: validate against allowed choices
-            allowed: List[str] = [choice[0] for choice in Lead._meta.get_field('status').choices]
-            if status_param not in allowed:
+            if status_param not in choice_values(Lead, 'status'):
                 # return empty or raise? here we choose validation error
                 return qs.none()
             qs = qs.filter(status=status_param)
@@ -35,12 +73,146 @@ class LeadListCreateAPIView(generics.ListCreateAPIView):
 
     def create(self, request: Request, *args: Any, **kwargs: Any) -> Response:
         """
-        Override to add any custom business logic in future,
-        e.g. trigger a webhook when status=new → contacted
+        Create a lead after checking it against existing ones (LEAD_DEDUP_MODE).
+        A lead merged into an existing one is returned with 200 instead of 201.
         """
-        return super().create(request, *args, **kwargs)
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        lead, merged = save_new_lead(Lead(**serializer.validated_data))
+        serializer.instance = lead
+        headers = self.get_success_headers(serializer.data)
+        return Response(
+            serializer.data,
+            status=status.HTTP_200_OK if merged else status.HTTP_201_CREATED,
+            headers=headers,
+        )
+
+class LeadBulkUpdateAPIView(APIView):
+    """
+    POST /api/v1/leads/bulk-update/
+        {"ids": [1, 2]} or {"filter": {"status": "new", "category": ...}},
+        {"set": {"status": "contacted"}}, optional "dry_run": true
+        → {"matched": n, "updated": n}; leads already in the target state are not written
+    """
+    throttle_classes = [APIKeyRateThrottle, APIKeyQuotaThrottle]
+
+    def post(self, request: Request, *args: Any, **kwargs: Any) -> Response:
+        serializer = LeadBulkUpdateSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        leads = Lead.objects.filter(**serializer.lookups())
+        changes = serializer.validated_data['set']
+        if serializer.validated_data['dry_run']:
+            return Response({
+                'matched': leads.count(),
+                'updated': leads.exclude(Q(**changes)).count(),
+                'dry_run': True,
+            })
+        matched, updated = leads.update_in_batches(settings.LEAD_BULK_UPDATE_BATCH_SIZE, **changes)
+        return Response({'matched': matched, 'updated': updated, 'dry_run': False})
+
+
+class LeadConvertAPIView(APIView):
+    """
+    POST /api/v1/leads/convert/
+        {"ids": [1, 2]} or {"filter": {...}}, {"team_id": "acme"}, optional "dry_run": true
+        → {"converted": n, "conflicts": {"missing": [...], "locked": [...],
+           "already_client": [...], "duplicate": [...]}}
+        Conflicting leads are reported, the others converted; locked ones can be retried.
+    """
+    throttle_classes = [APIKeyRateThrottle, APIKeyQuotaThrottle]
+
+    def post(self, request: Request, *args: Any, **kwargs: Any) -> Response:
+        serializer = LeadConvertSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        dry_run = serializer.validated_data['dry_run']
+        result = Lead.objects.filter(**serializer.lookups()).convert_to_clients(
+            serializer.validated_data['team_id'], settings.LEAD_BULK_UPDATE_BATCH_SIZE, dry_run=dry_run,
+        )
+        converted = result.pop('converted')
+        if 'ids' in serializer.validated_data:
+            found = set(Lead.objects.filter(id__in=serializer.validated_data['ids']).values_list('id', flat=True))
+            result['missing'] = sorted(set(serializer.validated_data['ids']) - found)
+        limit = settings.LEAD_BULK_UPDATE_MAX_IDS
+        return Response({
+            'converted': len(converted),
+            'conflicts': {reason: ids[:limit] for reason, ids in result.items()},
+            'dry_run': dry_run,
+        })
+
+
+def closing_connection(function: Callable) -> Callable:
+    """
+    Run ``function`` and close its thread's database connection, which would
+    otherwise stay open for as long as the stream it was opened for
+    """
+    @wraps(function)
+    def run(*args: Any, **kwargs: Any) -> Any:
+        try:
+            return function(*args, **kwargs)
+        finally:
+            connection.close()
+    return run
+
 
-class NewsletterSubscriberListCreateView(generics.ListCreateAPIView):
+def authenticate_stream(request: HttpRequest) -> None:
+    """``?token=`` (for EventSource) or the usual Authorization header"""
+    if StreamTokenAuthentication().authenticate(request) is None:
+        BasicAPIKeyAuthentication().authenticate(request)
+
+
+async def lead_event_stream(request: HttpRequest) -> HttpResponse:
+    """
+    GET /api/v1/leads/stream/   → server-sent events, one per lead creation or status change
+        Authenticated by the API key, or by ?token= from /api/v1/leads/stream-token/.
+        Reconnecting with Last-Event-ID (or ?last_event_id=) replays what was missed.
+    """
+    if not isinstance(request, ASGIRequest):
+        # A WSGI worker would try to buffer the endless stream
+        return JsonResponse({'detail': "The event stream is only served by the ASGI application."}, status=501)
+    try:
+        await sync_to_async(closing_connection(authenticate_stream))(request)
+    except AuthenticationFailed as exc:
+        return JsonResponse({'detail': str(exc.detail)}, status=401)
+    if broker.subscribers >= settings.LEAD_STREAM_MAX_CLIENTS:
+        return JsonResponse({'detail': "Too many event stream clients."}, status=503, headers={'Retry-After': '5'})
+
+    raw_cursor = request.headers.get('Last-Event-ID') or request.GET.get('last_event_id')
+    try:
+        cursor = Cursor.parse(raw_cursor) if raw_cursor else None
+    except ValueError:
+        return JsonResponse({'last_event_id': "Must be an event id from this stream."}, status=400)
+
+    # Subscribe before reading the backlog so nothing falls in between
+    subscriber = broker.subscribe()
+    backlog: List[bytes] = []
+    try:
+        if cursor is None:
+            cursor = await sync_to_async(closing_connection(current_cursor))()
+        else:
+            backlog, cursor = await sync_to_async(closing_connection(replay))(cursor, settings.LEAD_STREAM_REPLAY_LIMIT)
+    except Exception:
+        broker.unsubscribe(subscriber)
+        raise
+    response = StreamingHttpResponse(stream(subscriber, backlog, cursor), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+class LeadStreamTokenAPIView(APIView):
+    """
+    POST /api/v1/leads/stream-token/   → {"token": ..., "expires_in": seconds}
+        for new EventSource('/backend/api/v1/leads/stream/?token=...')
+    """
+
+    def post(self, request: Request, *args: Any, **kwargs: Any) -> Response:
+        key = request.headers['Authorization'].replace('Basic ', '')
+        return Response({'token': sign_stream_token(key), 'expires_in': settings.LEAD_STREAM_TOKEN_MAX_AGE})
+
+
+class NewsletterSubscriberListCreateView(IdempotentCreateMixin, generics.ListCreateAPIView):
+    idempotency_scope = 'newsletter'
+    query_budget = {'GET': 4, 'POST': 6}
     queryset = Newsletter.objects.all()
     serializer_class = NewsletterSerializer
     filter_backends = [filters.SearchFilter]
@@ -51,4 +223,158 @@ class NewsletterSubscriberListCreateView(generics.ListCreateAPIView):
         is_subscribed: Optional[str] = self.request.query_params.get('is_subscribed')
         if is_subscribed is not None:
             queryset = queryset.filter(is_subscribed=is_subscribed.lower() in ['true', '1'])
-        return queryset
\ No newline at end of file
+        return queryset
+
+
+def parse_moment(request: Request, name: str, default: datetime) -> datetime:
+    """Read an ISO date or datetime query parameter as an aware datetime"""
+    raw: Optional[str] = request.query_params.get(name)
+    if not raw:
+        return default
+    moment = parse_datetime(raw)
+    if moment is None:
+        day = parse_date(raw)
+        if day is None:
+            raise ValidationError({name: "Expected an ISO 8601 date or datetime"})
+        moment = datetime.combine(day, time.min)
+    if timezone.is_naive(moment):
+        moment = timezone.make_aware(moment)
+    return moment
+
+
+def parse_window(request: Request) -> Tuple[datetime, datetime]:
+    """?since=&until= window, defaulting to the last 7 days"""
+    until = parse_moment(request, 'until', timezone.now())
+    since = parse_moment(request, 'since', until - timedelta(days=7))
+    if since >= until:
+        raise ValidationError({'since': "Must be before until"})
+    return since, until
+
+
+class StatusEventPagination(CursorPagination):
+    """
+    Cursor pagination on (at, id). DRF positions a cursor on the first ordering
+    field only and steps over equal values with an offset capped at
+    ``offset_cutoff``, but bulk updates stamp every event of one update with
+    the same ``at``. Here the position is the whole (at, id) pair, so it is
+    unique and the offset stays 0.
+    """
+    ordering = ('at', 'id')
+    page_size = 100
+
+    def _get_position_from_instance(self, instance, ordering) -> str:
+        return f'{instance.at.isoformat()} {instance.pk}'
+
+    def position_filter(self, position: str, reverse: bool) -> Q:
+        at_raw, _, pk = position.rpartition(' ')
+        at = parse_datetime(at_raw)
+        if at is None or not pk.isdigit():
+            raise NotFound(self.invalid_cursor_message)
+        if reverse:
+            return Q(at__lt=at) | Q(at=at, id__lt=int(pk))
+        return Q(at__gt=at) | Q(at=at, id__gt=int(pk))
+
+    def paginate_queryset(self, queryset, request, view=None):
+        # CursorPagination.paginate_queryset with a two-column position filter
+        self.page_size = self.get_page_size(request)
+        if not self.page_size:
+            return None
+        self.base_url = request.build_absolute_uri()
+        self.ordering = self.get_ordering(request, queryset, view)
+        self.cursor = self.decode_cursor(request)
+        offset, reverse, current_position = self.cursor or (0, False, None)
+
+        ordering = [f[1:] if f.startswith('-') else f'-{f}' for f in self.ordering] if reverse else self.ordering
+        queryset = queryset.order_by(*ordering)
+        if current_position is not None:
+            queryset = queryset.filter(self.position_filter(current_position, reverse))
+
+        results = list(queryset[offset:offset + self.page_size + 1])
+        self.page = results[:self.page_size]
+        has_following = len(results) > len(self.page)
+        following_position = self._get_position_from_instance(results[-1], self.ordering) if has_following else None
+
+        if reverse:
+            self.page.reverse()
+            self.has_next = current_position is not None or offset > 0
+            self.has_previous = has_following
+            self.next_position, self.previous_position = current_position, following_position
+        else:
+            self.has_next = has_following
+            self.has_previous = current_position is not None or offset > 0
+            self.next_position, self.previous_position = following_position, current_position
+        if (self.has_previous or self.has_next) and self.template is not None:
+            self.display_page_controls = True
+        return self.page
+
+
+class LeadTimelineAPIView(generics.ListAPIView):
+    """
+    GET /api/v1/leads/<pk>/timeline/   → status transitions of one lead, oldest first (404 if no such lead)
+    """
+    serializer_class = LeadStatusEventSerializer
+    pagination_class = None
+    query_budget = 4
+
+    def get_queryset(self) -> QuerySet[LeadStatusEvent]:
+        if not Lead.objects.filter(pk=self.kwargs['pk']).exists():
+            raise NotFound("Lead not found.")
+        return LeadStatusEvent.objects.filter(lead_id=self.kwargs['pk']).order_by('at', 'id')
+
+
+class LeadStatusEventListAPIView(generics.ListAPIView):
+    """
+    GET /api/v1/leads/status-events/?since=&until=&to_status=   → transitions in a time window
+    """
+    serializer_class = LeadStatusEventSerializer
+    pagination_class = StatusEventPagination
+    query_budget = 4
+
+    def get_queryset(self) -> QuerySet[LeadStatusEvent]:
+        since, until = parse_window(self.request)
+        qs: QuerySet[LeadStatusEvent] = LeadStatusEvent.objects.filter(at__gte=since, at__lt=until)
+        to_status: Optional[str] = self.request.query_params.get('to_status')
+        if to_status:
+            qs = qs.filter(to_status=to_status)
+        return qs
+
+
+class LeadStageDurationAPIView(APIView):
+    """
+    GET /api/v1/leads/stage-durations/?since=&until=&include_open=true
+        → per status: completed/open stays and avg, p50, p90, max seconds spent in it
+    """
+    query_budget = 4
+
+    def get(self, request: Request, *args: Any, **kwargs: Any) -> Response:
+        since, until = parse_window(request)
+        include_open = request.query_params.get('include_open', '').lower() in ['true', '1']
+        return Response({
+            'since': since,
+            'until': until,
+            'stages': stage_durations(since, until, include_open=include_open),
+        })
+
+
+class SlowQueryReportAPIView(APIView):
+    """
+    GET /api/v1/slow-queries/?order=total|count|p95|max&limit=20
+        → slowest query fingerprints over all workers, with views and EXPLAIN samples (staff only)
+    """
+    authentication_classes = [SessionAuthentication]
+    permission_classes = [IsAdminUser]
+    throttle_classes: List = []
+
+    def get(self, request: Request, *args: Any, **kwargs: Any) -> Response:
+        order = request.query_params.get('order', 'total')
+        if order not in REPORT_ORDERS:
+            raise ValidationError({'order': f"Must be one of {', '.join(REPORT_ORDERS)}."})
+        try:
+            limit = min(max(int(request.query_params.get('limit', 20)), 1), 200)
+        except ValueError:
+            raise ValidationError({'limit': "Must be an integer."})
+        return Response({
+            'threshold_ms': settings.SLOW_QUERY_MS,
+            'order': order,
+            'queries': slow_query_report(order, limit),
+        })
@@ -14,6 +14,16 @@ mkdir -p "$BACKUP_DIR"
 # Change to project root
 cd "$(dirname "$0")/.."
 
+# --crm: parallel, resumable export of the CRM tables only (leads, clients, newsletter, their history and deliveries)
+if [ "$1" == "--crm" ]; then
+    NAME="${2:-crm_$DATE}"
+    echo "📦 Exporting CRM tables to $NAME (re-run with the same name to resume)..."
+    docker-compose exec -T backend python manage.py crm_backup export "backups/$NAME"
+    find "$BACKUP_DIR" -maxdepth 1 -name "crm_*" -type d -mtime +$KEEP_DAYS -exec rm -rf {} +
+    echo "✓ CRM export complete: $NAME"
+    exit 0
+fi
+
 echo "📦 Starting database backup..."
 
 # Backup database
@@ -11,7 +11,7 @@ cd "$(dirname "$0")/.."
 
 # Check if backup file is provided
 if [ -z "$1" ]; then
-    echo "Usage: $0 <backup_file.sql.gz>"
+    echo "Usage: $0 <backup_file.sql.gz | crm_export_dir>"
     echo ""
     echo "Available backups:"
     ls -lh "$BACKUP_DIR"/backup_*.sql.gz 2>/dev/null || echo "  No backups found"
@@ -20,6 +20,24 @@ fi
 
 BACKUP_FILE="$1"
 
+# A directory from backup-db.sh --crm: parallel restore of the CRM tables only
+if [ -f "$BACKUP_DIR/$(basename "$BACKUP_FILE")/manifest.json" ]; then
+    NAME="$(basename "$BACKUP_FILE")"
+    # Fails, before asking, if tables outside the export reference these with rows
+    TABLES="$(docker-compose exec -T backend python manage.py crm_backup restore "backups/$NAME" --plan)"
+    echo "⚠️  WARNING: This will EMPTY and replace these tables:"
+    echo "$TABLES" | sed 's/^/  - /'
+    read -p "Are you sure? (type 'yes' to continue): " CONFIRM
+    if [ "$CONFIRM" != "yes" ]; then
+        echo "Restore cancelled."
+        exit 0
+    fi
+    # Re-running after an interruption resumes with the chunks not loaded yet
+    docker-compose exec -T backend python manage.py crm_backup restore "backups/$NAME" --truncate
+    echo "✓ CRM tables restored from $NAME"
+    exit 0
+fi
+
 # Check if file exists
 if [ ! -f "$BACKUP_FILE" ]; then
     # Try in backup directory